@@ -17,13 +17,19 @@
 # limitations under the License.
 from __future__ import absolute_import, unicode_literals, print_function
 
+import os
 import re
+import sys
+import time
 import logging
+import functools
+import importlib
 
 import click
 from munch import Munch as Bunch
 
 from . import config
+from .commands import COMMAND_MODULES
 
 
 # Default name of the app, and its app directory
@@ -32,7 +38,6 @@ config.APP_NAME = __app_name__
 
 # The `click` custom context settings
 CONTEXT_SETTINGS = dict(
-    obj=Bunch(cfg=None, quiet=False, verbose=False),  # namespace for custom stuff
     help_option_names=['-h', '--help'],
     auto_envvar_prefix=config.APP_NAME.upper().replace('-', '_'),
 )
@@ -63,20 +68,191 @@ def license_option(*param_decls, **attrs):
     return decorator
 
 
+# `--version` option decorator
+def version_option(*param_decls, **attrs):
+    """``--version`` option that prints version information and then exits."""
+    def decorator(func):
+        "decorator inner wrapper"
+        def callback(ctx, _dummy, value):
+            "click option callback"
+            if not value or ctx.resilient_parsing:
+                return
+
+            click.echo(config.version_info(ctx))
+            ctx.exit()
+
+        attrs.setdefault('is_flag', True)
+        attrs.setdefault('expose_value', False)
+        attrs.setdefault('is_eager', True)
+        attrs.setdefault('help', 'Show the version and exit.')
+        attrs['callback'] = callback
+        return click.option(*(param_decls or ('--version',)), **attrs)(func)
+
+    return decorator
+
+
+def _run_failed(exc_info):
+    """Check whether the exception (if any) that ends a run means failure."""
+    exc = exc_info[1]
+    return exc is not None and getattr(exc, 'exit_code', getattr(exc, 'code', 1)) not in (0, None)
+
+
+def metrics_reporter(command=None, show_stats=False, stats_json=None, metrics_file=None, push_gateway=None):
+    """Start collecting metrics afresh, and return a callback that reports them."""
+    from .util import metrics
+
+    metrics.REGISTRY.reset()
+
+    def report():
+        "Helper"
+        metrics.REGISTRY.set('run_success', int(not _run_failed(sys.exc_info())))
+        metrics.REGISTRY.set('run_duration_seconds', time.time() - metrics.REGISTRY.started)
+        metrics.REGISTRY.set('run_finished_timestamp_seconds', time.time())
+
+        if metrics_file:
+            metrics.write_textfile(metrics_file, metrics.format_prometheus(labels=dict(command=command or '')))
+        if push_gateway:
+            try:  # the grouping key adds the command label
+                metrics.push(push_gateway, metrics.format_prometheus(), job=config.APP_NAME,
+                             grouping=dict(command=command) if command else None)
+            except Exception as cause:  # pylint: disable=broad-except
+                logging.getLogger(config.APP_NAME).error('Pushing metrics to %s failed: %s', push_gateway, cause)
+        if stats_json:
+            import json
+
+            with click.open_file(stats_json, 'w') as handle:
+                json.dump(metrics.REGISTRY.snapshot(), handle, indent=2, sort_keys=True)
+                handle.write('\n')
+        if show_stats:
+            click.echo('\n'.join(metrics.format_report()), err=True)
+
+    return report
+
+
+def profile_reporter(profiler='deterministic', profile_out=None, show_top=False):
+    """Start profiling, and return a callback that stops and reports."""
+    from .util import profiling
+
+    active = profiling.PROFILERS[profiler]()
+    active.start()
+
+    def report():
+        "Helper"
+        stats = active.stop()
+        if getattr(active, 'skipped', 0):
+            click.echo('Left {} still running thread(s) out of the profile.'.format(active.skipped), err=True)
+        if profile_out:
+            active.save(stats, profile_out)
+            click.echo('Profile written to "{}".'.format(profile_out), err=True)
+        if show_top:
+            click.echo('\n'.join(profiling.format_hot_functions(active.hot_functions(stats))), err=True)
+
+    return report
+
+
+def trace_reporter(command=None, trace_file=None, otlp_url=None):
+    """Start tracing into a root span for the command, and return a callback that finishes it."""
+    from .util import tracing
+
+    if trace_file:
+        stream = click.get_text_stream('stderr') if trace_file == '-' else click.open_file(trace_file, 'w')
+        tracing.TRACER.exporters.append(tracing.JsonLinesExporter(stream, close=trace_file != '-'))
+    if otlp_url:
+        tracing.TRACER.exporters.append(tracing.OtlpExporter(otlp_url))
+    root = tracing.span('cli.{}'.format(command or config.APP_NAME), argv=' '.join(sys.argv[1:]))
+    root.__enter__()
+
+    def report():
+        "Helper"
+        exc_info = sys.exc_info()
+        root.__exit__(*(exc_info if _run_failed(exc_info) else (None, None, None)))
+        tracing.TRACER.shutdown()
+
+    return report
+
+
+class LazyGroup(click.Group):
+    """ A command group that imports the module of a sub-command only when it is used.
+
+        ``lazy_commands`` maps command names to ``(module, short_help)`` pairs,
+        for modules in the ``commands`` package, which register their command(s)
+        on import. Listing the commands in the help imports none of them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.lazy_commands = kwargs.pop('lazy_commands', {})
+        super(LazyGroup, self).__init__(*args, **kwargs)
+
+    def list_commands(self, ctx):
+        """Return the names of all commands, loaded or not."""
+        return sorted(set(self.commands) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        """Return a command, importing its module on first use."""
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            importlib.import_module('.commands.' + self.lazy_commands[cmd_name][0], __package__ or 'confluencer')
+        return self.commands.get(cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        """List all commands, using the known short help of those not loaded yet."""
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                if not self.commands[name].hidden:
+                    rows.append((name, self.commands[name].get_short_help_str))
+            else:
+                rows.append((name, functools.partial(click.utils.make_default_short_help,
+                                                     self.lazy_commands[name][1])))
+        if rows:
+            limit = formatter.width - 6 - max(len(name) for name, _ in rows)
+            with formatter.section('Commands'):
+                formatter.write_dl([(name, short_help(limit)) for name, short_help in rows])
+
+
 # Main command (root)
-@click.group(context_settings=CONTEXT_SETTINGS)
-@click.version_option(message=config.VERSION_INFO)
+@click.group(cls=LazyGroup, lazy_commands=COMMAND_MODULES, context_settings=CONTEXT_SETTINGS)
+@version_option()
 @license_option()
 @click.option('-q', '--quiet', is_flag=True, default=False, help='Be quiet (show only errors).')
 @click.option('-v', '--verbose', is_flag=True, default=False, help='Create extra verbose output.')
 @click.option('-c', '--config', "config_paths", metavar='FILE',
               multiple=True, type=click.Path(), help='Load given configuration file(s).')
+@click.option('--offline', is_flag=True, default=False,
+              help='Read from the local space mirror, without network access.')
+@click.option('--stats', 'show_stats', is_flag=True, default=False,
+              help='Print a summary of HTTP requests and timings at exit.')
+@click.option('--stats-json', metavar='FILE', type=click.Path(dir_okay=False, allow_dash=True), default=None,
+              help="Write all collected metrics as JSON at exit ('-' for stdout).")
+@click.option('--metrics-file', metavar='FILE', type=click.Path(dir_okay=False), default=None,
+              help="Write metrics in Prometheus text format at exit (for the textfile collector).")
+@click.option('--push-gateway', metavar='URL', default=None,
+              help="Push metrics to this Prometheus Pushgateway at exit.")
+@click.option('--profile', 'profile_top', is_flag=True, default=False,
+              help='Profile the command, and print its hottest functions.')
+@click.option('--profile-out', metavar='FILE', type=click.Path(dir_okay=False), default=None,
+              help="Profile the command, and write a 'pstats' (or speedscope) file.")
+@click.option('--profiler', type=click.Choice(('deterministic', 'sampling')), default='deterministic',
+              help="Use cProfile (pstats output), or stack sampling (speedscope output).")
+@click.option('--trace', 'trace_file', metavar='FILE', type=click.Path(dir_okay=False, allow_dash=True), default=None,
+              help="Write tracing spans as JSON lines ('-' for stderr).")
+@click.option('--trace-otlp', 'otlp_url', metavar='URL', default=None,
+              help="Send tracing spans to an OTLP/HTTP collector, e.g. 'http://localhost:4318/v1/traces'.")
 @click.pass_context
-def cli(ctx, quiet=False, verbose=False, config_paths=None):  # pylint: disable=unused-argument
+def cli(ctx, quiet=False, verbose=False, config_paths=None, offline=False,  # pylint: disable=unused-argument
+        show_stats=False, stats_json=None, metrics_file=None, push_gateway=None,
+        profile_top=False, profile_out=None, profiler='deterministic', trace_file=None, otlp_url=None):
     """'confluencer' command line tool."""
+    ctx.obj = Bunch(cfg=None, quiet=quiet, verbose=verbose)  # namespace for custom stuff, fresh per call
     config.cfg = config.Configuration.from_context(ctx, config_paths)
-    ctx.obj.quiet = quiet
-    ctx.obj.verbose = verbose
+    if offline:
+        os.environ['CONFLUENCE_OFFLINE'] = '1'
+    if show_stats or stats_json or metrics_file or push_gateway:
+        ctx.call_on_close(metrics_reporter(ctx.invoked_subcommand, show_stats, stats_json,
+                                           metrics_file, push_gateway))
+    if profile_top or profile_out:
+        ctx.call_on_close(profile_reporter(profiler, profile_out, show_top=profile_top))
+    if trace_file or otlp_url:
+        ctx.call_on_close(trace_reporter(ctx.invoked_subcommand, trace_file, otlp_url))
 
     log_level = logging.INFO
     if ctx.obj.quiet:
@@ -92,13 +268,17 @@ def cli(ctx, quiet=False, verbose=False, config_paths=None):  # pylint: disable=
 
 
 def run():
-    """Call main command."""
+    """Call main command, in a running daemon if there is one."""
+    from . import daemon
+
+    exit_code = daemon.forward(sys.argv[1:], config.APP_NAME, value_opts=daemon.value_options(cli))
+    if exit_code is not None:
+        sys.exit(exit_code)
     cli.main(prog_name=config.APP_NAME)
 
 
-# Import sub-commands to define them AFTER `cli` is defined
+# Sub-commands are imported on demand, and register themselves with `cli`
 config.cli = cli
-from . import commands as _  # noqa pylint: disable=unused-import, wrong-import-position
 
 if __name__ == "__main__":  # imported via "python -m"?
     __package__ = 'confluencer'  # pylint: disable=redefined-builtin
@@ -23,11 +23,14 @@ import os
 import re
 import sys
 import json
+import time
 import base64
 import struct
 import logging
+import threading
 import collections
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import requests_cache
@@ -36,7 +39,8 @@ from rudiments.reamed import click
 
 from .. import config
 from .. import __version__ as version
-from .._compat import text_type, urlparse, urlunparse, parse_qs, urlencode, unquote_plus
+from ..util import metrics, tracing
+from .._compat import urlparse, urlunparse, parse_qs, urlencode, unquote_plus
 
 
 # Exceptions that API calls typically emit
@@ -54,19 +58,71 @@ def page_id_from_tiny_link(uri, _re=re.compile(r'/x/([-_A-Za-z0-9]+)')):
     """
     matched = _re.search(uri)
     if matched:
-        tiny_url_id = matched.group(1)
-        if isinstance(tiny_url_id, text_type):
-            tiny_url_id = tiny_url_id.encode('ascii')
-        #tiny_url_id += b'=' * (len(tiny_url_id) % 4)
-        page_id_bytes = (base64.b64decode(tiny_url_id, altchars=b'_-') + b'\0\0\0\0')[:4]
-        return struct.unpack('<L', page_id_bytes)[0]
+        return page_ids_from_tiny_links([matched.group(1)])[0]
     else:
         raise ValueError("Not a tiny link: {}".format(uri))
 
 
 def tiny_id(page_id):
     """Return *tiny link* ID for the given page ID."""
-    return base64.b64encode(struct.pack('<L', int(page_id)).rstrip(b'\0'), altchars=b'_-').rstrip(b'=').decode('ascii')
+    return tiny_ids([page_id])[0]
+
+
+# Batch tiny link codecs: each page ID is packed into 6 bytes, i.e. exactly 8 Base64 chars,
+# so whole arrays of IDs / codes are converted with one Base64 and one struct call
+TINY_RECORD = struct.Struct('<L2x')
+TINY_CODE_RE = re.compile(r'[-_A-Za-z0-9]+\Z')
+TINY_CODE_LEN = (0, 2, 3, 4, 6)  # significant chars, by number of significant bytes
+
+
+def page_ids_from_tiny_links(codes):
+    """ Return the page IDs for an iterable of *tiny link* codes (the part after ``/x/``).
+
+        Raises ``ValueError`` for malformed codes.
+    """
+    padded = []
+    for code in codes:
+        if isinstance(code, bytes):
+            code = code.decode('ascii')
+        if not TINY_CODE_RE.match(code):
+            raise ValueError("Not a tiny link code: {!r}".format(code))
+        padded.append(code[:6].ljust(8, 'A'))  # 6 chars hold the 4 ID bytes, 'A' adds zero bits
+    if not padded:
+        return []
+    data = base64.b64decode(''.join(padded).encode('ascii'), altchars=b'_-')
+    return [i[0] for i in TINY_RECORD.iter_unpack(data)]
+
+
+def tiny_ids(page_ids):
+    """Return the *tiny link* codes for an iterable of page IDs."""
+    page_ids = [int(i) for i in page_ids]
+    if not page_ids:
+        return []
+    data = bytearray(TINY_RECORD.size * len(page_ids))
+    for pos, page_id in enumerate(page_ids):
+        TINY_RECORD.pack_into(data, pos * TINY_RECORD.size, page_id)
+    encoded = base64.b64encode(bytes(data), altchars=b'_-').decode('ascii')
+    return [encoded[pos * 8:pos * 8 + TINY_CODE_LEN[(page_id.bit_length() + 7) // 8]]
+            for pos, page_id in enumerate(page_ids)]
+
+
+def iter_tiny_links(text, chunk_size=1000, _re=re.compile(r'/x/([-_A-Za-z0-9]+)'),
+                    _re_bytes=re.compile(br'/x/([-_A-Za-z0-9]+)')):
+    """ Find all *tiny links* in a (large) text or bytes buffer, in one pass.
+
+        Yields ``(offset, code, page_id)`` for each link, decoding
+        the codes in chunks via :py:func:`page_ids_from_tiny_links`.
+    """
+    regex = _re_bytes if isinstance(text, (bytes, bytearray, memoryview)) else _re
+    chunk = []
+    for match in regex.finditer(text):
+        chunk.append((match.start(), match.group(1)))
+        if len(chunk) >= chunk_size:
+            for (offset, code), page_id in zip(chunk, page_ids_from_tiny_links(i[1] for i in chunk)):
+                yield offset, code, page_id
+            chunk = []
+    for (offset, code), page_id in zip(chunk, page_ids_from_tiny_links(i[1] for i in chunk)):
+        yield offset, code, page_id
 
 
 def diagnostics(cause):
@@ -104,10 +160,78 @@ def diagnostics(cause):
         click.secho(data)
 
 
+class RateLimiter(object):
+    """ A simple thread-safe rate limiter (evenly spaced calls).
+
+        A ``rate`` of zero or ``None`` disables throttling.
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next call is allowed."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RateLimitedAdapter(requests.adapters.HTTPAdapter):
+    """HTTP adapter that throttles all requests sent through it."""
+
+    def __init__(self, limiter, **kwargs):
+        self.limiter = limiter
+        super(RateLimitedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        """Wait for a free slot, then send the request."""
+        with tracing.span('http.request', kind='client', method=request.method,
+                          endpoint=metrics.endpoint_of(request.url)) as span:
+            self.limiter.wait()
+            response = super(RateLimitedAdapter, self).send(request, **kwargs)
+            span.set('status', response.status_code)
+            return response
+
+
+# API objects kept alive between commands, when running as a daemon
+_warm_apis = None  # pylint: disable=invalid-name
+_warm_lock = threading.Lock()
+
+
+def keep_warm(enabled=True):
+    """ Reuse API objects (with their connection pools) across :py:func:`context` calls.
+
+        This is meant for long-running processes, API objects are shared
+        when created with the same arguments and ``CONFLUENCE_*`` environment.
+    """
+    global _warm_apis  # pylint: disable=global-statement, invalid-name
+    _warm_apis = {} if enabled else None
+
+
+def _get_api(*args, **kwargs):
+    """Create an API object, or return a warm one."""
+    if _warm_apis is None:
+        return ConfluenceAPI(*args, **kwargs)
+
+    key = repr((args, sorted(kwargs.items()),
+                sorted(i for i in os.environ.items() if i[0].startswith('CONFLUENCE_'))))
+    with _warm_lock:
+        if key not in _warm_apis:
+            _warm_apis[key] = ConfluenceAPI(*args, **kwargs)
+        return _warm_apis[key]
+
+
 @contextmanager
 def context(*args, **kwargs):
     """Context manager providing an API object with standard error logging."""
-    api = ConfluenceAPI(*args, **kwargs)
+    api = _get_api(*args, **kwargs)
     try:
         yield api
     except ERRORS as cause:
@@ -125,12 +249,26 @@ class ConfluenceAPI(object):
 
     CACHE_EXPIRATION = 10 * 60 * 60  # seconds
     UA_NAME = 'Confluencer'
+    POOL_SIZE = 16  # max. connections kept per host, for concurrent operations
 
-    def __init__(self, endpoint=None, session=None):
+    def __init__(self, endpoint=None, session=None, rate_limit=None, offline=None):
+        """ Create API object for the given endpoint URL.
+
+            ``rate_limit`` is the maximal number of HTTP requests per second,
+            defaulting to the ``CONFLUENCE_RATE_LIMIT`` environment variable
+            (no limit if unset).
+
+            In ``offline`` mode (default: ``CONFLUENCE_OFFLINE`` is set), read
+            requests are served from the local space mirror, and any network
+            access fails.
+        """
         self.log = logging.getLogger('cfapi')
         self.base_url = endpoint or os.environ.get('CONFLUENCE_BASE_URL')
         assert self.base_url, "You MUST set the CONFLUENCE_BASE_URL environment variable!"
         self.base_url = self.base_url.rstrip('/')
+        if rate_limit is None:
+            rate_limit = float(os.environ.get('CONFLUENCE_RATE_LIMIT') or 0)
+        self.limiter = RateLimiter(rate_limit)
 
         # Enable HTTP logging when 'requests' logger is on DEBUG level
         if logging.getLogger("requests").getEffectiveLevel() <= logging.DEBUG:
@@ -149,6 +287,23 @@ class ConfluenceAPI(object):
             expire_after=self.CACHE_EXPIRATION)
         self.cached_session.headers['User-Agent'] = self.session.headers['User-Agent']
 
+        if offline is None:
+            offline = bool(os.environ.get('CONFLUENCE_OFFLINE'))
+        self.mirror = None
+        if offline:
+            from ..tools.mirror import SpaceMirror, OfflineAdapter
+            self.mirror = SpaceMirror(base_url=self.base_url)
+
+        for http_session in (self.session, self.cached_session):
+            if self.mirror:
+                adapter = OfflineAdapter()
+            else:
+                adapter = RateLimitedAdapter(self.limiter, pool_maxsize=self.POOL_SIZE)
+            for prefix in ('https://', 'http://'):
+                http_session.mount(prefix, adapter)
+            http_session.hooks['response'].append(metrics.response_hook)
+
+    @tracing.traced('api.url')
     def url(self, path):
         """ Build an API URL from partial paths.
 
@@ -222,6 +377,7 @@ class ConfluenceAPI(object):
 
         return url
 
+    @tracing.traced('api.get')
     def get(self, path, **params):
         """ GET an API path and return result.
 
@@ -230,10 +386,18 @@ class ConfluenceAPI(object):
         params = params.copy()
         cached = params.pop('_cached', False)
         url = self.url(path)
+        if self.mirror:
+            self.log.debug("GET from mirror %r", url)
+            metrics.REGISTRY.inc('mirror_requests_total', endpoint=metrics.endpoint_of(url))
+            return self.mirror.get(url, **params)
         self.log.debug("GET from %r", url)
         response = (self.cached_session if cached else self.session).get(url, params=params)
+        if cached:
+            metrics.REGISTRY.inc('cache_requests_total',
+                                 result='hit' if getattr(response, 'from_cache', False) else 'miss')
         response.raise_for_status()
-        result = AttrDict(response.json())
+        with metrics.REGISTRY.timer('json_decode_seconds'), tracing.span('api.json_decode'):
+            result = AttrDict(response.json())
         result._info.server = response.headers.get('Server', '')
         result._info.sen = response.headers.get('X-ASEN', '')
         return result
@@ -244,25 +408,41 @@ class ConfluenceAPI(object):
             If the ``limit`` keyword argument is set, it is used to stop the
             generator after the given number of result items.
 
+            If ``_prefetch=True`` is provided, the next result page is
+            requested in the background while the current one is consumed.
+
             :param path: Confluence API URI.
             :param params: Request parameters.
         """
         params = params.copy()
+        prefetch = params.pop('_prefetch', False)
         pos, outer_limit = 0, params.pop('limit', sys.maxsize)
-        while path:
+        pool = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        get_next = tracing.wrap(self.get)
+        endpoint = metrics.endpoint_of(self.url(path))
+        try:
             response = self.get(path, **params)
             #import pprint; print('\nGETALL RESPONSE'); pprint.pprint(response); print('')
             if 'page' in params.get('expand', '').split(','):
                 response = response['page']
-            items = response.get('results', [])
-            for item in items:
-                pos += 1
-                if pos > outer_limit:
-                    return
-                yield item
-
-            path = response.get('_links', {}).get('next', None)
-            params.clear()
+            while response is not None:
+                path = response.get('_links', {}).get('next', None)
+                upcoming = pool.submit(get_next, path) if pool and path else None
+                items = response.get('results', [])
+                metrics.REGISTRY.inc('api_results_total', len(items), endpoint=endpoint)
+                for item in items:
+                    pos += 1
+                    if pos > outer_limit:
+                        return
+                    yield item
+
+                if upcoming:
+                    response = upcoming.result()
+                else:
+                    response = self.get(path) if path else None
+        finally:
+            if pool:
+                pool.shutdown(wait=False)
 
     def add_page(self, space_key, title, body, parent_id=None, labels=None):
         """ Create a new page.
@@ -350,6 +530,20 @@ class ConfluenceAPI(object):
         response = self.session.delete(url, json=data)
         response.raise_for_status()
 
+    def trashed(self, space_key, content_type='page', **params):
+        """ Yield all trashed content of the given type in a space.
+
+            CQL does not see trashed content, so this pages through the
+            plain content listing filtered by status.
+        """
+        params = params.copy()
+        params.update(dict(spaceKey=space_key, type=content_type, status='trashed'))
+        return self.getall('content', **params)
+
+    def purge_page(self, page):
+        """Permanently purge a trashed page."""
+        return self.delete_page(page, status='trashed')
+
     def user(self, username=None, key=None):
         """ Return user details.
 
@@ -17,9 +17,28 @@
 # limitations under the License.
 from __future__ import absolute_import, unicode_literals, print_function
 
-# Load the command modules for registration
-from . import help  # noqa pylint: disable=redefined-builtin
-from . import tidy
-from . import stats
-from . import pretty
-from . import remove
+# Sub-command names, with their modules and short help; modules are only
+# imported (and register their command) when that command is used, so the
+# short help must match the command's docstring
+COMMAND_MODULES = {
+    'help': ('help', "Print some information on the system environment."),
+    'tidy': ('tidy', "Tidy pages after cut&paste migration from other wikis."),
+    'stats': ('stats', "Create status reports (or data exports)."),
+    'pretty': ('pretty', "Pretty-print page content markup."),
+    'rm': ('remove', "Remove contents."),
+    'mirror': ('mirror', "Sync space(s) into the local mirror, for use with '--offline'."),
+    'grep': ('grep', "Search the storage format of pages for a regex."),
+    'replace': ('replace', "Regex search-and-replace in many pages."),
+    'relink': ('relink', "Make links to pages canonical and portable."),
+    'check-links': ('checklinks', "Find broken links to pages."),
+    'serve': ('serve', "Keep a warm process running, for fast repeated calls."),
+    'journal': ('journal', "Manage the journals of resumable operations."),
+}
+
+
+def load_all():
+    """Import all command modules, to register every command."""
+    import importlib
+
+    for module_name, _ in COMMAND_MODULES.values():
+        importlib.import_module('.' + module_name, __name__)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation, too-few-public-methods
+""" 'check-links' command.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import multiprocessing
+
+from rudiments.reamed import click
+
+from .. import config, api
+from ..tools import links
+
+
+def iter_bodies(cf, spaces):
+    """Yield ``(page_id, space_key, title, body)`` for all pages in the given spaces."""
+    cql = 'type=page AND space in ({})'.format(', '.join('"{}"'.format(i) for i in spaces))
+    for page in cf.getall('content/search', cql=cql, expand='space,body.storage', _prefetch=True):
+        yield page.id, page.space.key, page.title, page.body.storage.value
+
+
+@config.cli.command(name='check-links')
+@click.option('-s', '--space', 'spaces', metavar='KEY', multiple=True, required=True,
+              help="Space(s) with the pages to check.")
+@click.option('-l', '--link-space', 'link_spaces', metavar='KEY', multiple=True,
+              help="Additional space(s) that links may point to.")
+@click.option('--host', 'hosts', metavar='URL', multiple=True,
+              help="Additional base URL(s) of the wiki, e.g. an old host name.")
+@click.option('-j', '--jobs', metavar='N', default=multiprocessing.cpu_count(), type=int,
+              help="Number of processes parsing page bodies.")
+@click.pass_context
+def check_links(ctx, spaces, link_spaces=(), hosts=(), jobs=multiprocessing.cpu_count()):
+    """ Find broken links to pages.
+
+        Links are checked against an index of all pages in the given
+        spaces. Links by title into other spaces are not checked, page IDs
+        missing in the index are collected and searched for in batches.
+    """
+    pages = broken = 0
+    with api.context() as cf:
+        try:
+            index = links.PageIndex.load(cf, list(spaces) + [i for i in link_spaces if i not in spaces])
+            ctx.obj.log.info('Indexed %d pages', len(index))
+            for page, problems in links.check_pages(index, iter_bodies(cf, spaces),
+                                                    (cf.base_url,) + hosts, workers=jobs,
+                                                    resolve=links.page_resolver(cf)):
+                pages += 1
+                if not problems:
+                    continue
+                broken += len(problems)
+                click.secho('{1}/{2} (page#{0}):'.format(*page), bold=True)
+                for kind, target, text, problem in problems:
+                    if kind is None:
+                        click.echo('    {}'.format(problem))
+                    else:
+                        click.echo('    {} "{}" [{}] – {}'.format(
+                            kind, '/'.join(i or '' for i in target) if isinstance(target, tuple) else target,
+                            text, problem))
+        except api.ERRORS as cause:
+            api.diagnostics(cause)
+    click.echo('{} broken link(s) in {} checked page(s).'.format(broken, pages))
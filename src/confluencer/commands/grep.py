@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation, too-few-public-methods
+""" 'grep' command.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import multiprocessing
+
+from rudiments.reamed import click
+
+from .. import config, api
+from ..tools import grep as grepper
+
+
+def iter_pages(cf, spaces, cql=None):
+    """Yield ``(space_key, title, body)`` of all pages to search."""
+    if cf.mirror and not cql:
+        for space_key in spaces or [None]:
+            for _, space, title, _, body in cf.mirror.iter_bodies(space_key):
+                yield space, title, body
+        return
+
+    filters = ['space="{}"'.format(i) for i in spaces] or [None]
+    for space_filter in filters:
+        query = ' AND '.join(i for i in ('type=page', space_filter, cql and '({})'.format(cql)) if i)
+        for page in cf.getall('content/search', cql=query, expand='space,body.storage', _prefetch=True):
+            yield page.space.key, page.title, page.body.storage.value
+
+
+@config.cli.command(name='grep')
+@click.option('-s', '--space', 'spaces', metavar='KEY', multiple=True,
+              help="Space(s) to search.")
+@click.option('-q', '--cql', metavar='CQL', default=None,
+              help="Additional CQL filter for the pages to search.")
+@click.option('-i', '--ignore-case', is_flag=True, default=False,
+              help="Match case-insensitively.")
+@click.option('-F', '--fixed-strings', is_flag=True, default=False,
+              help="Search for a literal string, not a regex.")
+@click.option('-o', '--only-matching', is_flag=True, default=False,
+              help="Only print the matched parts of a line.")
+@click.option('-w', '--workers', metavar='N', default=multiprocessing.cpu_count(), type=int,
+              help="Number of matching processes.")
+@click.argument('pattern')
+@click.pass_context
+def grep_pages(ctx, pattern, spaces=(), cql=None, ignore_case=False, fixed_strings=False,
+               only_matching=False, workers=multiprocessing.cpu_count()):
+    """ Search the storage format of pages for a regex.
+
+        Pages come from the server (or the mirror in offline mode),
+        and matches are printed as ‹space›/‹title›:‹line›:‹text›.
+    """
+    if not spaces and not cql:
+        raise click.LoggedFailure('Provide at least one space or a CQL filter')
+    if fixed_strings:
+        pattern = re.escape(pattern)
+    flags = re.IGNORECASE if ignore_case else 0
+    try:
+        re.compile(pattern, flags)
+    except re.error as cause:
+        raise click.LoggedFailure('Bad regex "{}": {}'.format(pattern, cause))
+
+    hits = 0
+    with api.context() as cf:
+        try:
+            for space_key, title, lineno, text in grepper.grep(pattern, iter_pages(cf, spaces, cql), flags=flags,
+                                                               only_matching=only_matching, workers=workers):
+                click.echo('{}/{}:{}:{}'.format(space_key, title, lineno, text))
+                hits += 1
+        except api.ERRORS as cause:
+            api.diagnostics(cause)
+    ctx.obj.log.info('Found %d match%s.', hits, '' if hits == 1 else 'es')
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation, too-few-public-methods
+""" 'journal' command.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+
+from rudiments.reamed import click
+
+from .. import config
+from ..tools import journal as journals
+
+
+@config.cli.group()
+def journal():
+    """Manage the journals of resumable operations."""
+
+
+@journal.command(name='list')
+@click.option('-a', '--all', 'show_all', is_flag=True, default=False,
+              help="Also list journals of finished jobs.")
+def list_journals(show_all=False):
+    """List the journals of (unfinished) jobs."""
+    shown = 0
+    for info in journals.list_journals():
+        if info.finished and not show_all:
+            continue
+        shown += 1
+        click.echo('{job:40s} {state:10s} {pages:7d} pages  {modified}  {args}'.format(
+                   job=info.job, state='finished' if info.finished else 'incomplete', pages=info.pages,
+                   modified=time.strftime('%Y-%m-%d %H:%M', time.localtime(info.modified)),
+                   args=' '.join(info.args)[:60]))
+    if not shown:
+        click.echo('No {}journals found.'.format('' if show_all else 'unfinished '))
+
+
+@journal.command()
+@click.option('-a', '--all', 'unfinished', is_flag=True, default=False,
+              help="Also remove journals of unfinished jobs.")
+@click.option('-d', '--days', metavar='N', default=None, type=float,
+              help="Only remove journals not touched for N days.")
+@click.pass_context
+def clean(ctx, unfinished=False, days=None):
+    """Remove the journals of finished jobs."""
+    removed = journals.clean(older_than=days * 86400 if days is not None else None, unfinished=unfinished)
+    for info in removed:
+        ctx.obj.log.info('Removed journal "%s"', info.job)
+    click.echo('Removed {} journal(s).'.format(len(removed)))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation, too-few-public-methods
+""" 'mirror' command.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+from rudiments.reamed import click
+
+from .. import config, api
+from ..tools.mirror import SpaceMirror
+
+
+@config.cli.command()
+@click.option('-s', '--space', 'spaces', metavar='KEY', multiple=True, required=True,
+              help="Space(s) to mirror.")
+@click.option('--full', is_flag=True, default=False,
+              help="Reload everything, instead of only pages changed since the last sync.")
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of concurrent API requests.")
+@click.pass_context
+def mirror(ctx, spaces, full=False, workers=4):
+    """Sync space(s) into the local mirror, for use with '--offline'."""
+    with api.context(offline=False) as cf:
+        store = SpaceMirror(base_url=cf.base_url)
+        try:
+            for space_key in spaces:
+                try:
+                    store.sync(cf, space_key, full=full, workers=workers)
+                except api.ERRORS as cause:
+                    # Just log and otherwise ignore any errors
+                    api.diagnostics(cause)
+        finally:
+            store.close()
+        ctx.obj.log.info('Mirror is at "%s"', click.pretty_path(store.path))
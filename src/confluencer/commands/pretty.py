@@ -24,7 +24,7 @@ import json as jsonlib
 from rudiments.reamed import click
 
 from .. import config, api
-from ..tools import content
+from ..tools import batch, content
 
 
 @config.cli.command()
@@ -33,23 +33,30 @@ from ..tools import content
 @click.option('-f', '--format', 'markup', default='view', type=click.Choice(content.CLI_CONTENT_FORMATS.keys()),
     help="Markup format.",
 )
+@click.option('-F', '--from-file', metavar='FILE', type=click.File('r'), default=None,
+              help="Read page references (URLs or IDs) line by line, '-' for stdin.")
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of concurrent API requests.")
 @click.argument('pages', metavar='‹page-url›…', nargs=-1)
 @click.pass_context
-def pretty(ctx, pages, markup, recursive=False, json=False):
+def pretty(ctx, pages, markup, recursive=False, json=False, from_file=None, workers=4):
     """Pretty-print page content markup."""
     content_format = content.CLI_CONTENT_FORMATS[markup]
+    expand = 'space,version,body.{},metadata.labels,metadata.properties'.format(content_format)
     with api.context() as cf:
-        for page_url in pages:
-            try:
-                page = content.ConfluencePage(cf, page_url, markup=content_format,
-                                              expand='metadata.labels,metadata.properties')
-            except api.ERRORS as cause:
+        refs = batch.iter_refs(pages, from_file)
+        for ref, data, error in batch.iter_pages(cf, refs, expand=expand, workers=workers):
+            if error:
                 # Just log and otherwise ignore any errors
-                api.diagnostics(cause)
+                batch.report_error(ctx.obj.log, ref, error)
+                continue
+
+            page = content.ConfluencePage(cf, data._links.self, markup=content_format, data=data)
+            if json:
+                jsonlib.dump(page.json, sys.stdout, indent='  ', sort_keys=True)
+                sys.stdout.write('\n')
             else:
-                if json:
-                    jsonlib.dump(page.json, sys.stdout, indent='  ', sort_keys=True)
-                else:
-                    root = page.etree()
-                    with os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
-                        root.getroottree().write(stdout, encoding='utf8', pretty_print=True, xml_declaration=False)
+                root = page.etree()
+                sys.stdout.flush()
+                with os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
+                    root.getroottree().write(stdout, encoding='utf8', pretty_print=True, xml_declaration=False)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation, too-few-public-methods
+""" 'relink' command.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import functools
+import collections
+
+from rudiments.reamed import click
+
+from .. import config, api
+from ..tools import bulk, links
+from ..tools.content import ConfluencePage
+
+
+@config.cli.command()
+@click.option('-s', '--space', 'spaces', metavar='KEY', multiple=True, required=True,
+              help="Space(s) with the pages to rewrite.")
+@click.option('-l', '--link-space', 'link_spaces', metavar='KEY', multiple=True,
+              help="Additional space(s) that links may point to.")
+@click.option('--host', 'hosts', metavar='URL', multiple=True,
+              help="Additional base URL(s) of the wiki, e.g. an old host name.")
+@click.option('--diff', is_flag=True, default=False, help='Show differences after rewriting.')
+@click.option('-n', '--no-save', '--dry-run', 'dry_run', count=True,
+              help="Only show differences, don't apply them (use twice for no diff).")
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of concurrent API requests for saving.")
+@click.pass_context
+def relink(ctx, spaces, link_spaces=(), hosts=(), diff=False, dry_run=0, workers=4):
+    """ Make links to pages canonical and portable.
+
+        Rewrites tiny links, 'viewpage' and 'display' URLs
+        to other pages into Confluence page links.
+    """
+    with api.context() as cf:
+        index = links.PageIndex.load(cf, list(spaces) + [i for i in link_spaces if i not in spaces])
+        ctx.obj.log.info('Indexed %d pages', len(index))
+        rewriter = links.LinkRewriter(index, (cf.base_url,) + hosts)
+        totals = collections.Counter()
+        saving = {}  # page ID -> link counts of the body being saved
+
+        def rewrite(page, body):
+            "Helper"
+            counts = collections.Counter()
+            body = rewriter.rewrite(body, own_space=page.space_key, stats=counts)
+            saving[page.page_id] = counts
+            return body
+
+        def changes():
+            "Helper"
+            cql = 'type=page AND space in ({})'.format(', '.join('"{}"'.format(i) for i in spaces))
+            for data in cf.getall('content/search', cql=cql, expand='space,version,body.storage', _prefetch=True):
+                page = ConfluencePage(cf, data._links.self, data=data)
+                body = rewrite(page, page.body)
+                totals['unresolved'] += saving[page.page_id]['unresolved']
+                if body == page.body:
+                    del saving[page.page_id]
+                    continue
+                if diff or dry_run == 1:
+                    page.dump_diff(body)
+                if dry_run:
+                    totals['rewritten'] += saving.pop(page.page_id)['rewritten']
+                    ctx.obj.log.info('WOULD save page#{0} "{1}" as v. {2}'.format(
+                                     page.page_id, page.title, page.version + 1))
+                else:
+                    yield page, bulk.precomputed(functools.partial(rewrite, page), page.body, body)
+
+        try:
+            updater = bulk.BulkUpdater(cf, workers=workers, log=ctx.obj.log)
+            for result in updater.run(changes()):
+                # Only count the links of what was actually saved, e.g. after a version conflict
+                counts = saving.pop(result.page_id, None)
+                if result.status == 'updated':
+                    totals['rewritten'] += counts['rewritten']
+                    ctx.obj.log.info('Updated page#{page_id} "{title}" to v. {version}'.format(**result))
+        except api.ERRORS as cause:
+            api.diagnostics(cause)
+        else:
+            click.echo('{} links rewritten, {} unresolved.'.format(totals['rewritten'], totals['unresolved']))
@@ -17,14 +17,11 @@
 # limitations under the License.
 from __future__ import absolute_import, unicode_literals, print_function
 
-import sys
-
-from munch import Munch as Bunch
 from rudiments.reamed import click
 
 from .. import config, api
 from ..util import progress, CLEARLINE
-from ..tools import content
+from ..tools import batch, bulk, pagetree, journal as journals
 
 
 @config.cli.group(name='rm')
@@ -34,43 +31,127 @@ def remove(ctx):
 
 
 @remove.command()
-## TODO: -n, --no-act, --dry-run, --simulate
-## TODO: --with[out]-root (or tree vs children command?)
-## TODO: include / exclude filters (title glob)
+@click.option('-n', '--no-act', '--dry-run', 'dry_run', is_flag=True, default=False,
+              help="Only list the pages that would be removed.")
+@click.option('--with-root/--without-root', default=False,
+              help="Also remove the given page(s), or only their descendants (the default).")
+@click.option('-i', '--include', metavar='GLOB', multiple=True,
+              help="Only remove pages with a matching title, and their descendants.")
+@click.option('-x', '--exclude', metavar='GLOB', multiple=True,
+              help="Keep pages with a matching title, their descendants, and ancestors.")
+@click.option('-y', '--yes', is_flag=True, default=False, help="Do not ask for confirmation.")
+@click.option('-F', '--from-file', metavar='FILE', type=click.File('r'), default=None,
+              help="Read page references (URLs or IDs) line by line, '-' for stdin.")
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of concurrent API requests.")
+@click.option('--resume', metavar='JOB', default=None,
+              help="Continue an interrupted job, skipping the trees it already removed.")
 @click.argument('pages', metavar='‹page-url›…', nargs=-1)
 @click.pass_context
-def tree(ctx, pages):
-    """Remove page(s) including their descendants."""
-    with api.context() as cf:
-        for page_ref in pages:
-            root_page = cf.get(page_ref)
-            root_children = cf.get(root_page._expandable.children, expand='page', limit=200)
+def tree(ctx, pages, dry_run=False, with_root=False, include=(), exclude=(), yes=False, from_file=None, workers=4,
+         resume=None):
+    """ Remove page(s) including their descendants.
+
+        Completely removed trees are recorded in a journal, so an
+        interrupted run can be continued with '--resume'.
+    """
+    if from_file and from_file.name == '<stdin>' and not (dry_run or yes):
+        raise click.LoggedFailure("Reading pages from stdin needs '--yes' (or '--dry-run')")
+
+    with api.context() as cf, journals.Journal.start('rm tree', pages, resume=resume, enabled=not dry_run) as journal:
+        incomplete = 0
+        refs = (i for i in batch.iter_refs(pages, from_file) if batch.page_id_of(i) not in journal)
+        for page_ref, root_page, error in batch.iter_pages(cf, refs, workers=workers):
+            if error:
+                batch.report_error(ctx.obj.log, page_ref, error)
+                incomplete += 1
+                continue
+            if root_page.id in journal:
+                continue
+            nodes = pagetree.load_subtree(cf, root_page, workers=workers)
+            selected = pagetree.select_nodes(nodes, with_root=with_root, include=include, exclude=exclude)
+            if not selected:
+                click.echo('Nothing to remove below »{}«.'.format(root_page.title))
+                journal.record(root_page.id)
+                continue
+
+            deleter = pagetree.SubtreeDeleter(cf, workers=workers, dry_run=dry_run, log=ctx.obj.log)
+            if dry_run:
+                deleter.run(selected)
+                click.echo('Would delete {} of {} pages.'.format(len(selected), len(nodes)))
+                continue
 
             # Get confirmation
-            answer = None
+            answer = 'yes' if yes else None
             while answer not in {'yes', 'no', 'n'}:
-                answer = input('REALLY remove {} children of »{}« and all their descendants? [yes|No|N] '
-                               .format(len(root_children.page.results), root_page.title))
+                answer = input('REALLY remove {} of {} pages in the tree of »{}«{}? [yes|No|N] '
+                               .format(len(selected), len(nodes), root_page.title,
+                                       ' (including it)' if with_root else ''))
                 answer = answer.lower() or 'n'
 
             # Delete data on positive confirmation
             if answer != 'yes':
                 click.echo('No confirmation, did not delete anything!')
+                incomplete += 1
             else:
-                counter = 0
                 try:
-                    iter_pages = progress(sorted(root_children.page.results, key=lambda x: x.title.lower()))
-                    for page in iter_pages:
-                        print(CLEARLINE + "DEL", page.title, end='\r')
-                        iter_pages.set_postfix_str('')
-                        while True:
-                            children = cf.get(page._expandable.children, expand='page', limit=200).page.results
-                            if not children:
-                                break
-                            for child in children:
-                                cf.delete_page(child)
-                                counter += 1
-                        cf.delete_page(page)
-                        counter += 1
+                    with progress(total=len(selected), unit='page') as iter_pages:
+                        deleter.run(selected, progress=iter_pages)
                 finally:
-                    print(CLEARLINE + "Deleted {} pages.\n".format(counter))
+                    print(CLEARLINE + "Deleted {} pages.\n".format(len(deleter.deleted)))
+                if deleter.failed:
+                    click.serror('{} pages could not be deleted!'.format(len(deleter.failed)))
+                    incomplete += 1
+                else:
+                    journal.record(root_page.id)
+
+        if not incomplete:
+            journal.finish()
+
+
+@remove.command()
+@click.option('-s', '--space', 'spaces', metavar='KEY', multiple=True, required=True,
+              help="Space(s) to purge the trash of.")
+@click.option('-t', '--type', 'content_types', multiple=True, default=('page', 'blogpost'),
+              type=click.Choice(('page', 'blogpost')), help="Content types to purge.")
+@click.option('-n', '--no-act', '--dry-run', 'dry_run', is_flag=True, default=False,
+              help="Only report what would be purged.")
+@click.option('-y', '--yes', is_flag=True, default=False, help="Do not ask for confirmation.")
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of concurrent API requests.")
+@click.pass_context
+def purge(ctx, spaces, content_types, dry_run=False, yes=False, workers=4):
+    """Permanently purge trashed content of space(s)."""
+    with api.context() as cf:
+        for space_key in spaces:
+            trashed = [page for content_type in content_types
+                       for page in cf.trashed(space_key, content_type, expand='body.storage')]
+            if not trashed:
+                click.echo('Trash of space {} is empty.'.format(space_key))
+                continue
+
+            if not (dry_run or yes):
+                answer = None
+                while answer not in {'yes', 'no', 'n'}:
+                    answer = input('REALLY purge {} trashed items of space {}? [yes|No|N] '
+                                   .format(len(trashed), space_key))
+                    answer = answer.lower() or 'n'
+                if answer != 'yes':
+                    click.echo('No confirmation, did not purge anything!')
+                    continue
+
+            counter, reclaimed, failed = 0, 0, 0
+            try:
+                with progress(total=len(trashed), unit='page') as iter_pages:
+                    for page, size, error in bulk.purge_trash(cf, trashed, workers=workers, dry_run=dry_run):
+                        iter_pages.update(1)
+                        if error:
+                            failed += 1
+                            ctx.obj.log.error('Purging page#%s "%s" failed: %s', page.id, page.title, error)
+                        else:
+                            counter += 1
+                            reclaimed += size
+            finally:
+                print(CLEARLINE + "{} {} items ({:.1f} KiB of markup) from the trash of {}.{}\n".format(
+                      'Would purge' if dry_run else 'Purged', counter, reclaimed / 1024.0, space_key,
+                      ' {} failures!'.format(failed) if failed else ''))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation, too-few-public-methods
+""" 'replace' command.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import functools
+import multiprocessing
+
+from rudiments.reamed import click
+
+from .. import config, api
+from ..tools import bulk, replace as rewriter
+from ..tools.content import ConfluencePage
+
+
+def iter_pages(cf, cql=None, roots=()):
+    """ Yield all selected pages, loaded in bulk with their storage body.
+
+        Pages selected several times (overlapping trees, or CQL plus
+        roots) are yielded only once.
+    """
+    queries = ['type=page AND ({})'.format(cql)] if cql else []
+    for root in roots:
+        root_id = cf.get(root).id
+        queries.append('type=page AND (id = {0} OR ancestor = {0})'.format(root_id))
+    seen = set()
+    for query in queries:
+        for data in cf.getall('content/search', cql=query, expand='space,version,body.storage', _prefetch=True):
+            if data.id not in seen:
+                seen.add(data.id)
+                yield ConfluencePage(cf, data._links.self, data=data)
+
+
+@config.cli.command()
+@click.option('-r', '--rules', 'rules_file', metavar='FILE', required=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help="JSON file with the replacement rules.")
+@click.option('-q', '--cql', metavar='CQL', default=None,
+              help="Select the pages to change via CQL.")
+@click.option('--diff', is_flag=True, default=False, help='Show differences after replacing.')
+@click.option('-n', '--no-save', '--dry-run', 'dry_run', count=True,
+              help="Only show differences, don't apply them (use twice for no diff).")
+@click.option('-j', '--jobs', metavar='N', default=multiprocessing.cpu_count(), type=int,
+              help="Number of processes applying the rules.")
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of concurrent API requests for saving.")
+@click.argument('roots', metavar='‹page-url›…', nargs=-1)
+@click.pass_context
+def replace(ctx, rules_file, roots, cql=None, diff=False, dry_run=0, jobs=multiprocessing.cpu_count(), workers=4):
+    """ Regex search-and-replace in many pages.
+
+        Pages are selected by CQL, or as the given page(s) including
+        their descendants.
+    """
+    if not cql and not roots:
+        raise click.LoggedFailure('Provide a CQL filter or at least one page')
+    rules = rewriter.load_rules(rules_file)
+
+    with api.context() as cf:
+        def changes():
+            "Helper"
+            for page, body in rewriter.iter_changes(rules, iter_pages(cf, cql, roots), workers=jobs, log=ctx.obj.log):
+                if diff or dry_run == 1:
+                    page.dump_diff(body)
+                if dry_run:
+                    ctx.obj.log.info('WOULD save page#{0} "{1}" as v. {2}'.format(
+                                     page.page_id, page.title, page.version + 1))
+                else:
+                    yield page, bulk.precomputed(functools.partial(rewriter.apply_rules, rules), page.body, body)
+
+        try:
+            updater = bulk.BulkUpdater(cf, workers=workers, log=ctx.obj.log)
+            for result in updater.run(changes()):
+                if result.status == 'updated':
+                    ctx.obj.log.info('Updated page#{page_id} "{title}" to v. {version}'.format(**result))
+        except api.ERRORS as cause:
+            api.diagnostics(cause)
+        else:
+            if not dry_run:
+                click.echo('{updated} updated, {unchanged} unchanged, {failed} failed'
+                           ' ({conflicts} version conflicts).'.format(**updater.stats))
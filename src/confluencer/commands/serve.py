@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation, too-few-public-methods
+""" 'serve' command.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+from rudiments.reamed import click
+
+from .. import config, api, commands, daemon
+
+
+@config.cli.command()
+@click.option('--socket', 'path', metavar='PATH', default=None,
+              help="Socket to listen on (default: $CONFLUENCER_SOCKET, or a file in a private per-user directory).")
+@click.option('--idle-timeout', metavar='SECONDS', default=None, type=float,
+              help="Stop after being idle for that long.")
+@click.option('--stop', is_flag=True, default=False,
+              help="Stop a running daemon.")
+@click.pass_context
+def serve(ctx, path=None, idle_timeout=None, stop=False):
+    """ Keep a warm process running, for fast repeated calls.
+
+        While it runs, other calls forward their command to it (except
+        'rm'), and reuse its open connections, caches and loaded modules.
+        Set CONFLUENCER_NO_DAEMON to always run commands locally.
+    """
+    if stop:
+        if not daemon.stop(path):
+            raise click.LoggedFailure('No daemon is listening on "{}"'.format(path or daemon.socket_path()))
+        return
+
+    api.keep_warm()
+    commands.load_all()
+    server = daemon.Daemon(config.cli, path=path, idle_timeout=idle_timeout, log=ctx.obj.log)
+    try:
+        server.bind()
+    except EnvironmentError as cause:
+        raise click.LoggedFailure(str(cause))
+
+    ctx.obj.log.info('Listening on "%s"', server.path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
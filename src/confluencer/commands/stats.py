@@ -17,52 +17,70 @@
 # limitations under the License.
 from __future__ import absolute_import, unicode_literals, print_function
 
-import sys
-import json
-from pprint import pformat
+import heapq
+import collections
 
 from munch import Munch as Bunch
 from rudiments.reamed import click
 
 from .. import config, api
-from ..tools import content
-from .._compat import text_type, string_types
+from ..util import iter_concurrently, iter_merged, metrics
+from ..tools import content, export, macros, journal as journals
 
 
 SERIALIZERS_NEED_NL = ('dict', 'json', 'html')
-SERIALIZERS_TEXT = SERIALIZERS_NEED_NL + ('yaml', 'csv', 'tsv')
-SERIALIZERS_BINARY = ('ods', 'xls')  # this just doesn't work right (Unicode issues): , 'xlsx')
+SERIALIZERS_TEXT = SERIALIZERS_NEED_NL + ('ndjson', 'yaml', 'csv', 'tsv')
+SERIALIZERS_BINARY = ('ods', 'xlsx')
 SERIALIZERS = SERIALIZERS_TEXT + SERIALIZERS_BINARY
 
-ENTITIES = ('macro',)  # 'label', 'page', 'title', 'attachment', 'blog', …
-
-
-def print_result(ctx, obj):
-    """ Dump a result to the console or an output file."""
-    text = obj
-    if isinstance(text, dict):
-        if isinstance(text, Bunch):
-            # Debunchify for ``pformat``
-            text = dict(text.copy())
-            for key, val in text.items():
-                if isinstance(val, Bunch):
-                    text[key] = dict(val)
-        #text = pformat(text)
-        text = json.dumps(text, indent=2, sort_keys=True)
-    elif isinstance(text, list):
-        text = json.dumps(text, indent=2, sort_keys=True)
-
-    if not isinstance(text, string_types):
-        text = repr(text)
-    if ctx.obj.serializer in SERIALIZERS_NEED_NL:
-        text += '\n'
-    #if isinstance(text, text_type):
-    #    text = text.encode('utf-8')
-    try:
-        (ctx.obj.outfile or sys.stdout).write(text)
-    except EnvironmentError as cause:
-        raise click.LoggedFailure('Error while writing "{}" ({})'.format(
-            getattr(ctx.obj.outfile or object(), 'name', '<stream>'), cause))
+ENTITIES = ('macro', 'label', 'page', 'title', 'attachment', 'blog')
+
+# Server-side CQL filters to find usage of an entity, and how to count uses per search result
+ENTITY_USAGE = dict(
+    macro=('type=page AND macro = "{query}"', 'space,body.storage',
+           lambda item, query: content.count_macros(item.body.storage.value, query)[query]),
+    label=('type in (page, blogpost) AND label = "{query}"', 'space', None),
+    page=('type=page AND text ~ "{query}"', 'space', None),
+    title=('type in (page, blogpost) AND title ~ "{query}"', 'space', None),
+    attachment=('type=attachment AND title ~ "{query}"', 'space',
+                lambda item, _: item.extensions.fileSize or 0),
+    blog=('type=blogpost AND text ~ "{query}"', 'space', None),
+)
+
+# Server-side CQL filters for per-space volume reports
+ENTITY_VOLUME_CQL = dict(
+    page='type=page',
+    blog='type=blogpost',
+    attachment='type=attachment',
+    label='type in (page, blogpost)',
+)
+
+# Flattened fields of ranked usage reports
+USAGE_FIELDS = ('rank', 'space', 'id', 'title', 'count', 'url')
+
+# Flattened fields of per-space volume reports
+VOLUME_FIELDS = ('space', 'pages', 'blogs', 'attachments', 'attachment_bytes',
+                 'label_uses', 'labels', 'top_labels')
+
+# Exported records per journal checkpoint of "stats tree"
+CHECKPOINT_RECORDS = 100
+
+
+def record_serializer(ctx):
+    """ Return the selected format for record streams.
+
+        The format defaults to the extension of the output file, or JSON.
+    """
+    serializer = ctx.obj.serializer or export.serializer_for(getattr(ctx.obj.outfile, 'name', None))
+    if serializer not in export.WRITERS:
+        raise click.LoggedFailure('Output format "{}" is not supported for record streams'.format(serializer))
+    return serializer
+
+
+def record_writer(ctx, fields=None, **kwargs):
+    """Return a streaming writer for records, according to the selected format."""
+    return export.writer(record_serializer(ctx), ctx.obj.outfile or click.get_binary_stream('stdout'),
+                         fields=fields, **kwargs)
 
 
 @config.cli.group()
@@ -92,56 +110,245 @@ def stats(ctx, space, entity, outfile, serializer):
 @stats.command()
 @click.option('--top', metavar='N', default=0, type=int,
               help="Show top ‹N› ranked entities.")
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of spaces searched concurrently.")
+@click.option('-I', '--indexed', is_flag=True, default=False,
+              help="Answer from the local macro index (see 'stats index').")
+@click.option('-P', '--params', is_flag=True, default=False,
+              help="Report the parameters used with the macro (implies --indexed).")
 @click.argument('query')
 @click.pass_context
-def usage(ctx, query, top=0):
+def usage(ctx, query, top=0, workers=4, indexed=False, params=False):
     """Create report on usage of different entities (macros, labels, …)."""
     if not ctx.obj.entity:
         click.serror("No --entity selected!")
         return
-    if top:
-        click.echo("TOP {:d}".format(top))
+    if indexed or params:
+        return indexed_usage(ctx, query, top=top, params=params)
+
+    cql_filter, expand, counter = ENTITY_USAGE[ctx.obj.entity]
 
-    outname = getattr(ctx.obj.outfile, 'name', None)
+    def collect(space_key):
+        "Yield matching content of one space, with its usage count."
+        cql = ' AND '.join([cql_filter.format(query=query.replace('"', '?'))] +
+                           (['space="{}"'.format(space_key)] if space_key else []))
+        for item in cf.getall('content/search', cql=cql, expand=expand, _prefetch=True):
+            yield Bunch(rank=None, space=item.space.key, id=item.id, title=item.title,
+                        count=counter(item, query) if counter else 1, url=cf.base_url + item._links.webui)
 
+    ranking = []
+    space_pages, space_counts = collections.Counter(), collections.Counter()
     with api.context() as cf:
-        ctx.obj.cql.append('type=page AND macro != "{}"'.format(query))
-        try:
-            response = cf.get("content/search", cql=' AND '.join(ctx.obj.cql))
-        except api.ERRORS as cause:
-            # Just log and otherwise ignore any errors
-            api.diagnostics(cause)
+        with record_writer(ctx, fields=USAGE_FIELDS) as out:
+            try:
+                for record in iter_merged(collect, ctx.obj.spaces or [None], workers=workers):
+                    space_pages[record.space] += 1
+                    space_counts[record.space] += record.count
+                    if not top:
+                        out.write(record)
+                    elif len(ranking) < top:
+                        heapq.heappush(ranking, (record.count, record.id, record))
+                    else:
+                        heapq.heappushpop(ranking, (record.count, record.id, record))
+            except api.ERRORS as cause:
+                # Just log and otherwise ignore any errors
+                api.diagnostics(cause)
+
+            for rank, (_, _, record) in enumerate(sorted(ranking, reverse=True), 1):
+                record.rank = rank
+                out.write(record)
+
+    for space_key, count in space_counts.most_common():
+        ctx.obj.log.info('%s: %d uses of %s "%s" in %d items',
+                         space_key, count, ctx.obj.entity, query, space_pages[space_key])
+
+
+def count_cql(cf, cql):
+    """Count search results, using the server-side total if available."""
+    response = cf.get('content/search', cql=cql, limit=1)
+    if response.get('totalSize') is not None:
+        return response.totalSize
+    return sum(1 for _ in cf.getall('content/search', cql=cql))
+
+
+def space_volume(cf, space_key, entities):
+    """ Collect volume figures of one space.
+
+        Plain counts are left to the server, while attachment sizes
+        and labels are aggregated while paging through the results.
+    """
+    cql = lambda entity: '{} AND space="{}"'.format(ENTITY_VOLUME_CQL[entity], space_key)
+    record = Bunch(space=space_key)
+    if 'page' in entities:
+        record.pages = count_cql(cf, cql('page'))
+    if 'blog' in entities:
+        record.blogs = count_cql(cf, cql('blog'))
+    if 'attachment' in entities:
+        record.attachments, record.attachment_bytes = 0, 0
+        for attachment in cf.getall('content/search', cql=cql('attachment'), _prefetch=True):
+            record.attachments += 1
+            record.attachment_bytes += attachment.extensions.fileSize or 0
+    if 'label' in entities:
+        labels = collections.Counter()
+        for item in cf.getall('content/search', cql=cql('label'), expand='metadata.labels', _prefetch=True):
+            labels.update(label.name for label in item.metadata.labels.results or [])
+        record.label_uses, record.labels = sum(labels.values()), len(labels)
+        record.top_labels = ' '.join('{}:{}'.format(*i) for i in labels.most_common(5))
+    return record
+
+
+@stats.command()
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of spaces handled concurrently.")
+@click.pass_context
+def volume(ctx, workers=4):
+    """Create per-space volume report (pages, blogs, attachments, labels)."""
+    entities = [ctx.obj.entity] if ctx.obj.entity else list(ENTITY_VOLUME_CQL)
+    unknown = set(entities) - set(ENTITY_VOLUME_CQL)
+    if unknown:
+        raise click.LoggedFailure('No volume report for entity "{}"'.format(unknown.pop()))
+
+    with api.context() as cf:
+        spaces = ctx.obj.spaces or (space.key for space in cf.getall('space', _prefetch=True))
+        with record_writer(ctx, fields=VOLUME_FIELDS) as out:
+            for space_key, record, error in iter_concurrently(
+                    lambda key: space_volume(cf, key, entities), spaces, workers=workers):
+                if error:
+                    if not isinstance(error, api.ERRORS):
+                        raise error
+                    api.diagnostics(error)
+                else:
+                    out.write(record)
+
+
+def indexed_usage(ctx, query, top=0, params=False):
+    """Create a macro usage report from the local macro index."""
+    if ctx.obj.entity != 'macro':
+        raise click.LoggedFailure('Only macros are indexed locally, not "{}"'.format(ctx.obj.entity))
+
+    index = macros.MacroIndex()
+    try:
+        if params:
+            with record_writer(ctx, fields=('macro', 'parameter', 'pages', 'count')) as out:
+                for record in index.parameters(query, spaces=ctx.obj.spaces):
+                    out.write(record)
         else:
-            print('Got {} results.'.format(len(response.results)))
-            if response.results:
-                print_result(ctx, response.results[0])
+            with record_writer(ctx, fields=USAGE_FIELDS) as out:
+                for rank, record in enumerate(index.usage(query, spaces=ctx.obj.spaces, top=top), 1):
+                    record.rank = rank if top else None
+                    out.write(record)
+    finally:
+        index.close()
+
+
+@stats.command()
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of concurrent API requests.")
+@click.pass_context
+def index(ctx, workers=4):
+    """Update the local macro index of the selected spaces."""
+    if not ctx.obj.spaces:
+        click.serror("No --space selected!")
+        return
+
+    def fetch(page):
+        "Load a page with its body."
+        return cf.get(page._links.self, expand='space,version,body.storage')
+
+    macro_index = macros.MacroIndex()
+    try:
+        with api.context() as cf:
+            if cf.mirror:
+                # Scan the bodies of the local mirror
+                for space_key in ctx.obj.spaces:
+                    known, scanned = macro_index.versions(space_key), 0
+                    for page_id, _, title, version, body in cf.mirror.iter_bodies(space_key):
+                        known.pop(page_id, None)
+                        scanned += macro_index.update(page_id, space_key, title, version, body)
+                    macro_index.remove(known)
+                    ctx.obj.log.info('%s: indexed %d changed mirrored pages, dropped %d',
+                                     space_key, scanned, len(known))
+                return
+
+            for space_key in ctx.obj.spaces:
+                known = macro_index.versions(space_key)
+                cql = 'type=page AND space="{}"'.format(space_key)
+                changed, seen = [], set()
+                for page in cf.getall('content/search', cql=cql, expand='version', _prefetch=True):
+                    seen.add(page.id)
+                    if known.get(page.id, 0) < page.version.number:
+                        changed.append(page)
+                macro_index.remove(set(known) - seen)
+
+                scanned = 0
+                for page, data, error in iter_concurrently(fetch, changed, workers=workers):
+                    if error:
+                        ctx.obj.log.error('Cannot load page#%s "%s": %s', page.id, page.title, error)
+                    elif macro_index.update(data.id, data.space.key, data.title,
+                                            data.version.number, data.body.storage.value):
+                        scanned += 1
+                ctx.obj.log.info('%s: indexed %d changed of %d pages, dropped %d',
+                                 space_key, scanned, len(seen), len(set(known) - seen))
+    finally:
+        macro_index.close()
 
 
 @stats.command()
+@click.option('--resume', metavar='JOB', default=None,
+              help="Continue an interrupted export, writing only the records still missing.")
 @click.argument('rootpage')
 @click.pass_context
-def tree(ctx, rootpage):
-    """Export metadata of a page tree."""
+def tree(ctx, rootpage, resume=None):
+    """ Export metadata of a page tree.
+
+        Exported pages are recorded in a journal, after their records
+        are flushed to the output. A resumed export writes only the
+        remaining records, so only appendable formats (ndjson, dict,
+        yaml, csv, tsv) are journaled and can be resumed.
+    """
     if not rootpage:
         click.serror("No root page selected via --entity!")
         return 1
 
-    outname = getattr(ctx.obj.outfile, 'name', None)
+    serializer = record_serializer(ctx)
+    appendable = export.WRITERS[serializer].appendable
+    if resume and not appendable:
+        raise click.LoggedFailure('Cannot resume a "{}" export, only appendable formats like ndjson'
+                                  .format(serializer))
 
-    with api.context() as cf:
-        results = []
-        try:
-            #page = content.ConfluencePage(cf, rootpage, expand='metadata.labels,metadata.properties')
-            #results.append(page.json)
-            pagetree = cf.walk(rootpage, depth_1st=True,
-                               expand='metadata.labels,metadata.properties,version')
-            for depth, data in pagetree:
-                data.update(dict(depth=depth))
-                results.append(data)
-        except api.ERRORS as cause:
-            # Just log and otherwise ignore any errors
-            api.diagnostics(cause)
-        else:
-            ctx.obj.log.info('Got {} results.'.format(len(results)))
-            if results:
-                print_result(ctx, results)
+    with api.context() as cf, journals.Journal.start('stats tree', [rootpage], resume=resume,
+                                                     enabled=appendable) as journal:
+        complete = False
+        # Records get journaled in batches, and only once they are flushed,
+        # so an interrupted export may repeat but never lose records.
+        pending = []
+        options = dict(header=False) if resume and issubclass(export.WRITERS[serializer], export.CsvWriter) else {}
+        with record_writer(ctx, **options) as out:
+            def checkpoint():
+                "Helper"
+                out.flush()
+                for page_id in pending:
+                    journal.record(page_id)
+                del pending[:]
+
+            try:
+                pagetree = cf.walk(rootpage, depth_1st=True,
+                                   expand='metadata.labels,metadata.properties,version')
+                for depth, data in pagetree:
+                    if data.id in journal:
+                        continue
+                    data.update(dict(depth=depth))
+                    out.write(data)
+                    pending.append(data.id)
+                    metrics.REGISTRY.inc('records_exported_total')
+                    if len(pending) >= CHECKPOINT_RECORDS:
+                        checkpoint()
+            except api.ERRORS as cause:
+                # Just log and otherwise ignore any errors
+                api.diagnostics(cause)
+            else:
+                complete = True
+            checkpoint()
+        if complete:
+            journal.finish()
+        ctx.obj.log.info('Got {} results.'.format(out.count))
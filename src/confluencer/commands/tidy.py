@@ -20,38 +20,71 @@ from __future__ import absolute_import, unicode_literals, print_function
 from rudiments.reamed import click
 
 from .. import config, api
-from ..tools import content
+from ..util import metrics
+from ..tools import batch, bulk, content, journal as journals
 
 
 @config.cli.command()
 @click.option('--diff', is_flag=True, default=False, help='Show differences after tidying.')
-@click.option('-n', '--no-save', '--dry-run', count=True,
+@click.option('-n', '--no-save', '--dry-run', 'dry_run', count=True,
               help="Only show differences after tidying, don't apply them (use twice for no diff).")
 @click.option('-R', '--recursive', is_flag=True, default=False, help='Handle all descendants.')
+@click.option('-F', '--from-file', metavar='FILE', type=click.File('r'), default=None,
+              help="Read page references (URLs or IDs) line by line, '-' for stdin.")
+@click.option('-w', '--workers', metavar='N', default=4, type=int,
+              help="Number of concurrent API requests.")
+@click.option('--resume', metavar='JOB', default=None,
+              help="Continue an interrupted job, skipping the pages it already handled.")
 @click.argument('pages', metavar='‹page-url›…', nargs=-1)
 @click.pass_context
-def tidy(ctx, pages, diff=False, dry_run=0, recursive=False):
-    """Tidy pages after cut&paste migration from other wikis."""
-    with api.context() as cf:
-        for page_url in pages:
-            try:
-                page = content.ConfluencePage(cf, page_url)
-            except api.ERRORS as cause:
-                # Just log and otherwise ignore any errors
-                api.diagnostics(cause)
-            else:
-                ##print(page._data); xxx
+def tidy(ctx, pages, diff=False, dry_run=0, recursive=False, from_file=None, workers=4, resume=None):
+    """ Tidy pages after cut&paste migration from other wikis.
+
+        Handled pages are recorded in a journal, so an interrupted
+        run can be continued with '--resume'.
+    """
+    with api.context() as cf, journals.Journal.start('tidy', pages, resume=resume, enabled=not dry_run) as journal:
+        failed = []
+
+        def changes():
+            "Helper"
+            refs = (i for i in batch.iter_refs(pages, from_file) if batch.page_id_of(i) not in journal)
+            for ref, data, error in batch.iter_pages(cf, refs, expand='space,version,body.storage', workers=workers):
+                if error:
+                    # Just log and otherwise ignore any errors
+                    batch.report_error(ctx.obj.log, ref, error)
+                    failed.append(ref)
+                    continue
+                if data.id in journal:
+                    continue
+                metrics.REGISTRY.inc('pages_processed_total')
+
+                page = content.ConfluencePage(cf, data._links.self, data=data)
                 body = page.tidy(log=ctx.obj.log)
                 if body == page.body:
                     ctx.obj.log.info('No changes for "%s"', page.title)
+                    journal.record(page.page_id)
                 else:
                     if diff or dry_run == 1:
                         page.dump_diff(body)
                     if dry_run:
                         ctx.obj.log.info('WOULD save page#{0} "{1}" as v. {2}'.format(page.page_id, page.title, page.version + 1))
                     else:
-                        result = page.update(body)
-                        if result:
-                            ctx.obj.log.info('Updated page#{id} "{title}" to v. {version.number}'.format(**result))
-                        else:
-                            ctx.obj.log.info('Changes not saved for "%s"', page.title)
+                        yield page, bulk.precomputed(
+                            content._apply_tidy_regex_rules, page.body, body)  # pylint: disable=protected-access
+
+        updater = bulk.BulkUpdater(cf, workers=workers, log=ctx.obj.log)
+        for result in updater.run(changes()):
+            if result.status == 'updated':
+                ctx.obj.log.info('Updated page#{page_id} "{title}" to v. {version}'.format(**result))
+            elif result.status == 'unchanged':
+                ctx.obj.log.info('Changes not saved for "%s"', result.title)
+            if result.status == 'failed':
+                failed.append(result.ref)
+            else:
+                journal.record(result.page_id)
+
+        if journal.resumed:
+            ctx.obj.log.info('Skipped %d pages already handled by job "%s"', journal.resumed, journal.job)
+        if not failed:
+            journal.finish()
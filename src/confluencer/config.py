@@ -24,7 +24,6 @@ import shutil
 
 from rudiments.reamed.click import Configuration  # noqa pylint: disable=unused-import
 
-from ._compat import iteritems
 
 # Determine path this command is located in (installed to)
 try:
@@ -45,25 +44,28 @@ cli = None  # pylint: disable=invalid-name
 cfg = None  # pylint: disable=invalid-name
 
 
+def package_version(_cache={}):  # pylint: disable=dangerous-default-value
+    """Return the version of the installed package, from its metadata (cached)."""
+    if 'version' not in _cache:
+        from . import __version__
+
+        _cache['version'] = __version__
+        try:
+            from importlib import metadata
+        except ImportError:  # Python < 3.8
+            pass
+        else:
+            try:
+                _cache['version'] = metadata.version(__package__)
+            except metadata.PackageNotFoundError:
+                pass  # running from a source tree
+    return _cache['version']
+
+
 def version_info(ctx=None):
     """Return version information just like --version does."""
-    from . import __version__
-
     prog = ctx.find_root().info_name if ctx else APP_NAME
-    version = __version__
-    try:
-        import pkg_resources
-    except ImportError:
-        pass
-    else:
-        for dist in iter(pkg_resources.working_set):
-            scripts = dist.get_entry_map().get('console_scripts') or {}
-            for _, entry_point in iteritems(scripts):
-                if entry_point.module_name == (__package__ + '.__main__'):
-                    version = dist.version
-                    break
-
-    return VERSION_INFO % dict(prog=prog, version=version)
+    return VERSION_INFO % dict(prog=prog, version=package_version())
 
 
 def envvar(name, default=None):
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Warm background process, and the thin client forwarding commands to it.
+
+    A daemon started by ``cfr serve`` listens on a Unix socket. The client
+    side in :py:func:`forward` sends the command line, working directory and
+    environment, passing its own stdin, stdout and stderr as file descriptors
+    (``SCM_RIGHTS``). The daemon runs the command with these streams, one
+    command at a time, and returns the exit code.
+
+    The socket lives in a private directory, and both sides check that
+    the peer runs as the same user before exchanging anything. Only the
+    environment variables a command needs are forwarded (see
+    :py:func:`forwarded_env`).
+
+    This module is imported on every CLI call, so keep its imports light.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import sys
+import json
+import array
+import socket
+import struct
+
+from . import config
+
+
+# Commands that always run in the calling process
+NOT_FORWARDED = ('serve', 'rm')
+
+# Environment variables passed on to the daemon, by name or prefix
+FORWARDED_ENV_NAMES = (
+    'HOME', 'LANG', 'LANGUAGE', 'TERM', 'COLUMNS', 'LINES', 'TZ', 'NO_COLOR',
+    'REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE',
+    'HTTP_PROXY', 'HTTPS_PROXY', 'NO_PROXY', 'ALL_PROXY', 'http_proxy', 'https_proxy', 'no_proxy', 'all_proxy',
+)
+FORWARDED_ENV_PREFIXES = ('CONFLUENCE_', 'CONFLUENCER_', 'LC_', 'XDG_')
+
+HEADER = struct.Struct('!I')  # length of a JSON message
+STD_FDS = (0, 1, 2)
+
+
+def socket_path():
+    """ Return the path of the daemon's socket.
+
+        The default is in a per-user directory below ``XDG_RUNTIME_DIR``,
+        or the temp directory.
+    """
+    import tempfile
+
+    return config.envvar('socket') or os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+        '{}-{}'.format(config.APP_NAME or 'confluencer', os.getuid()), 'daemon.sock')
+
+
+def make_private_dir(path):
+    """Create the directory of the socket ``path`` (mode 0700), if it is missing."""
+    dirname = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname, 0o700)
+    if not is_private(path, socket_file=False):
+        raise EnvironmentError('Directory "{}" is not private to the current user'.format(dirname))
+
+
+def is_private(path, socket_file=True):
+    """ Check that ``path`` and its directory belong to the current user.
+
+        The directory must not be writable by others. With ``socket_file``
+        set, ``path`` must be a socket owned by the current user.
+    """
+    import stat
+
+    try:
+        dir_stat = os.stat(os.path.dirname(os.path.abspath(path)))
+        if dir_stat.st_uid != os.getuid() or dir_stat.st_mode & 0o022:
+            return False
+        if socket_file:
+            sock_stat = os.lstat(path)
+            return sock_stat.st_uid == os.getuid() and stat.S_ISSOCK(sock_stat.st_mode)
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def peer_uid(sock):
+    """Return the user ID of the process at the other end of a Unix socket, or ``None`` if unknown."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = struct.Struct('3i')
+    _, uid, _ = creds.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, creds.size))
+    return uid
+
+
+def is_trusted_peer(sock):
+    """Check that the peer runs as the current user (where the OS can tell)."""
+    uid = peer_uid(sock)
+    return uid is None or uid == os.getuid()
+
+
+def is_forwarded_env(name):
+    """Is the environment variable ``name`` passed on to the daemon?"""
+    return name in FORWARDED_ENV_NAMES or name.startswith(FORWARDED_ENV_PREFIXES)
+
+
+def forwarded_env(environ=None):
+    """Return the environment variables passed on to the daemon."""
+    return {key: value for key, value in (os.environ if environ is None else environ).items()
+            if is_forwarded_env(key)}
+
+
+def value_options(cli):
+    """Return the option names of a (root) command that take a value."""
+    return [name for param in getattr(cli, 'params', ())
+            if param.param_type_name == 'option' and not param.is_flag and not param.count
+            for name in param.opts + param.secondary_opts]
+
+
+def subcommand(argv, value_opts=()):
+    """Return the name of the sub-command in ``argv``, skipping root options (and values of ``value_opts``)."""
+    args = iter(argv)
+    for arg in args:
+        if arg == '--':
+            return next(args, None)
+        if arg.startswith('-'):
+            if arg in value_opts:
+                next(args, None)
+            continue
+        return arg
+    return None
+
+
+def _recv_exactly(sock, size, data=b''):
+    """Receive until ``data`` has ``size`` bytes (or the peer closed)."""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def send_message(sock, obj, fds=()):
+    """Send a JSON message, optionally passing along file descriptors."""
+    data = json.dumps(obj).encode('utf-8')
+    data = HEADER.pack(len(data)) + data
+    ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))] if fds else []
+    sent = sock.sendmsg([data], ancillary)
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def recv_message(sock, maxfds=0):
+    """Receive a JSON message, and any passed file descriptors."""
+    fds = array.array('i')
+    data, ancillary, _, _ = sock.recvmsg(HEADER.size, socket.CMSG_SPACE(maxfds * fds.itemsize)) \
+        if maxfds else (sock.recv(HEADER.size), [], None, None)
+    for level, kind, fd_data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(fd_data[:len(fd_data) - (len(fd_data) % fds.itemsize)])
+    data = _recv_exactly(sock, HEADER.size, data)
+    if len(data) < HEADER.size:
+        return None, list(fds)
+    size = HEADER.unpack(data)[0]
+    return json.loads(_recv_exactly(sock, size).decode('utf-8')), list(fds)
+
+
+def forward(argv, prog_name, path=None, fds=STD_FDS, value_opts=()):
+    """ Run a command in the daemon, if one is running.
+
+        ``value_opts`` are the root options taking a value, to find the
+        sub-command in ``argv``. Returns the command's exit code, or ``None``
+        if the command has to be run locally.
+    """
+    if (os.environ.get('CONFLUENCER_NO_DAEMON') or not hasattr(socket, 'AF_UNIX')
+            or subcommand(argv, value_opts) in NOT_FORWARDED):
+        return None
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    if not is_private(path):
+        sys.stderr.write('{}: ignoring daemon socket "{}", it is not private to the current user\n'
+                         .format(prog_name, path))
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except (IOError, OSError):
+            return None  # stale socket
+        if not is_trusted_peer(sock):
+            sys.stderr.write('{}: ignoring daemon at "{}", it runs as another user\n'.format(prog_name, path))
+            return None
+        send_message(sock, dict(
+            argv=list(argv), prog_name=prog_name, cwd=os.getcwd(), env=forwarded_env(),
+            encoding=getattr(sys.stdout, 'encoding', None) or 'utf-8',
+        ), fds=fds)
+        reply, _ = recv_message(sock)
+    finally:
+        sock.close()
+
+    if reply is None:
+        sys.stderr.write('{}: daemon at "{}" did not answer\n'.format(prog_name, path))
+        return 1
+    return reply.get('exit', 1)
+
+
+class Daemon(object):
+    """ Serve CLI commands on a Unix socket, one at a time.
+
+        Warm API objects, cached compiled rules, and all imported
+        command modules are kept across commands.
+    """
+
+    def __init__(self, cli, path=None, idle_timeout=None, log=None):
+        import logging
+
+        self.cli = cli
+        self.value_opts = value_options(cli)
+        self.path = path or socket_path()
+        self.idle_timeout = idle_timeout
+        self.log = log or logging.getLogger('cfdaemon')
+        self.sock = None
+        self.running = False
+
+    def bind(self):
+        """Create the listening socket in a private directory, replacing a stale one."""
+        make_private_dir(self.path)
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except (IOError, OSError):
+                os.unlink(self.path)
+            else:
+                raise EnvironmentError('A daemon is already listening on "{}"'.format(self.path))
+            finally:
+                probe.close()
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # owner only
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self.sock.listen(16)
+        self.sock.settimeout(self.idle_timeout)
+
+    def close(self):
+        """Stop listening, and remove the socket."""
+        self.running = False
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def serve_forever(self):
+        """Handle requests until stopped, or idle for too long."""
+        if not self.sock:
+            self.bind()
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    conn, _ = self.sock.accept()
+                except socket.timeout:
+                    self.log.info('Idle for %s seconds, stopping', self.idle_timeout)
+                    break
+                try:
+                    conn.settimeout(None)
+                    if not is_trusted_peer(conn):
+                        self.log.warning('Refused a connection from user #%s', peer_uid(conn))
+                        continue
+                    self.handle(conn)
+                except Exception as cause:  # pylint: disable=broad-except
+                    self.log.exception('Failed to handle request: %s', cause)
+                finally:
+                    conn.close()
+        finally:
+            self.close()
+
+    def handle(self, conn):
+        """Handle a single request."""
+        request, fds = recv_message(conn, maxfds=len(STD_FDS))
+        try:
+            if not request:
+                return
+            if request.get('stop'):
+                self.running = False
+                send_message(conn, dict(exit=0))
+                return
+            if len(fds) != len(STD_FDS):
+                send_message(conn, dict(exit=1))
+                return
+            send_message(conn, dict(exit=self.run_command(request, fds)))
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def run_command(self, request, fds):
+        """Run a command with the client's streams, environment and working directory."""
+        import io
+        import logging
+        import traceback
+
+        argv = request['argv']
+        if subcommand(argv, self.value_opts) in NOT_FORWARDED:
+            return 2
+        encoding = request.get('encoding') or 'utf-8'
+        streams = (
+            io.open(fds[0], 'r', encoding=encoding, closefd=False),
+            io.open(fds[1], 'w', encoding=encoding, closefd=False, buffering=1),
+            io.open(fds[2], 'w', encoding=encoding, closefd=False, buffering=1),
+        )
+        saved_streams = sys.stdin, sys.stdout, sys.stderr
+        saved_env, saved_cwd = dict(os.environ), os.getcwd()
+        saved_handlers = logging.root.handlers[:]
+        self.log.debug('Running %r', argv)
+
+        try:
+            sys.stdin, sys.stdout, sys.stderr = streams
+            # Keep the daemon's own environment, except what the client forwards
+            os.environ.clear()
+            os.environ.update((key, value) for key, value in saved_env.items() if not is_forwarded_env(key))
+            os.environ.update((key, value) for key, value in (request.get('env') or {}).items()
+                              if is_forwarded_env(key))
+            os.chdir(request.get('cwd') or saved_cwd)
+            logging.root.handlers[:] = []  # so the command's logging goes to the client
+            try:
+                self.cli.main(args=argv, prog_name=request.get('prog_name'), standalone_mode=True)
+            except SystemExit as exc:
+                if exc.code is None or isinstance(exc.code, int):
+                    return exc.code or 0
+                sys.stderr.write('{}\n'.format(exc.code))
+                return 1
+            except Exception:  # pylint: disable=broad-except
+                traceback.print_exc()
+                return 1
+            return 0
+        finally:
+            for stream in streams[1:]:
+                try:
+                    stream.flush()
+                except (IOError, OSError, ValueError):
+                    pass
+            sys.stdin, sys.stdout, sys.stderr = saved_streams
+            logging.root.handlers[:] = saved_handlers
+            os.chdir(saved_cwd)
+            os.environ.clear()
+            os.environ.update(saved_env)
+
+
+def stop(path=None):
+    """Ask a running daemon to stop, return ``False`` if there is none."""
+    path = path or socket_path()
+    if not is_private(path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        if not is_trusted_peer(sock):
+            return False
+        send_message(sock, dict(stop=True))
+        recv_message(sock)
+    except (IOError, OSError):
+        return False
+    finally:
+        sock.close()
+    return True
@@ -0,0 +1,652 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" A local stand-in for a Confluence server, for integration tests and benchmarks.
+
+    :py:class:`FakeWiki` holds spaces, pages, and users in memory, and
+    implements the subset of the REST API that confluencer uses: content
+    (with expansions, versioning, trash and purge), child pages, labels,
+    CQL search (a subset, see :py:func:`parse_cql`), spaces and users.
+    It can generate synthetic spaces of a configurable size and shape,
+    with bodies resembling pages migrated from FosWiki.
+
+    :py:class:`Faults` injects latency, server errors, and throttling
+    (``429 Too Many Requests``). :py:class:`FakeServer` serves a wiki
+    over HTTP in a background thread; to run one from the shell, call
+    ``python -m confluencer.fakewiki --help``.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import json
+import time
+import random
+import threading
+import itertools
+import collections
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler  # pylint: disable=import-error
+    from SocketServer import ThreadingMixIn  # pylint: disable=import-error
+
+from .api import tiny_id
+from .util import cql as cql_parser
+from .util.cql import CqlError
+from ._compat import urlparse, parse_qs, urlencode
+
+
+API_PREFIX = '/rest/api/'
+DEFAULT_LIMIT = 25
+MAX_LIMIT = 200
+FIRST_PAGE_ID = 1000001
+EPOCH = 1500000000  # creation time of synthetic content
+
+WORDS = ('wiki page team process release server client deploy config build test user account '
+         'database network backup monitor alert service cluster node version document review '
+         'feature issue ticket sprint project budget meeting report status update migrate').split()
+
+
+class ApiError(Exception):
+    """An error response of the fake API."""
+
+    def __init__(self, status, message):
+        super(ApiError, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ~~~ CQL subset ~~~
+
+def parse_cql(cql):
+    """ Parse a CQL query into a predicate, taking a page record and the wiki.
+
+        See :py:mod:`confluencer.util.cql` for the supported syntax;
+        the fields are those in :py:data:`CQL_FIELDS`.
+    """
+    return _cql_predicate(cql_parser.parse(cql))
+
+
+def _cql_predicate(node):
+    """Compile a CQL syntax tree into a predicate."""
+    if node[0] == 'and':
+        terms = [_cql_predicate(i) for i in node[1]]
+        return lambda page, wiki: all(i(page, wiki) for i in terms)
+    if node[0] == 'or':
+        terms = [_cql_predicate(i) for i in node[1]]
+        return lambda page, wiki: any(i(page, wiki) for i in terms)
+    if node[0] == 'not':
+        inner = _cql_predicate(node[1])
+        return lambda page, wiki: not inner(page, wiki)
+    _, field, operator, values = node
+    if field not in CQL_FIELDS:
+        raise CqlError('Unsupported CQL field "{}"'.format(field))
+    return _cql_condition(field, operator, values)
+
+
+def _parse_date(value):
+    """Parse a CQL date (local time) into epoch seconds."""
+    value = value.replace('/', '-')
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            pass
+    raise CqlError('Bad CQL date "{}"'.format(value))
+
+
+# Getters for CQL fields, returning the list of values of a page
+CQL_FIELDS = dict(
+    type=lambda page, wiki: [page['type']],
+    id=lambda page, wiki: [str(page['id'])],
+    content=lambda page, wiki: [str(page['id'])],
+    space=lambda page, wiki: [page['space']],
+    title=lambda page, wiki: [page['title']],
+    text=lambda page, wiki: [page['title'] + '\n' + page['body']],
+    label=lambda page, wiki: page['labels'],
+    ancestor=lambda page, wiki: [str(i) for i in page['ancestors']],
+    parent=lambda page, wiki: [str(page['ancestors'][-1])] if page['ancestors'] else [],
+    creator=lambda page, wiki: [page['creator']],
+    created=lambda page, wiki: [page['created']],
+    lastmodified=lambda page, wiki: [page['when']],
+    macro=lambda page, wiki: re.findall(r'<ac:(?:structured-)?macro\b[^>]*?\bac:name="([^"]+)"', page['body']),
+)
+
+
+def _cql_condition(field, operator, values):
+    """Return the predicate for a single CQL condition."""
+    getter = CQL_FIELDS[field]
+    if field in ('created', 'lastmodified'):
+        values = [_parse_date(i) for i in values]
+    elif operator in ('~', '!~'):
+        values = [i.lower().replace('*', '') for i in values]
+
+    compare = {
+        '=': lambda actual: actual in values,
+        '!=': lambda actual: actual not in values,
+        '~': lambda actual: any(i in actual.lower() for i in values),
+        '!~': lambda actual: not any(i in actual.lower() for i in values),
+        '<': lambda actual: actual < values[0],
+        '<=': lambda actual: actual <= values[0],
+        '>': lambda actual: actual > values[0],
+        '>=': lambda actual: actual >= values[0],
+    }[operator]
+    if operator in ('!=', '!~'):
+        return lambda page, wiki: all(compare(i) for i in getter(page, wiki))
+    return lambda page, wiki: any(compare(i) for i in getter(page, wiki))
+
+
+# ~~~ Synthetic content ~~~
+
+def _sentence(rnd, words=12):
+    """Return a random sentence."""
+    text = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(words // 2, words)))
+    return text[0].upper() + text[1:] + '.'
+
+
+def synthetic_body(rnd, size=4000, foswiki=True, link_ids=()):
+    """ Return a storage format body of roughly ``size`` characters.
+
+        With ``foswiki`` set, the body contains the artifacts of content
+        copied from FosWiki that ``tidy`` cleans up. Links to the pages
+        in ``link_ids`` are mixed in.
+    """
+    parts, length, section = [], 0, 0
+    if foswiki and rnd.random() < 0.5:
+        parts.append('<a name="foswikiTOC"></a><div class="foswikiToc"><ul>'
+                     '<li><a href="#Section1">Section 1</a></li></ul></div>')
+    while length < size:
+        kind = 0.0 if foswiki and not section else rnd.random()  # FosWiki topics start with a header
+        if kind < 0.15:
+            section += 1
+            title = _sentence(rnd, 4)[:-1]
+            if foswiki:
+                part = ('<h2 class="foswikiTopic"><a name="Section{0}"></a>{0}. <span class="tok">&nbsp;</span>'
+                        '{1}</h2>'.format(section, title))
+            else:
+                part = '<h2>{}</h2>'.format(title)
+        elif kind < 0.5:
+            part = '<p>{}</p>'.format(' '.join(_sentence(rnd) for _ in range(rnd.randint(1, 4))))
+        elif kind < 0.6:
+            items = ''.join('<li>{}</li>'.format(_sentence(rnd, 6)) for _ in range(rnd.randint(2, 6)))
+            part = '<ul style="margin-left: 2.5em;">{}</ul>'.format(items) if foswiki else '<ul>{}</ul>'.format(items)
+        elif kind < 0.7:
+            rows = ''.join('<tr>{}</tr>'.format(''.join('<td>{}</td>'.format(rnd.choice(WORDS)) for _ in range(4)))
+                           for _ in range(rnd.randint(2, 8)))
+            part = '<table><tbody><tr><th>Name</th><th>Kind</th><th>Owner</th><th>State</th></tr>{}</tbody></table>' \
+                   .format(rows)
+        elif kind < 0.78:
+            code = '\n'.join('{} = {}'.format(rnd.choice(WORDS), rnd.randint(0, 999)) for _ in range(rnd.randint(2, 8)))
+            part = '<pre>{}</pre>'.format(code) if foswiki else (
+                   '<ac:structured-macro ac:name="code" ac:schema-version="1">'
+                   '<ac:plain-text-body><![CDATA[{}]]></ac:plain-text-body></ac:structured-macro>'.format(code))
+        elif kind < 0.85:
+            part = ('<ac:structured-macro ac:name="info" ac:schema-version="1"><ac:rich-text-body>'
+                    '<p>{}</p></ac:rich-text-body></ac:structured-macro>'.format(_sentence(rnd)))
+        elif kind < 0.92 and link_ids:
+            page_id = rnd.choice(link_ids)
+            part = '<p>See <a href="/pages/viewpage.action?pageId={}">{}</a> and <a href="/x/{}">this</a>.</p>' \
+                   .format(page_id, rnd.choice(WORDS), tiny_id(page_id))
+        elif foswiki:
+            part = '<p>&nbsp;</p>'
+        else:
+            part = '<p>{}</p>'.format(_sentence(rnd))
+        parts.append(part)
+        length += len(part)
+    return ''.join(parts)
+
+
+class Faults(object):
+    """ Injected latency and failures.
+
+        ``latency`` (plus a random ``jitter``) is the delay of each request
+        in seconds. ``error_rate`` and ``throttle_rate`` are the probabilities
+        of a request failing with ``500``, or being rejected with ``429``.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Return the delay for a request."""
+        with self._lock:
+            return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def failure(self):
+        """Return the status of an injected failure, or ``None``."""
+        with self._lock:
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                return 429
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 500
+        return None
+
+
+class FakeWiki(object):
+    """ Content and REST API of a fake Confluence instance.
+
+        All state is kept in memory, and access is serialized by a lock.
+        :py:attr:`requests` counts the handled requests per
+        ``(method, endpoint)``.
+    """
+
+    def __init__(self, base_url='http://localhost', faults=None):
+        self.base_url = base_url.rstrip('/')
+        self.faults = faults or Faults()
+        self.spaces = collections.OrderedDict()
+        self.pages = {}
+        self.children = collections.defaultdict(list)
+        self.users = collections.OrderedDict()
+        self.requests = collections.Counter()
+        self._ids = itertools.count(FIRST_PAGE_ID)
+        self._lock = threading.RLock()
+        self.add_user('admin', 'Administrator')
+
+    # ~~~ Content ~~~
+
+    def add_user(self, username, display_name=None):
+        """Add a user."""
+        self.users[username] = dict(username=username, userKey='key-' + username,
+                                    displayName=display_name or username.title())
+
+    def add_space(self, key, name=None):
+        """Add a space, including its home page."""
+        with self._lock:
+            self.spaces[key] = dict(key=key, name=name or 'Space {}'.format(key), homepage=None)
+            home = self.add_page(key, '{} Home'.format(self.spaces[key]['name']), '<p>Welcome!</p>')
+            self.spaces[key]['homepage'] = home['id']
+            return self.spaces[key]
+
+    def add_page(self, space_key, title, body='', parent_id=None, labels=(), creator='admin', when=None):
+        """Add a page, and return its record."""
+        with self._lock:
+            if space_key not in self.spaces:
+                raise ApiError(404, 'No space with key : {}'.format(space_key))
+            if any(i['title'] == title and i['space'] == space_key and i['status'] == 'current'
+                   for i in self.pages.values()):
+                raise ApiError(400, 'A page with this title already exists: {}'.format(title))
+            page_id = next(self._ids)
+            if parent_id is None and self.spaces[space_key]['homepage']:
+                parent_id = self.spaces[space_key]['homepage']
+            ancestors = self.pages[parent_id]['ancestors'] + [parent_id] if parent_id else []
+            when = EPOCH + (page_id - FIRST_PAGE_ID) * 60 if when is None else when
+            self.pages[page_id] = dict(
+                id=page_id, type='page', status='current', title=title, space=space_key,
+                ancestors=ancestors, body=body, labels=list(labels), creator=creator, created=when,
+                version=1, when=when, by=creator, minor=False,
+            )
+            if parent_id:
+                self.children[parent_id].append(page_id)
+            return self.pages[page_id]
+
+    def generate(self, spaces=1, pages=100, fanout=5, depth=4, body_size=4000, foswiki=0.5,
+                 labels=('howto', 'reference', 'draft', 'archive'), seed=0):
+        """ Add synthetic spaces, each with up to ``pages`` pages below its home page.
+
+            The page trees are filled breadth first, with ``fanout``
+            children per page, and at most ``depth`` levels below the
+            home page. A ``foswiki`` fraction of the bodies contains
+            artifacts of a FosWiki migration.
+        """
+        rnd = random.Random(seed)
+        for number in range(spaces):
+            key = 'SYN{}'.format(len(self.spaces) + 1) if number or 'SYN' in self.spaces else 'SYN'
+            space = self.add_space(key, 'Synthetic space {}'.format(key))
+            queue, created = collections.deque([(space['homepage'], 0)]), []
+            while queue and len(created) < pages:
+                parent_id, level = queue.popleft()
+                if level >= depth:
+                    continue
+                for _ in range(fanout):
+                    if len(created) >= pages:
+                        break
+                    page = self.add_page(
+                        key, '{} {} {}'.format(key, _sentence(rnd, 3)[:-1], len(created) + 1),
+                        synthetic_body(rnd, body_size, foswiki=rnd.random() < foswiki, link_ids=created[-20:]),
+                        parent_id=parent_id, labels=rnd.sample(labels, rnd.randint(0, 2)) if labels else (),
+                    )
+                    created.append(page['id'])
+                    queue.append((page['id'], level + 1))
+        return self
+
+    # ~~~ Rendering ~~~
+
+    def _user(self, username):
+        """Render a user."""
+        user = self.users.get(username) or dict(username=username, userKey='key-' + username, displayName=username)
+        return dict(user, type='known', _links=dict(self='{}/rest/api/user?key={}'.format(self.base_url, user['userKey'])))
+
+    def _space(self, key):
+        """Render a space."""
+        space = self.spaces[key]
+        return dict(id=sorted(self.spaces).index(key) + 1, key=key, name=space['name'], type='global',
+                    _links=dict(self='{}/rest/api/space/{}'.format(self.base_url, key), webui='/display/' + key))
+
+    @staticmethod
+    def _when(timestamp):
+        """Render a timestamp."""
+        return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
+
+    def _page(self, page, expand=()):
+        """Render a page, with the given expansions."""
+        result = dict(
+            id=str(page['id']), type=page['type'], status=page['status'], title=page['title'],
+            _links=dict(self='{}/rest/api/content/{}'.format(self.base_url, page['id']),
+                        webui='/pages/viewpage.action?pageId={}'.format(page['id']),
+                        tinyui='/x/' + tiny_id(page['id'])),
+        )
+        result['_expandable'] = dict(space='/rest/api/space/' + page['space'],
+                                     children='/rest/api/content/{}/child'.format(page['id']))
+        if 'space' in expand:
+            result['space'] = self._space(page['space'])
+        if 'version' in expand:
+            result['version'] = dict(number=page['version'], when=self._when(page['when']),
+                                     minorEdit=page['minor'], by=self._user(page['by']))
+        if 'history' in expand:
+            result['history'] = dict(latest=page['status'] == 'current', createdDate=self._when(page['created']),
+                                     createdBy=self._user(page['creator']))
+        for markup in ('storage', 'view', 'editor'):
+            if 'body.' + markup in expand:
+                result.setdefault('body', {})[markup] = dict(value=page['body'], representation=markup)
+        if 'ancestors' in expand:
+            result['ancestors'] = [self._page(self.pages[i]) for i in page['ancestors'] if i in self.pages]
+        if 'metadata.labels' in expand:
+            result.setdefault('metadata', {})['labels'] = self._labels(page)
+        if 'metadata.properties' in expand:
+            result.setdefault('metadata', {})['properties'] = {}
+        return result
+
+    @staticmethod
+    def _labels(page):
+        """Render the labels of a page."""
+        results = [dict(prefix='global', name=i, id=str(abs(hash(i)) % 100000)) for i in page['labels']]
+        return dict(results=results, start=0, limit=200, size=len(results))
+
+    def _paged(self, endpoint, query, items, render, **extra):
+        """Render a paginated list of results."""
+        start = int(query.get('start', 0))
+        limit = min(int(query.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        chunk = items[start:start + limit]
+        links = dict(base=self.base_url, context='',
+                     self='{}{}{}'.format(self.base_url, API_PREFIX, endpoint))
+        if start + limit < len(items):
+            links['next'] = '{}{}?{}'.format(API_PREFIX, endpoint,
+                                             urlencode(sorted(dict(query, start=start + limit, limit=limit).items())))
+        return dict(results=[render(i) for i in chunk], start=start, limit=limit, size=len(chunk),
+                    _links=links, **extra)
+
+    # ~~~ Request handling ~~~
+
+    def _current(self, page_id, status='current'):
+        """Return a page record, or raise a 404."""
+        page = self.pages.get(int(page_id))
+        if page is None or page['status'] != status:
+            raise ApiError(404, 'No content found with id: {}'.format(page_id))
+        return page
+
+    def handle(self, method, url, data=None):
+        """ Handle an API request, and return ``(status, headers, payload)``.
+
+            Faults are injected before the request is processed.
+        """
+        parsed = urlparse(url)
+        path = parsed.path
+        query = dict((key, values[-1]) for key, values in parse_qs(parsed.query).items())
+        endpoint = re.sub(r'(?<![^/])\d+(?![^/])', '{id}', path[len(API_PREFIX):].strip('/')) \
+                   if path.startswith(API_PREFIX) else path
+        with self._lock:
+            self.requests[method, endpoint] += 1
+
+        delay = self.faults.delay()
+        if delay:
+            time.sleep(delay)
+        failure = self.faults.failure()
+        if failure == 429:
+            return 429, {'Retry-After': str(self.faults.retry_after)}, dict(statusCode=429, message='Rate limited')
+        if failure:
+            return failure, {}, dict(statusCode=failure, message='Injected failure')
+
+        try:
+            if not path.startswith(API_PREFIX):
+                raise ApiError(404, 'Not found: {}'.format(path))
+            with self._lock:
+                status, payload = self._dispatch(method, path[len(API_PREFIX):].strip('/'), query, data)
+        except CqlError as cause:
+            return 400, {}, dict(statusCode=400, message=str(cause))
+        except ApiError as cause:
+            return cause.status, {}, dict(statusCode=cause.status, message=cause.message)
+        return status, {}, payload
+
+    def _dispatch(self, method, path, query, data):  # pylint: disable=too-many-return-statements, too-many-branches
+        """Route a request, and return ``(status, payload)``."""
+        expand = set(query.get('expand', '').split(','))
+        parts = path.split('/')
+
+        if parts[0] == 'content':
+            if len(parts) == 1:
+                if method == 'POST':
+                    return 200, self._create(data or {})
+                pages = [i for i in sorted(self.pages.values(), key=lambda i: i['id'])
+                         if i['status'] == query.get('status', 'current')
+                         and i['type'] == query.get('type', 'page')
+                         and query.get('spaceKey', i['space']) == i['space']
+                         and query.get('title', i['title']) == i['title']]
+                return 200, self._paged(path, query, pages, lambda i: self._page(i, expand))
+            if parts[1] == 'search' and len(parts) == 2:
+                if 'cql' not in query:
+                    raise ApiError(400, 'The CQL query parameter is required')
+                predicate = parse_cql(query['cql'])
+                pages = [i for i in sorted(self.pages.values(), key=lambda i: i['id'])
+                         if i['status'] == 'current' and predicate(i, self)]
+                return 200, self._paged(path, query, pages, lambda i: self._page(i, expand), totalSize=len(pages))
+            if not parts[1].isdigit():
+                raise ApiError(404, 'Not found: {}'.format(path))
+
+            page_id = int(parts[1])
+            if len(parts) == 2:
+                if method == 'GET':
+                    return 200, self._page(self._current(page_id, query.get('status', 'current')), expand)
+                if method == 'PUT':
+                    return 200, self._update(self._current(page_id), data or {})
+                if method == 'DELETE':
+                    if 'trashed' in (query.get('status'), (data or {}).get('status')):
+                        del self.pages[self._current(page_id, 'trashed')['id']]
+                    else:
+                        page = self._current(page_id)
+                        if any(self.pages[i]['status'] == 'current' for i in self.children[page_id]):
+                            raise ApiError(400, 'Cannot delete a page with children')
+                        page['status'] = 'trashed'
+                    return 204, None
+            elif parts[2:] == ['child', 'page'] and method == 'GET':
+                self._current(page_id)
+                pages = [self.pages[i] for i in self.children[page_id]
+                         if i in self.pages and self.pages[i]['status'] == 'current']
+                return 200, self._paged(path, query, pages, lambda i: self._page(i, expand))
+            elif parts[2:] == ['label']:
+                page = self._current(page_id)
+                if method == 'POST':
+                    for label in data if isinstance(data, list) else [data or {}]:
+                        if label.get('name') and label['name'] not in page['labels']:
+                            page['labels'].append(label['name'])
+                return 200, self._labels(page)
+
+        elif parts[0] == 'space' and method == 'GET':
+            if len(parts) == 1:
+                return 200, self._paged(path, query, list(self.spaces), self._space)
+            if parts[1] in self.spaces and len(parts) == 2:
+                return 200, self._space(parts[1])
+            raise ApiError(404, 'No space with key : {}'.format(parts[1]))
+
+        elif parts[0] == 'user' and method == 'GET':
+            if parts[1:] == ['current']:
+                return 200, self._user('admin')
+            for user in self.users.values():
+                if query.get('username') == user['username'] or query.get('key') == user['userKey']:
+                    return 200, self._user(user['username'])
+            raise ApiError(404, 'No user found')
+
+        raise ApiError(404 if method == 'GET' else 405, 'Not supported: {} {}'.format(method, path))
+
+    def _create(self, data):
+        """Create a page from a POST request."""
+        try:
+            ancestors = data.get('ancestors') or []
+            page = self.add_page(data['space']['key'], data['title'],
+                                 ((data.get('body') or {}).get('storage') or {}).get('value', ''),
+                                 parent_id=int(ancestors[-1]['id']) if ancestors else None)
+        except (KeyError, TypeError, ValueError):
+            raise ApiError(400, 'Bad content data')
+        return self._page(page, {'space', 'version'})
+
+    def _update(self, page, data):
+        """Update a page from a PUT request, checking the version."""
+        try:
+            number = int(data['version']['number'])
+        except (KeyError, TypeError, ValueError):
+            raise ApiError(400, 'Missing version number')
+        if number != page['version'] + 1:
+            raise ApiError(409, 'Version must be incremented on update. Current version is: {}'
+                                .format(page['version']))
+        page['title'] = data.get('title') or page['title']
+        body = ((data.get('body') or {}).get('storage') or {}).get('value')
+        if body is not None:
+            page['body'] = body
+        page.update(version=number, when=time.time(), minor=bool(data['version'].get('minorEdit')), by='admin')
+        return self._page(page, {'space', 'version', 'body.storage'})
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling each connection in its own thread."""
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Pass requests on to the wiki of the server."""
+
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+    disable_nagle_algorithm = True  # else small responses stall on delayed ACKs
+
+    def _handle(self):
+        """Handle any request method."""
+        length = int(self.headers.get('Content-Length') or 0)
+        data = None
+        if length:
+            try:
+                data = json.loads(self.rfile.read(length).decode('utf-8'))
+            except ValueError:
+                data = None
+        status, headers, payload = self.server.wiki.handle(self.command, self.path, data)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        """Be quiet."""
+
+
+class FakeServer(object):
+    """ Serve a :py:class:`FakeWiki` over HTTP, in a background thread.
+
+        Use it as a context manager, :py:attr:`url` is the base URL
+        to use as the API endpoint.
+    """
+
+    def __init__(self, wiki=None, host='127.0.0.1', port=0):
+        self.wiki = wiki or FakeWiki()
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base URL of the server."""
+        return 'http://{}:{}'.format(self.host, self.httpd.server_port if self.httpd else self.port)
+
+    def start(self):
+        """Start serving."""
+        self.httpd = _ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.httpd.wiki = self.wiki
+        self.wiki.base_url = self.url
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='fakewiki')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+def main():
+    """Command line entry point, to run a fake server with synthetic content."""
+    from rudiments.reamed import click
+
+    @click.command()
+    @click.option('--host', default='127.0.0.1', help="Interface to listen on.")
+    @click.option('-p', '--port', default=8090, type=int, help="Port to listen on.")
+    @click.option('-s', '--spaces', default=1, type=int, help="Number of synthetic spaces.")
+    @click.option('-P', '--pages', default=100, type=int, help="Number of pages per space.")
+    @click.option('--fanout', default=5, type=int, help="Number of children per page.")
+    @click.option('--depth', default=4, type=int, help="Maximal depth of the page trees.")
+    @click.option('--body-size', default=4000, type=int, help="Approximate size of page bodies.")
+    @click.option('--latency', default=0.0, type=float, help="Delay of each request, in seconds.")
+    @click.option('--jitter', default=0.0, type=float, help="Maximal random extra delay, in seconds.")
+    @click.option('--error-rate', default=0.0, type=float, help="Fraction of requests failing with 500.")
+    @click.option('--throttle-rate', default=0.0, type=float, help="Fraction of requests rejected with 429.")
+    @click.option('--seed', default=0, type=int, help="Seed for content and fault generation.")
+    def serve(host, port, spaces, pages, fanout, depth, body_size, latency, jitter, error_rate, throttle_rate, seed):
+        """Run a fake Confluence server with synthetic content."""
+        faults = Faults(latency=latency, jitter=jitter, error_rate=error_rate, throttle_rate=throttle_rate, seed=seed)
+        wiki = FakeWiki(faults=faults).generate(spaces=spaces, pages=pages, fanout=fanout, depth=depth,
+                                                body_size=body_size, seed=seed)
+        with FakeServer(wiki, host=host, port=port) as server:
+            click.echo('Serving {} pages in {} space(s) at {}'.format(len(wiki.pages), len(wiki.spaces), server.url))
+            click.echo('Use: CONFLUENCE_BASE_URL={} cfr …  (Ctrl-C to stop)'.format(server.url))
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+
+    serve()  # pylint: disable=no-value-for-parameter
+
+
+if __name__ == '__main__':
+    main()
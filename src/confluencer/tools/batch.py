@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Streams of page references, e.g. read from ``stdin``.
+
+    References are resolved in batches: page IDs, ``viewpage`` URLs
+    and tiny links are mapped to IDs locally, and then loaded with one
+    ``id in (…)`` CQL search per batch. IDs the search misses (e.g. pages
+    not indexed yet) and other references (title URLs) are loaded one
+    by one. Batches are loaded concurrently, with a bounded number in
+    flight, so huge inputs stream in constant memory.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import itertools
+
+from .. import api
+from ..util import iter_concurrently
+
+
+BATCH_SIZE = 50  # pages loaded per search request
+
+# References that contain a page ID, or a tiny link code
+ID_REF = re.compile(r'^(\d+)$|/rest/api/content/(\d+)(?:[/?#]|$)|[?&]pageId=(\d+)')
+TINY_REF = re.compile(r'/x/([-_A-Za-z0-9]+)')
+
+
+def iter_refs(pages=(), stream=None):
+    """ Yield page references from ``pages``, then from the lines of ``stream``.
+
+        Empty lines and ``#`` comments are skipped.
+    """
+    for page in pages:
+        yield page
+    for line in stream or ():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def page_id_of(ref):
+    """Return the page ID of a reference, if it can be determined locally, else ``None``."""
+    matched = ID_REF.search(ref)
+    if matched:
+        return int(next(i for i in matched.groups() if i))
+    matched = TINY_REF.search(ref)
+    if matched:
+        try:
+            return api.page_ids_from_tiny_links([matched.group(1)])[0]
+        except ValueError:
+            pass
+    return None
+
+
+def load_batch(cf, refs, expand=None):
+    """ Load a batch of pages, with one search for all references with known IDs.
+
+        Pages the search does not return are requested directly, since the
+        search index can lag behind (or miss) existing pages.
+        Returns a list of ``(ref, data, error)`` tuples, in the order of ``refs``.
+    """
+    params = dict(expand=expand) if expand else {}
+    ids = [page_id_of(ref) for ref in refs]
+    found = {}
+    if any(ids):
+        cql = 'id in ({})'.format(', '.join(sorted(set(str(i) for i in ids if i))))
+        for data in cf.getall('content/search', cql=cql, **params):
+            found[int(data.id)] = (data, None)
+
+    result = []
+    for ref, page_id in zip(refs, ids):
+        loaded = found.get(page_id) if page_id else None
+        if loaded is None:
+            loaded = _load_one(cf, ref, page_id, params)
+            if page_id:
+                found[page_id] = loaded
+        result.append((ref,) + loaded)
+    return result
+
+
+def _load_one(cf, ref, page_id, params):
+    """Load a single page, by its ID if known, and return ``(data, error)``."""
+    try:
+        return cf.get('content/{}'.format(page_id) if page_id else ref, **params), None
+    except (api.ERRORS + (ValueError,)) as cause:
+        if page_id and getattr(getattr(cause, 'response', None), 'status_code', None) == 404:
+            cause = LookupError('No page #{} found'.format(page_id))
+        return None, cause
+
+
+def iter_pages(cf, refs, expand=None, batch_size=BATCH_SIZE, workers=4):
+    """ Yield ``(ref, data, error)`` for a stream of page references.
+
+        Results are yielded batch by batch, as they complete.
+    """
+    refs = iter(refs)
+    batches = iter(lambda: list(itertools.islice(refs, batch_size)), [])
+    loader = lambda batch: load_batch(cf, batch, expand=expand)
+    for batch, result, error in iter_concurrently(loader, batches, workers=workers):
+        for item in result or [(ref, None, error) for ref in batch]:
+            yield item
+
+
+def report_error(log, ref, error):
+    """Log a failed page reference."""
+    if isinstance(error, api.ERRORS):
+        api.diagnostics(error)
+    else:
+        log.error('%s: %s', ref, error)
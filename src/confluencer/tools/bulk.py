@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Bulk operations on many pages at once.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+import logging
+import threading
+
+import requests
+from munch import Munch as Bunch
+
+from .. import api
+from ..util import iter_concurrently, metrics, tracing
+from .._compat import string_types
+from .content import ConfluencePage
+
+
+HTTP_CONFLICT = 409
+
+
+def _is_conflict(cause):
+    """Check whether an API error is a version conflict."""
+    response = getattr(cause, 'response', None)
+    return isinstance(cause, requests.HTTPError) and getattr(response, 'status_code', None) == HTTP_CONFLICT
+
+
+class BulkUpdater(object):
+    """ Update many pages with bounded concurrency.
+
+        Each job is a ``(page, transform)`` pair, where ``page`` is either
+        a page URL or an already loaded :py:class:`ConfluencePage`, and
+        ``transform`` is a callable that maps the stored body to the new
+        one (a plain string is used as the new body verbatim).
+
+        On a version conflict, the page is loaded again, the transform
+        is re-applied to the latest body, and saving is retried.
+    """
+
+    def __init__(self, cf, workers=4, retries=3, minor=True, log=None):
+        self.cf = cf
+        self.workers = workers
+        self.retries = retries
+        self.minor = minor
+        self.log = log or logging.getLogger('cfbulk')
+        self.stats = Bunch(jobs=0, updated=0, unchanged=0, failed=0, conflicts=0, elapsed=0.0, rate=0.0)
+        self._lock = threading.Lock()
+
+    def _count(self, key, inc=1):
+        """Thread-safe stats counter increment."""
+        with self._lock:
+            self.stats[key] += inc
+
+    @tracing.traced('bulk.update')
+    def _update(self, job):
+        """Apply a single job, retrying on version conflicts."""
+        page, transform = job
+        if not callable(transform):
+            transform = (lambda body, _fixed=transform: _fixed)
+
+        result = Bunch(ref=page, page_id=None, title=None, status=None, version=None, attempts=0, error=None)
+        while True:
+            result.attempts += 1
+            if isinstance(page, string_types):
+                page = ConfluencePage(self.cf, page)
+            result.page_id, result.title = page.page_id, page.title
+
+            body = transform(page.body)
+            try:
+                saved = page.update(body, minor=self.minor)
+            except api.ERRORS as cause:
+                if not _is_conflict(cause) or result.attempts > self.retries:
+                    raise
+                self._count('conflicts')
+                metrics.REGISTRY.inc('page_update_retries_total')
+                self.log.info('Version conflict for page#%s "%s" (attempt %d), reloading',
+                              page.page_id, page.title, result.attempts)
+                page = page.url
+            else:
+                if saved:
+                    result.status, result.version = 'updated', saved.version.number
+                else:
+                    result.status, result.version = 'unchanged', page.version
+                return result
+
+    def run(self, jobs):
+        """ Process the given jobs, and yield a result per page as it completes.
+
+            The :py:attr:`stats` attribute holds the final throughput figures
+            after the generator is exhausted.
+        """
+        started = time.time()
+        try:
+            for job, result, error in iter_concurrently(self._update, jobs, workers=self.workers):
+                self._count('jobs')
+                if error:
+                    page = job[0]
+                    result = Bunch(ref=page, page_id=getattr(page, 'page_id', None),
+                                   title=getattr(page, 'title', None), status='failed',
+                                   version=None, attempts=None, error=error)
+                    self.log.error('Saving "%s" failed: %s', result.title or page, error)
+                self._count(result.status)
+                metrics.REGISTRY.inc('page_updates_total', status=result.status)
+                yield result
+        finally:
+            self.stats.elapsed = time.time() - started
+            self.stats.rate = self.stats.jobs / self.stats.elapsed if self.stats.elapsed else 0.0
+
+    def __call__(self, jobs):
+        """Process all jobs and return a list of results."""
+        return list(self.run(jobs))
+
+
+def precomputed(transform, original, result):
+    """ Return a job transform that knows its ``result`` for the ``original`` body.
+
+        If the page changed in the meantime (e.g. after a version conflict),
+        ``transform`` is applied to the latest body instead.
+    """
+    return lambda body: result if body == original else transform(body)
+
+
+def body_size(page, markup='storage'):
+    """Return the size of an expanded page body in bytes (UTF-8)."""
+    try:
+        return len(page.body[markup].value.encode('utf-8'))
+    except (AttributeError, KeyError):
+        return 0
+
+
+def purge_trash(cf, pages, workers=4, dry_run=False):
+    """ Permanently purge the given trashed pages, concurrently.
+
+        Yields ``(page, size, error)`` as each purge completes, where ``size``
+        is the page's storage body size (if the body was expanded).
+    """
+    def purge(page):
+        "Helper"
+        if not dry_run:
+            cf.purge_page(page)
+        return body_size(page)
+
+    for page, size, error in iter_concurrently(purge, pages, workers=workers):
+        yield page, size or 0, error
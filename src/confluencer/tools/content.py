@@ -19,6 +19,7 @@ from __future__ import absolute_import, unicode_literals, print_function
 
 import re
 import difflib
+import collections
 try:
     import html.entities as htmlentitydefs
 except ImportError:  # Python 2
@@ -31,13 +32,14 @@ from lxml.etree import fromstring, HTMLParser, XMLParser, XMLSyntaxError  # pyli
 from rudiments.reamed import click
 
 from .._compat import BytesIO
+from ..util import tracing
 
 
 # Mapping of CLI content format names to Confluence API names
 CLI_CONTENT_FORMATS = dict(view='view', editor='editor', storage='storage', export='export_view', anon='anonymous_export_view')
 
 # Simple replacement rules, order is important!
-TIDY_REGEX_RULES = ((_name, re.compile(_rule), _subst) for _name, _rule, _subst in [
+TIDY_REGEX_RULES = tuple((_name, re.compile(_rule), _subst) for _name, _rule, _subst in [
     ("FosWiki: Remove CSS class from section title",
      r'<(h[1-5]) class="[^"]*">', r'<\1>'),
     ("FosWiki: Remove static section numbering",
@@ -98,10 +100,24 @@ TIDY_REGEX_RULES = ((_name, re.compile(_rule), _subst) for _name, _rule, _subst
 ])
 
 
-def _apply_tidy_regex_rules(body, log=None):
-    """Return tidied body after applying regex rules."""
-    body = body.replace(u'\u00A0', '&nbsp;')
-    for name, rule, subst in TIDY_REGEX_RULES:
+def count_macros(body, name=None, _re=re.compile(r'<ac:(?:structured-)?macro\b[^>]*?\bac:name="([^"]+)"')):
+    """Count macro instances in a storage format body, optionally only the given one."""
+    counts = collections.Counter(_re.findall(body or ''))
+    if name:
+        counts = collections.Counter({name: counts[name]})
+    return counts
+
+
+def _apply_tidy_regex_rules(body, log=None, rules=None):
+    """ Return tidied body after applying regex rules.
+
+        ``rules`` is a sequence of ``(name, regex, subst)`` triples,
+        by default the built-in :py:data:`TIDY_REGEX_RULES`.
+    """
+    if rules is None:
+        rules = TIDY_REGEX_RULES
+        body = body.replace(u'\u00A0', '&nbsp;')
+    for name, rule, subst in rules:
         length = len(body)
         try:
             body, count = rule.subn(subst, body)
@@ -116,6 +132,7 @@ def _apply_tidy_regex_rules(body, log=None):
     return body
 
 
+@tracing.traced('content.parse')
 def _make_etree(body, content_format='storage', attrs=None):
     """Create an ElementTree from a page's body."""
     attrs = (attrs or {}).copy()
@@ -157,8 +174,12 @@ class ConfluencePage(object):
         '@': 'yellow',
     }
 
-    def __init__(self, cf, url, markup='storage', expand=None):
+    def __init__(self, cf, url, markup='storage', expand=None, data=None):
         """ Load the given page.
+
+            If ``data`` is passed, it is used instead of loading the page,
+            and must already include the ``space``, ``version`` and body
+            expansions (e.g. a result of a bulk search).
         """
         if expand and isinstance(expand, str):
             expand = expand.split(',')
@@ -167,7 +188,7 @@ class ConfluencePage(object):
         self.cf = cf
         self.url = url
         self.markup = markup
-        self._data = cf.get(self.url, expand=','.join(expand))
+        self._data = data if data is not None else cf.get(self.url, expand=','.join(expand))
         self.body = self._data.body[self.markup].value
 
     @property
@@ -197,19 +218,23 @@ class ConfluencePage(object):
 
     def etree(self):
         """Parse the page's body into an ElementTree."""
+        # Search results have no per-item base URL
+        base_url = self._data._links.get('base') or self.cf.base_url
         attrs = {
             'id': 'page-' + self._data.id,
-            'href': self._data._links.base + (self._data._links.tinyui or ''),
+            'href': base_url + (self._data._links.tinyui or ''),
             'status': self._data.status,
             'title': self._data.title,
         }
         return _make_etree(self.body, content_format=self.markup, attrs=attrs)
 
+    @tracing.traced('content.tidy')
     def tidy(self, log=None):
         """Return a tidy copy of this page's body."""
         assert self.markup == 'storage', "Can only clean up pages in storage format!"
         return _apply_tidy_regex_rules(self.body, log=log)
 
+    @tracing.traced('content.update')
     def update(self, body=None, minor=True):
         """Update a page's content."""
         assert self.markup == 'storage', "Cannot update non-storage page markup!"
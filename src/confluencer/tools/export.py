@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation, too-few-public-methods
+""" Streaming record serializers for data exports.
+
+    Each writer accepts one record (a nested dict, as returned by the API)
+    at a time and writes it out immediately, so exports of huge result sets
+    run in constant memory and produce output right from the start.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import os
+import re
+import csv
+import json
+import zipfile
+import tempfile
+from pprint import pformat
+from xml.sax.saxutils import escape
+
+from rudiments.reamed import click
+
+from .._compat import text_type, string_types
+
+
+# Flattened projection of page metadata, for tabular formats
+PAGE_FIELDS = (
+    'depth', 'id', 'type', 'status', 'title',
+    'version.number', 'version.when', 'version.by.username', 'version.by.displayName',
+    'metadata.labels', '_links.webui',
+)
+
+
+def lookup(record, field):
+    """ Get a value from a nested record via a dotted ``field`` path.
+
+        Lists of named entities (like labels) are joined into a comma-separated string.
+    """
+    value = record
+    for key in field.split('.'):
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    if isinstance(value, dict) and 'results' in value:
+        value = value['results']
+    if isinstance(value, list):
+        value = ','.join(text_type(i.get('name', i) if isinstance(i, dict) else i) for i in value)
+    elif isinstance(value, dict):
+        value = json.dumps(value, sort_keys=True)
+    return value
+
+
+def flatten(record, fields):
+    """Return the values of ``fields`` in a record, as a list."""
+    return [lookup(record, field) for field in fields]
+
+
+def _plain(record):
+    """Convert attribute dicts (``Bunch``, ``AttrDict``) to plain JSON data."""
+    if isinstance(record, dict):
+        return {text_type(k): _plain(v) for k, v in record.items()}
+    if isinstance(record, (list, tuple)):
+        return [_plain(i) for i in record]
+    return record
+
+
+class RecordWriter(object):
+    """ Base class for streaming writers, based on a binary output stream.
+
+        Use writers as context managers, or call :py:meth:`close` when done;
+        that finishes the output, but leaves the underlying stream open.
+
+        Writers of ``appendable`` formats produce a complete document after
+        each record, so the output of an interrupted export can be joined
+        with the rest written later.
+    """
+
+    binary = False
+    appendable = False
+
+    def __init__(self, stream, fields=None):
+        self.fields = fields or PAGE_FIELDS
+        self.count = 0
+        self.stream = stream
+        self.text = None if self.binary else io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write(self, record):
+        """Write a single record."""
+        self._write(record)
+        self.count += 1
+        if self.text:
+            self.text.flush()
+
+    def flush(self):
+        """Push the records written so far to the stream, and to disk where possible."""
+        if self.text:
+            self.text.flush()
+        self.stream.flush()
+        try:
+            os.fsync(self.stream.fileno())
+        except (AttributeError, EnvironmentError, ValueError):
+            pass  # not a file, e.g. a pipe or an in-memory buffer
+
+    def _write(self, record):
+        """Write a single record (the format-specific part)."""
+        raise NotImplementedError()
+
+    def _finish(self):
+        """Write any trailing output."""
+
+    def close(self):
+        """Finish the output, without closing the underlying stream."""
+        self._finish()
+        if self.text:
+            self.text.flush()
+            self.text.detach()
+            self.text = None
+
+
+class JsonWriter(RecordWriter):
+    """A JSON list, with one indented object per record."""
+
+    def _write(self, record):
+        text = json.dumps(_plain(record), indent=2, sort_keys=True)
+        self.text.write(('[\n' if not self.count else ',\n') + text)
+
+    def _finish(self):
+        self.text.write('\n]\n' if self.count else '[]\n')
+
+
+class NdjsonWriter(RecordWriter):
+    """Newline-delimited JSON, one compact object per line."""
+
+    appendable = True
+
+    def _write(self, record):
+        self.text.write(json.dumps(_plain(record), sort_keys=True, ensure_ascii=False) + '\n')
+
+
+class DictWriter(RecordWriter):
+    """Python literals, one pretty-printed dict per record."""
+
+    appendable = True
+
+    def _write(self, record):
+        self.text.write(pformat(_plain(record)) + '\n')
+
+
+class YamlWriter(RecordWriter):
+    """A stream of YAML documents, one per record."""
+
+    appendable = True
+
+    def __init__(self, stream, fields=None):
+        try:
+            import yaml
+        except ImportError:
+            raise click.LoggedFailure("YAML output needs the 'PyYAML' package, use 'pip install PyYAML'")
+        self._yaml = yaml
+        super(YamlWriter, self).__init__(stream, fields)
+
+    def _write(self, record):
+        self.text.write('---\n' + self._yaml.safe_dump(_plain(record), allow_unicode=True, default_flow_style=False))
+
+
+class CsvWriter(RecordWriter):
+    """Comma-separated values, with a header line and the flattened fields."""
+
+    appendable = True
+    dialect = 'excel'
+
+    def __init__(self, stream, fields=None, header=True):
+        super(CsvWriter, self).__init__(stream, fields)
+        self.csv = csv.writer(self.text, dialect=self.dialect)
+        if header:
+            self.csv.writerow(self.fields)
+
+    def _write(self, record):
+        self.csv.writerow(['' if i is None else i for i in flatten(record, self.fields)])
+
+
+class TsvWriter(CsvWriter):
+    """Tab-separated values, with a header line and the flattened fields."""
+
+    dialect = 'excel-tab'
+
+
+class HtmlWriter(RecordWriter):
+    """A simple HTML table, with the flattened fields."""
+
+    def __init__(self, stream, fields=None):
+        super(HtmlWriter, self).__init__(stream, fields)
+        self.text.write('<table>\n<tr>{}</tr>\n'.format(''.join('<th>{}</th>'.format(escape(i)) for i in self.fields)))
+
+    def _write(self, record):
+        self.text.write('<tr>{}</tr>\n'.format(''.join(
+            '<td>{}</td>'.format(escape(text_type('' if i is None else i))) for i in flatten(record, self.fields))))
+
+    def _finish(self):
+        self.text.write('</table>\n')
+
+
+# Characters that are not allowed in XML 1.0 documents
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _cell_value(value):
+    """Convert a flattened value to a spreadsheet cell value."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        value = ILLEGAL_XML_CHARS.sub('\ufffd', text_type(value))
+    return value
+
+
+class XlsxWriter(RecordWriter):
+    """ An Excel workbook, with the flattened fields.
+
+        Uses the write-only mode of ``openpyxl``, which streams rows
+        to a temporary file, so memory use stays constant.
+    """
+
+    binary = True
+
+    def __init__(self, stream, fields=None):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise click.LoggedFailure("XLSX output needs the 'openpyxl' package, use 'pip install openpyxl'")
+        super(XlsxWriter, self).__init__(stream, fields)
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Export')
+        self.sheet.append(list(self.fields))
+
+    def _write(self, record):
+        self.sheet.append([_cell_value(i) for i in flatten(record, self.fields)])
+
+    def _finish(self):
+        self.workbook.save(self.stream)
+
+
+class OdsWriter(RecordWriter):
+    """ An OpenDocument spreadsheet, with the flattened fields.
+
+        The document's ``content.xml`` is spooled to a temporary file row
+        by row, and compressed into the ZIP container when done (writing
+        into ZIP members needs Python 3.6).
+    """
+
+    binary = True
+    MIMETYPE = 'application/vnd.oasis.opendocument.spreadsheet'
+    MANIFEST = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0"'
+        ' manifest:version="1.2">'
+        '<manifest:file-entry manifest:full-path="/" manifest:media-type="{mimetype}"/>'
+        '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+        '</manifest:manifest>'
+    )
+    CONTENT_HEAD = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+        ' xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"'
+        ' xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2">'
+        '<office:body><office:spreadsheet><table:table table:name="Export">'
+    )
+    CONTENT_TAIL = '</table:table></office:spreadsheet></office:body></office:document-content>'
+
+    def __init__(self, stream, fields=None):
+        super(OdsWriter, self).__init__(stream, fields)
+        self.zip = zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED)
+        self.zip.writestr(zipfile.ZipInfo('mimetype'), self.MIMETYPE, compress_type=zipfile.ZIP_STORED)
+        self.zip.writestr('META-INF/manifest.xml', self.MANIFEST.format(mimetype=self.MIMETYPE))
+        handle, self.content_path = tempfile.mkstemp(prefix='confluencer-', suffix='.xml')
+        self.content = io.open(handle, 'wb')
+        self.content.write(self.CONTENT_HEAD.encode('utf-8'))
+        self._row(self.fields)
+
+    def _row(self, values):
+        """Write a table row."""
+        cells = []
+        for value in values:
+            value = _cell_value(value)
+            if value is None:
+                cells.append('<table:table-cell/>')
+            elif isinstance(value, (int, float)):
+                cells.append('<table:table-cell office:value-type="float" office:value="{0}">'
+                             '<text:p>{0}</text:p></table:table-cell>'.format(value))
+            else:
+                cells.append('<table:table-cell office:value-type="string"><text:p>{}</text:p></table:table-cell>'
+                             .format(escape(value)))
+        self.content.write('<table:table-row>{}</table:table-row>'.format(''.join(cells)).encode('utf-8'))
+
+    def _write(self, record):
+        self._row(flatten(record, self.fields))
+
+    def _finish(self):
+        self.content.write(self.CONTENT_TAIL.encode('utf-8'))
+        self.content.close()
+        try:
+            self.zip.write(self.content_path, 'content.xml')
+        finally:
+            os.remove(self.content_path)
+        self.zip.close()
+
+
+WRITERS = dict(
+    json=JsonWriter,
+    ndjson=NdjsonWriter,
+    dict=DictWriter,
+    yaml=YamlWriter,
+    csv=CsvWriter,
+    tsv=TsvWriter,
+    html=HtmlWriter,
+    xlsx=XlsxWriter,
+    ods=OdsWriter,
+)
+
+
+def serializer_for(filename, default='json'):
+    """Derive a serializer name from an output file's extension."""
+    ext = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    ext = dict(jsonl='ndjson', yml='yaml', htm='html', txt='dict').get(ext, ext)
+    return ext if ext in WRITERS else default
+
+
+def writer(serializer, stream, fields=None, **kwargs):
+    """Create a writer for the given serializer name."""
+    if not isinstance(serializer, string_types) or serializer not in WRITERS:
+        raise ValueError('Unknown serializer: {!r}'.format(serializer))
+    return WRITERS[serializer](stream, fields=fields, **kwargs)
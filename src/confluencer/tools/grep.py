@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Regex search in storage format page bodies.
+
+    Matching is CPU-bound, so batches of pages are handed to worker
+    processes. A literal string every match must contain is extracted
+    from the pattern, and pages without it are skipped cheaply before
+    they're ever pickled and sent to a worker.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse  # pylint: disable=deprecated-module
+    import sre_constants  # pylint: disable=deprecated-module
+
+from ..util import iter_concurrently
+
+
+MIN_LITERAL = 3  # shorter literals do not make a useful prefilter
+BATCH_SIZE = 50  # pages per task sent to a worker process
+
+_compiled = {}  # per-process cache of compiled patterns
+
+
+def required_literal(pattern, flags=0):
+    """ Return the longest literal string any match of ``pattern`` must contain.
+
+        Only literals in the top-level sequence of the pattern are
+        considered, anything inside groups, branches or repeats breaks
+        a literal run. Returns ``None`` if there is no such literal,
+        or it is too short to be useful, or the pattern ignores case.
+    """
+    if flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (re.error, sre_constants.error):
+        return None
+    state = getattr(parsed, 'state', None) or parsed.pattern  # renamed in Python 3.8
+    if state.flags & re.IGNORECASE:  # inline ``(?i)``
+        return None
+
+    best, run = '', []
+    for opcode, arg in list(parsed) + [(None, None)]:
+        if opcode == sre_constants.LITERAL:
+            run.append(chr(arg))
+        else:
+            if len(run) > len(best):
+                best = ''.join(run)
+            run = []
+    return best if len(best) >= MIN_LITERAL else None
+
+
+def _regex(pattern, flags):
+    """Return a compiled regex, cached per process."""
+    key = pattern, flags
+    if key not in _compiled:
+        _compiled[key] = re.compile(pattern, flags)
+    return _compiled[key]
+
+
+def match_lines(pattern, flags, body, only_matching=False):
+    """ Yield ``(lineno, text)`` for all matching lines of ``body``.
+
+        With ``only_matching``, each match is yielded on its own,
+        else the complete line it occurs in.
+    """
+    regex = _regex(pattern, flags)
+    lineno, pos = 1, 0
+    for match in regex.finditer(body):
+        lineno += body.count('\n', pos, match.start())
+        pos = match.start()
+        if only_matching:
+            yield lineno, match.group(0)
+        else:
+            start = body.rfind('\n', 0, pos) + 1
+            end = body.find('\n', match.end())
+            yield lineno, body[start:end if end >= 0 else len(body)]
+
+
+def grep_batch(args):
+    """ Match a batch of pages, in a worker process.
+
+        ``args`` is a ``(pattern, flags, only_matching, pages)`` tuple,
+        with ``pages`` being a list of ``(space_key, title, body)``.
+        Returns a list of ``(space_key, title, lineno, text)`` hits.
+    """
+    pattern, flags, only_matching, pages = args
+    hits = []
+    for space_key, title, body in pages:
+        last = None  # report a line with several matches only once
+        for lineno, text in match_lines(pattern, flags, body, only_matching=only_matching):
+            if only_matching or lineno != last:
+                hits.append((space_key, title, lineno, text))
+            last = lineno
+    return hits
+
+
+def _batches(pages, literal, size):
+    """Yield lists of pages that pass the literal prefilter."""
+    batch = []
+    for page in pages:
+        if literal and literal not in page[2]:
+            continue
+        batch.append(page)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def grep(pattern, pages, flags=0, only_matching=False, workers=4, batch_size=BATCH_SIZE):
+    """ Yield ``(space_key, title, lineno, text)`` for all matches in ``pages``.
+
+        ``pages`` is an iterable of ``(space_key, title, body)`` tuples.
+        The results of a page are kept together, but pages are reported
+        in the order their batches finish.
+    """
+    re.compile(pattern, flags)  # fail early, in the main process
+    literal = required_literal(pattern, flags)
+    tasks = ((pattern, flags, only_matching, batch) for batch in _batches(pages, literal, batch_size))
+    if workers <= 1:
+        for task in tasks:
+            for hit in grep_batch(task):
+                yield hit
+        return
+
+    for _, hits, error in iter_concurrently(grep_batch, tasks, workers=workers, processes=True):
+        if error:
+            raise error
+        for hit in hits:
+            yield hit
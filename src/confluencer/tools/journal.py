@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Durable journals of long-running operations.
+
+    A journal is an append-only file in the cache directory, with a
+    JSON header line describing the job, followed by the IDs of
+    all pages the job completed, one per line. An interrupted job
+    is resumed by loading its journal, and skipping those pages.
+    A final ``# finished`` line marks jobs that completed without errors.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import re
+import io
+import json
+import time
+import threading
+
+from munch import Munch as Bunch
+from rudiments.reamed import click
+
+from .. import config
+
+
+JOURNAL_DIR = 'journals'
+JOURNAL_EXT = '.journal'
+FINISHED = '# finished'
+SYNC_INTERVAL = 1.0  # max. seconds between fsync calls
+JOB_NAME = re.compile(r'^[-_.A-Za-z0-9]+$')
+
+
+def journal_dir(directory=None):
+    """Return the directory holding the journals, after creating it."""
+    directory = directory or config.cache_file(JOURNAL_DIR)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return directory
+
+
+def _read(path):
+    """Return header, set of completed page IDs, and finished flag of a journal file."""
+    header, done, finished = {}, set(), False
+    with io.open(path, 'r', encoding='utf-8') as handle:
+        for lineno, line in enumerate(handle):
+            line = line.strip()
+            if not lineno:
+                try:
+                    header = json.loads(line)
+                except ValueError:
+                    pass
+            elif line.isdigit():
+                done.add(int(line))
+            elif line.startswith(FINISHED):
+                finished = True
+            # anything else is a torn write from a crash, and ignored
+    return header, done, finished
+
+
+class Journal(object):
+    """ The journal of a single job.
+
+        Use :py:meth:`start` to create or resume one. Journals without
+        a ``path`` are kept in memory only (e.g. for dry runs).
+    """
+
+    def __init__(self, job, operation, path=None, done=(), header=None):
+        self.job = job
+        self.operation = operation
+        self.path = path
+        self.done = set(done)
+        self.header = header or {}
+        self.resumed = len(self.done)
+        self.finished = False
+        self._handle = None
+        self._synced = time.time()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, operation, args=(), resume=None, directory=None, enabled=True):
+        """ Create a new journal for ``operation``, or resume the job named in ``resume``.
+
+            If not ``enabled``, an in-memory journal is returned, which
+            still skips completed pages of a resumed job.
+        """
+        directory = journal_dir(directory)
+        if resume:
+            if not JOB_NAME.match(resume):
+                raise click.LoggedFailure('Bad journal name "{}"'.format(resume))
+            path = os.path.join(directory, resume + JOURNAL_EXT)
+            if not os.path.exists(path):
+                raise click.LoggedFailure('No journal "{}" found (see "journal list")'.format(resume))
+            header, done, _ = _read(path)
+            if header.get('operation') != operation:
+                raise click.LoggedFailure('Journal "{}" is for "{}", not "{}"'.format(
+                                          resume, header.get('operation'), operation))
+            journal = cls(resume, operation, path=path if enabled else None, done=done, header=header)
+        else:
+            job = '{}-{}-{}'.format(operation.replace(' ', '-'), time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+            header = dict(job=job, operation=operation, args=list(args),
+                          started=time.strftime('%Y-%m-%dT%H:%M:%S'), cwd=os.getcwd())
+            journal = cls(job, operation, path=os.path.join(directory, job + JOURNAL_EXT) if enabled else None,
+                          header=header)
+
+        if journal.path:
+            journal._handle = io.open(journal.path, 'a', encoding='utf-8')
+            if not resume:
+                journal._append(json.dumps(journal.header, sort_keys=True), sync=True)
+        return journal
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        self.close()
+        if self.path and not self.finished:
+            click.echo('Job "{0}" did not finish, continue it via "--resume {0}".'.format(self.job), err=True)
+
+    def __contains__(self, page_id):
+        return page_id is not None and int(page_id) in self.done
+
+    def __len__(self):
+        return len(self.done)
+
+    def _append(self, line, sync=False):
+        """Append a line to the file, and sync it to disk at least every ``SYNC_INTERVAL`` seconds."""
+        self._handle.write(line + '\n')
+        self._handle.flush()
+        now = time.time()
+        if sync or now - self._synced >= SYNC_INTERVAL:
+            os.fsync(self._handle.fileno())
+            self._synced = now
+
+    def record(self, page_id):
+        """Record a page as completed."""
+        page_id = int(page_id)
+        with self._lock:
+            if page_id in self.done:
+                return
+            self.done.add(page_id)
+            if self._handle:
+                self._append(str(page_id))
+
+    def finish(self):
+        """Mark the job as completed, so it can be cleaned up."""
+        with self._lock:
+            if self._handle:
+                self._append('{} {}'.format(FINISHED, time.strftime('%Y-%m-%dT%H:%M:%S')), sync=True)
+            self.finished = True
+        self.close()
+
+    def close(self):
+        """Sync and close the journal file."""
+        with self._lock:
+            if self._handle:
+                os.fsync(self._handle.fileno())
+                self._handle.close()
+                self._handle = None
+
+
+def list_journals(directory=None):
+    """Return information about all journals, oldest first."""
+    directory = journal_dir(directory)
+    result = []
+    for name in os.listdir(directory):
+        if not name.endswith(JOURNAL_EXT):
+            continue
+        path = os.path.join(directory, name)
+        header, done, finished = _read(path)
+        result.append(Bunch(
+            job=name[:-len(JOURNAL_EXT)], operation=header.get('operation'), args=header.get('args', []),
+            started=header.get('started'), modified=os.path.getmtime(path),
+            pages=len(done), finished=finished, path=path,
+        ))
+    return sorted(result, key=lambda i: i.modified)
+
+
+def clean(directory=None, older_than=None, unfinished=False):
+    """ Remove journals of finished jobs, and return them.
+
+        With ``unfinished`` set, also remove journals of incomplete jobs.
+        ``older_than`` restricts removal to journals not modified for
+        that many seconds.
+    """
+    removed = []
+    now = time.time()
+    for info in list_journals(directory):
+        if not (info.finished or unfinished):
+            continue
+        if older_than is not None and now - info.modified < older_than:
+            continue
+        os.remove(info.path)
+        removed.append(info)
+    return removed
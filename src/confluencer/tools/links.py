@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Rewrite and check page links in storage format.
+
+    Plain HTML links to other pages, in any of the forms
+    ``/x/‹tiny›``, ``/pages/viewpage.action?pageId=‹id›``, or
+    ``/display/‹space›/‹title›``, are bound to one Confluence instance.
+    Replacing them by ``ri:page`` resource identifiers (space key and title)
+    makes content portable. All lookups are done in a :py:class:`PageIndex`
+    loaded in bulk beforehand, so rewriting needs no API calls per link.
+
+    The same index is used to find broken links, after extracting them
+    from parsed page bodies in worker processes.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+import threading
+import collections
+from xml.sax.saxutils import quoteattr, unescape
+
+from rudiments.reamed import click
+
+from ..api import ERRORS, page_ids_from_tiny_links, tiny_ids
+from ..util import iter_concurrently
+from .._compat import urlparse, unquote_plus
+from .batch import BATCH_SIZE, load_batch
+from .content import _make_etree
+from .macros import AC_NS
+
+
+LINK_PATTERN = (r'<a\s[^>]*?\bhref="(?:{prefixes})'
+                r'(?:/x/(?P<tiny>[-_A-Za-z0-9]+)'
+                r'|/pages/viewpage\.action\?(?:[^"#]*?&amp;)?pageId=(?P<id>\d+)[^"#]*'
+                r'|/display/(?P<space>[^/"#?]+)/(?P<title>[^"#?]+))'
+                r'(?:#(?P<anchor>[^"]*))?"[^>]*>(?P<text>.*?)</a>')
+
+# Page link forms in (unescaped) URLs, after the wiki's base URL
+URL_TARGET = re.compile(r'/x/(?P<tiny>[-_A-Za-z0-9]+)'
+                        r'|/pages/viewpage\.action\?(?:[^#]*?&)?pageId=(?P<id>\d+)'
+                        r'|/display/(?P<space>[^/#?]+)/(?P<title>[^#?]+)')
+
+RI_NS = '{http://www.atlassian.com/schema/confluence/4/ri/}'
+
+
+class PageIndex(object):
+    """ Lookup tables for the pages of some spaces.
+
+        Maps page IDs to ``(space_key, title)`` and back,
+        plus *tiny link* codes to page IDs.
+    """
+
+    def __init__(self, pages=()):
+        self.by_id = {}
+        self.by_title = {}
+        self.by_tiny = {}
+        self.spaces = set()
+        self.update((page.id, page.space.key, page.title) for page in pages)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def update(self, entries):
+        """Add ``(page_id, space_key, title)`` entries to the index."""
+        entries = [(int(page_id), space_key, title) for page_id, space_key, title in entries]
+        for (page_id, space_key, title), tiny in zip(entries, tiny_ids(i[0] for i in entries)):
+            self.by_id[page_id] = (space_key, title)
+            self.by_title[space_key, title] = page_id
+            self.by_tiny[tiny] = page_id
+            self.spaces.add(space_key)
+
+    def add(self, page_id, space_key, title):
+        """Add a page to the index."""
+        self.update([(page_id, space_key, title)])
+
+    @classmethod
+    def load(cls, cf, spaces):
+        """Build an index of all pages in the given spaces, with one bulk search."""
+        cql = 'type=page AND space in ({})'.format(', '.join('"{}"'.format(i) for i in spaces))
+        return cls(cf.getall('content/search', cql=cql, expand='space', _prefetch=True))
+
+    def resolve(self, tiny=None, page_id=None, space_key=None, title=None):
+        """Return ``(space_key, title)`` of a linked page, or ``None`` if unknown."""
+        if tiny:
+            page_id = self.by_tiny.get(tiny)
+            if page_id is None:
+                try:
+                    page_id = page_ids_from_tiny_links([tiny])[0]  # a non-canonical code
+                except ValueError:
+                    return None
+        if page_id is not None:
+            return self.by_id.get(int(page_id))
+        if (space_key, title) in self.by_title:
+            return space_key, title
+        return None
+
+
+class LinkRewriter(object):
+    """ Rewrites page links in storage format bodies, in a single regex pass.
+
+        ``base_urls`` are the URLs of the wiki the links point to, links
+        relative to their path are also rewritten. :py:attr:`stats` counts
+        the rewritten and unresolved links.
+    """
+
+    def __init__(self, index, base_urls):
+        self.index = index
+        prefixes = set()
+        for url in base_urls:
+            url = url.rstrip('/')
+            prefixes.add(re.escape(url))
+            prefixes.add(re.escape(urlparse(url).path))
+        self.regex = re.compile(LINK_PATTERN.format(prefixes='|'.join(sorted(prefixes, key=len, reverse=True))),
+                                re.DOTALL)
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        """Thread-safe stats counter increment."""
+        with self._lock:
+            self.stats[key] += 1
+
+    def link(self, space_key, title, text, anchor=None, own_space=None):
+        """Return the storage format of a link to the given page."""
+        return '<ac:link{}><ri:page{} ri:content-title={}/>{}</ac:link>'.format(
+            ' ac:anchor={}'.format(quoteattr(anchor)) if anchor else '',
+            ' ri:space-key={}'.format(quoteattr(space_key)) if space_key != own_space else '',
+            quoteattr(title),
+            '<ac:link-body>{}</ac:link-body>'.format(text) if text else '',
+        )
+
+    def rewrite(self, body, own_space=None, stats=None):
+        """ Return ``body`` with all resolvable page links made canonical.
+
+            ``own_space`` is the space of the page, links into it
+            get no explicit space key. Rewritten and unresolved links
+            are counted in ``stats`` if given, else in :py:attr:`stats`.
+        """
+        count = self._count if stats is None else lambda key: stats.update((key,))
+
+        def replace(match):
+            "Helper"
+            found = self.index.resolve(
+                tiny=match.group('tiny'), page_id=match.group('id'),
+                space_key=match.group('space') and unquote_plus(unescape(match.group('space'))),
+                title=match.group('title') and unquote_plus(unescape(match.group('title'))),
+            )
+            if not found:
+                count('unresolved')
+                return match.group(0)
+            count('rewritten')
+            anchor = match.group('anchor')
+            return self.link(found[0], found[1], match.group('text'),
+                             anchor=unquote_plus(unescape(anchor)) if anchor else None, own_space=own_space)
+
+        return self.regex.sub(replace, body)
+
+
+def extract_links(body, base_urls):
+    """ Return all links to pages in a storage format body.
+
+        Each link is a ``(kind, target, text)`` tuple, with ``kind`` one of
+        ``ri:page`` (``target`` is a ``(space_key, title)`` pair, the space
+        key may be ``None``), ``id``, ``tiny``, or ``display`` (again a
+        ``(space_key, title)`` pair). Only URLs pointing into the wiki
+        at one of the ``base_urls`` (or relative to them) are considered.
+    """
+    prefixes = set()
+    for url in base_urls:
+        url = url.rstrip('/')
+        prefixes.update([url, urlparse(url).path])
+    prefixes = sorted(prefixes, key=len, reverse=True)
+
+    result = []
+    root = _make_etree(body)
+    for elem in root.iter(RI_NS + 'page'):
+        title = elem.get(RI_NS + 'content-title')
+        if title:
+            parent = elem.getparent()
+            text = parent.findtext(AC_NS + 'plain-text-link-body') if parent.tag == AC_NS + 'link' else None
+            result.append(('ri:page', (elem.get(RI_NS + 'space-key'), title), text or title))
+
+    for elem in root.iter('a'):
+        href = elem.get('href') or ''
+        for prefix in prefixes:
+            if href.startswith(prefix + '/'):
+                matched = URL_TARGET.match(href, len(prefix))
+                break
+        else:
+            matched = None
+        if not matched:
+            continue
+        text = ''.join(elem.itertext()).strip() or href
+        if matched.group('tiny'):
+            result.append(('tiny', matched.group('tiny'), text))
+        elif matched.group('id'):
+            result.append(('id', int(matched.group('id')), text))
+        else:
+            result.append(('display', (unquote_plus(matched.group('space')), unquote_plus(matched.group('title'))),
+                           text))
+    return result
+
+
+def _extract_task(task):
+    """ Extract links from a page, in a worker process.
+
+        ``task`` is a ``(page, body, base_urls)`` tuple, with ``page`` being
+        ``(page_id, space_key, title)``. Returns the links, or an error message
+        if the body cannot be parsed.
+    """
+    _, body, base_urls = task
+    try:
+        return extract_links(body, base_urls)
+    except (click.LoggedFailure, KeyError) as cause:
+        return 'Cannot parse body: {}'.format(str(cause).splitlines()[0])
+
+
+def page_resolver(cf, batch_size=BATCH_SIZE):
+    """ Return a function resolving many page IDs via the API, in batches.
+
+        Pages are searched for with one ``id in (…)`` query per batch
+        (see :py:func:`~confluencer.tools.batch.load_batch`). The function
+        returns a dict mapping each ID to ``(space_key, title)``, ``None``
+        for missing pages, or the API error that prevented a lookup.
+    """
+    def resolve(page_ids):
+        "Helper"
+        page_ids = sorted(set(page_ids))
+        result = {}
+        for start in range(0, len(page_ids), batch_size):
+            chunk = page_ids[start:start + batch_size]
+            try:
+                loaded = load_batch(cf, [str(i) for i in chunk], expand='space')
+            except ERRORS as cause:
+                result.update((i, cause) for i in chunk)
+                continue
+            for page_id, (_, page, error) in zip(chunk, loaded):
+                if isinstance(error, LookupError):
+                    result[page_id] = None
+                else:
+                    result[page_id] = error or (page.space.key, page.title)
+        return result
+
+    return resolve
+
+
+def _link_page_id(index, kind, target):
+    """Return the page ID a link points to, or ``None`` (also for malformed tiny links)."""
+    if kind == 'id':
+        return target
+    if kind == 'tiny':
+        try:
+            return index.by_tiny.get(target) or page_ids_from_tiny_links([target])[0]
+        except ValueError:
+            pass
+    return None
+
+
+def _check_page_id(index, page_id, lookup):
+    """Validate a link to a page ID, see :py:func:`check_link`."""
+    if page_id in index.by_id or lookup is None:
+        return None
+    try:
+        found = lookup(page_id)
+    except ERRORS as cause:
+        return 'page #{} unverified ({})'.format(page_id, str(cause).splitlines()[0])
+    return None if found else 'page #{} not found'.format(page_id)
+
+
+def check_link(index, kind, target, own_space, lookup=None):
+    """ Validate a link against the page index.
+
+        Returns a problem description for broken links, else ``None``.
+        Links by title into spaces not in the index are not checked.
+        Links by page ID are confirmed via ``lookup`` (returning
+        ``(space_key, title)``, or ``None`` for missing pages) when
+        the ID is not in the index, or else not checked either.
+    """
+    if kind in ('id', 'tiny'):
+        page_id = _link_page_id(index, kind, target)
+        return _check_page_id(index, page_id, lookup) if page_id else 'malformed tiny link'
+
+    space_key, title = target
+    space_key = space_key or own_space
+    if space_key not in index.spaces or (space_key, title) in index.by_title:
+        return None
+    return 'no page "{}" in space {}'.format(title, space_key)
+
+
+def check_pages(index, pages, base_urls, workers=4, resolve=None, batch_size=BATCH_SIZE):
+    """ Check the links of many pages, parsing the bodies in worker processes.
+
+        ``pages`` is an iterable of ``(page_id, space_key, title, body)``.
+        Page IDs missing in the index are collected, and passed in batches
+        to ``resolve`` (see :py:func:`page_resolver`); without it, such
+        links are not checked. Yields ``(page, problems)`` for each page as
+        it is checked (pages waiting for their IDs to be resolved come later),
+        where ``page`` is ``(page_id, space_key, title)`` and ``problems``
+        a list of ``(kind, target, text, problem)``.
+    """
+    resolved = {}
+    waiting, unresolved = [], set()
+
+    def lookup(page_id):
+        "Helper"
+        found = resolved[page_id]
+        if isinstance(found, Exception):
+            raise found
+        return found
+
+    def problems_of(page, page_links):
+        "Helper"
+        problems = []
+        for kind, target, text in page_links:
+            problem = check_link(index, kind, target, page[1], lookup=lookup if resolve else None)
+            if problem:
+                problems.append((kind, target, text, problem))
+        return page, problems
+
+    def flush():
+        "Helper"
+        resolved.update(resolve(unresolved))
+        unresolved.clear()
+        for page, page_links in waiting:
+            yield problems_of(page, page_links)
+        del waiting[:]
+
+    tasks = (((page_id, space_key, title), body, tuple(base_urls)) for page_id, space_key, title, body in pages)
+    for task, result, error in iter_concurrently(_extract_task, tasks, workers=workers, processes=True):
+        page = task[0]
+        if error:
+            raise error
+        if not isinstance(result, list):
+            yield page, [(None, None, None, result)]
+            continue
+        unknown = set(page_id for page_id in (_link_page_id(index, kind, target) for kind, target, _ in result)
+                      if page_id and page_id not in index.by_id and page_id not in resolved) if resolve else None
+        if not unknown:
+            yield problems_of(page, result)
+            continue
+        waiting.append((page, result))
+        unresolved.update(unknown)
+        if len(unresolved) >= batch_size:
+            for item in flush():
+                yield item
+    if waiting:
+        for item in flush():
+            yield item
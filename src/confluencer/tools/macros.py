@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Local index of macro usage, built from page bodies in storage format.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import sqlite3
+import threading
+import collections
+
+from munch import Munch as Bunch
+from rudiments.reamed import click
+
+from .. import config
+from .content import _make_etree, count_macros
+
+
+AC_NS = '{http://www.atlassian.com/schema/confluence/4/ac/}'
+MACRO_TAGS = (AC_NS + 'structured-macro', AC_NS + 'macro')
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pages (
+        page_id TEXT PRIMARY KEY, space TEXT, title TEXT, version INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS macros (
+        page_id TEXT, macro TEXT, count INTEGER, PRIMARY KEY (page_id, macro)
+    );
+    CREATE TABLE IF NOT EXISTS parameters (
+        page_id TEXT, macro TEXT, parameter TEXT, count INTEGER, PRIMARY KEY (page_id, macro, parameter)
+    );
+    CREATE INDEX IF NOT EXISTS macros_by_name ON macros (macro);
+    CREATE INDEX IF NOT EXISTS pages_by_space ON pages (space);
+"""
+
+
+def scan_macros(body):
+    """ Return the macro and parameter usage counts of a storage format body.
+
+        The result is a pair of counters, one keyed by macro name, and one
+        by ``(macro, parameter)``. Bodies that are not well-formed fall back
+        to counting macros with a regex, without any parameters.
+    """
+    macros, parameters = collections.Counter(), collections.Counter()
+    try:
+        root = _make_etree(body)
+    except (click.LoggedFailure, KeyError):
+        return count_macros(body), parameters
+
+    for elem in root.iter(*MACRO_TAGS):
+        name = elem.get(AC_NS + 'name')
+        macros[name] += 1
+        for param in elem.iterchildren(AC_NS + 'parameter'):
+            parameters[name, param.get(AC_NS + 'name') or ''] += 1
+    return macros, parameters
+
+
+class MacroIndex(object):
+    """ A SQLite index of ``(page, macro, parameter, count)``.
+
+        Pages are only re-scanned when their version changed,
+        so the index can be updated incrementally.
+    """
+
+    FILENAME = 'macro-index.db'
+
+    def __init__(self, path=None):
+        self.path = path or config.cache_file(self.FILENAME)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Close the database."""
+        self.db.close()
+
+    def versions(self, space_key=None):
+        """Return a mapping of page IDs to the indexed version numbers."""
+        sql, args = 'SELECT page_id, version FROM pages', ()
+        if space_key:
+            sql, args = sql + ' WHERE space = ?', (space_key,)
+        return dict(self.db.execute(sql, args))
+
+    def needs_update(self, page_id, version):
+        """Check whether a page version is not yet indexed."""
+        with self._lock:
+            row = self.db.execute('SELECT version FROM pages WHERE page_id = ?', (str(page_id),)).fetchone()
+        return not row or row[0] < version
+
+    def update(self, page_id, space_key, title, version, body):
+        """ Index a page's body, unless this version is already indexed.
+
+            Returns ``True`` if the page was (re-)indexed.
+        """
+        page_id = str(page_id)
+        if not self.needs_update(page_id, version):
+            return False
+
+        macros, parameters = scan_macros(body)
+        with self._lock, self.db:
+            self.db.execute('DELETE FROM macros WHERE page_id = ?', (page_id,))
+            self.db.execute('DELETE FROM parameters WHERE page_id = ?', (page_id,))
+            self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', (page_id, space_key, title, version))
+            self.db.executemany('INSERT INTO macros VALUES (?, ?, ?)',
+                                [(page_id, name, count) for name, count in macros.items()])
+            self.db.executemany('INSERT INTO parameters VALUES (?, ?, ?, ?)',
+                                [(page_id, name, param, count) for (name, param), count in parameters.items()])
+        return True
+
+    def remove(self, page_ids):
+        """Drop the given pages from the index."""
+        with self._lock, self.db:
+            for table in ('pages', 'macros', 'parameters'):
+                self.db.executemany('DELETE FROM {} WHERE page_id = ?'.format(table), [(str(i),) for i in page_ids])
+
+    @staticmethod
+    def _space_filter(spaces, alias='p'):
+        """SQL condition and arguments for an optional list of spaces."""
+        if not spaces:
+            return '', ()
+        return ' AND {}.space IN ({})'.format(alias, ','.join('?' * len(spaces))), tuple(spaces)
+
+    def usage(self, macro, spaces=None, top=0):
+        """Yield pages using a macro, most uses first."""
+        cond, args = self._space_filter(spaces)
+        sql = ('SELECT p.space, p.page_id, p.title, m.count FROM macros m JOIN pages p USING (page_id)'
+               ' WHERE m.macro = ?{} ORDER BY m.count DESC, p.page_id'.format(cond))
+        if top:
+            sql += ' LIMIT {:d}'.format(top)
+        for space_key, page_id, title, count in self.db.execute(sql, (macro,) + args):
+            yield Bunch(space=space_key, id=page_id, title=title, count=count)
+
+    def parameters(self, macro, spaces=None):
+        """Yield the parameters used with a macro, with page and instance counts."""
+        cond, args = self._space_filter(spaces)
+        sql = ('SELECT x.parameter, COUNT(*), SUM(x.count) FROM parameters x JOIN pages p USING (page_id)'
+               ' WHERE x.macro = ?{} GROUP BY x.parameter ORDER BY SUM(x.count) DESC'.format(cond))
+        for parameter, pages, count in self.db.execute(sql, (macro,) + args):
+            yield Bunch(macro=macro, parameter=parameter, pages=pages, count=count)
+
+    def totals(self, spaces=None):
+        """Yield all macros with their page and instance counts, most used first."""
+        cond, args = self._space_filter(spaces)
+        sql = ('SELECT m.macro, COUNT(*), SUM(m.count) FROM macros m JOIN pages p USING (page_id)'
+               ' WHERE 1{} GROUP BY m.macro ORDER BY SUM(m.count) DESC'.format(cond))
+        for macro, pages, count in self.db.execute(sql, args):
+            yield Bunch(macro=macro, pages=pages, count=count)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Local mirror of Confluence spaces, for offline use.
+
+    Page metadata, labels and version are kept in a compressed SQLite
+    store, storage bodies in a packed body store next to it. The first
+    sync of a space pulls everything in bulk, later syncs only fetch
+    what changed since.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import json
+import zlib
+import time
+import sqlite3
+import logging
+import threading
+
+import requests
+from addict import Dict as AttrDict
+
+from .. import config
+from ..util import iter_concurrently
+from ..util import cql as cql_parser
+from .._compat import urlparse, parse_qs
+from .packstore import PackedBodyStore
+
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS spaces (
+        key TEXT PRIMARY KEY, name TEXT, last_sync REAL, data BLOB
+    );
+    CREATE TABLE IF NOT EXISTS pages (
+        id TEXT PRIMARY KEY, space TEXT, title TEXT, parent_id TEXT,
+        version INTEGER, labels TEXT, data BLOB
+    );
+    CREATE INDEX IF NOT EXISTS pages_by_space ON pages (space, title);
+    CREATE INDEX IF NOT EXISTS pages_by_parent ON pages (parent_id, title);
+"""
+
+# Expansions stored for each page
+PAGE_EXPAND = 'space,version,ancestors,metadata.labels'
+
+
+class OfflineError(requests.RequestException):
+    """A request cannot be served from the local mirror."""
+
+
+class OfflineAdapter(requests.adapters.BaseAdapter):
+    """HTTP adapter that refuses any network access."""
+
+    def send(self, request, **_):  # pylint: disable=arguments-differ
+        """Refuse to send anything."""
+        raise OfflineError('Offline mode, cannot {} {}'.format(request.method, request.url))
+
+    def close(self):
+        """Nothing to clean up."""
+
+
+def _pack(data):
+    """Serialize and compress JSON data."""
+    return sqlite3.Binary(zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8')))
+
+
+def _unpack(blob):
+    """Decompress and parse JSON data."""
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class SpaceMirror(object):
+    """ A local store of Confluence spaces.
+
+        The default location is the ``CONFLUENCE_MIRROR`` environment
+        variable, or ``mirror.db`` in the application's cache directory.
+    """
+
+    FILENAME = 'mirror.db'
+    SYNC_OVERLAP = 24 * 60 * 60  # seconds, to cover server time zones and indexing lag
+    COMPACT_RATIO = 0.5  # share of outdated bodies in the pack that triggers a compaction
+    COMPACT_MIN_BYTES = 1024 * 1024  # never compact for less garbage than that
+    # SQL expressions of CQL fields compared for equality
+    CQL_COLUMNS = dict(id='id', content='id', space='space', title='title', parent="IFNULL(parent_id, '')")
+    # All descendants of the pages with the given IDs
+    CQL_SUBTREE = ('WITH RECURSIVE subtree(id) AS (SELECT id FROM pages WHERE parent_id IN ({})'
+                   ' UNION SELECT pages.id FROM pages JOIN subtree ON pages.parent_id = subtree.id)'
+                   ' SELECT id FROM subtree')
+
+    def __init__(self, path=None, base_url=None):
+        self.path = path or os.environ.get('CONFLUENCE_MIRROR') or config.cache_file(self.FILENAME)
+        self.base_url = (base_url or os.environ.get('CONFLUENCE_BASE_URL') or '').rstrip('/')
+        self.log = logging.getLogger('cfmirror')
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.bodies = PackedBodyStore(os.path.splitext(self.path)[0] + '-bodies')
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Close the database and body store."""
+        self.db.close()
+        self.bodies.close()
+
+    def _query(self, sql, args=()):
+        """Run a query, and return all rows."""
+        with self._lock:
+            return self.db.execute(sql, args).fetchall()
+
+    # ~~~ Synchronization ~~~
+
+    def last_sync(self, space_key):
+        """Return the time of the last sync of a space (or ``None``)."""
+        rows = self._query('SELECT last_sync FROM spaces WHERE key = ?', (space_key,))
+        return rows[0][0] if rows else None
+
+    def versions(self, space_key):
+        """Return a mapping of mirrored page IDs to their version."""
+        return dict(self._query('SELECT id, version FROM pages WHERE space = ?', (space_key,)))
+
+    def store(self, page):
+        """Store a page API result, which must include the storage body."""
+        data = AttrDict(page)
+        body = data.pop('body', {}).get('storage', {}).get('value', '')
+        data._links.base = data._links.base or self.base_url
+        if not data._links.self:
+            data._links.self = self.base_url + '/rest/api/content/' + data.id
+        parent_id = data.ancestors[-1].id if data.ancestors else None
+        labels = [i.name for i in data.metadata.labels.results or []]
+        with self._lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO pages (id, space, title, parent_id, version, labels, data)'
+                            ' VALUES (?, ?, ?, ?, ?, ?, ?)', (
+                data.id, data.space.key, data.title, parent_id, data.version.number,
+                json.dumps(labels), _pack(data.to_dict()),
+            ))
+        if self.bodies.version(data.id) != data.version.number:
+            self.bodies.put(data.id, data.version.number, body)
+
+    def remove(self, page_ids):
+        """Drop the given pages."""
+        with self._lock, self.db:
+            self.db.executemany('DELETE FROM pages WHERE id = ?', [(i,) for i in page_ids])
+        for page_id in page_ids:
+            self.bodies.delete(page_id)
+
+    def compact(self, ratio=None):
+        """ Compact the body store, if outdated bodies take more than ``ratio`` of it.
+
+            Returns the number of bytes freed.
+        """
+        ratio = self.COMPACT_RATIO if ratio is None else ratio
+        garbage = self.bodies.garbage()
+        if garbage < self.COMPACT_MIN_BYTES or garbage <= ratio * self.bodies.size():
+            return 0
+        with self._lock:
+            self.bodies.compact()
+        self.log.info('Compacted page bodies, freed %d bytes', garbage)
+        return garbage
+
+    def iter_bodies(self, space_key=None):
+        """ Yield ``(page_id, space_key, title, version, body)`` for all mirrored pages.
+
+            Bodies are scanned in storage order, straight from the packed body store.
+        """
+        sql, args = 'SELECT id, space, title FROM pages', ()
+        if space_key:
+            sql, args = sql + ' WHERE space = ?', (space_key,)
+        pages = {int(page_id): (page_id, space, title) for page_id, space, title in self._query(sql, args)}
+        for page_id, version, body in self.bodies.iter_bodies(pages):
+            yield pages[page_id] + (version, body)
+
+    def sync(self, cf, space_key, full=False, workers=4):
+        """ Synchronize a space into the mirror.
+
+            New page versions are appended to the body store, which gets
+            compacted once outdated bodies exceed :py:attr:`COMPACT_RATIO`.
+            Returns the number of stored and removed pages.
+        """
+        started = time.time()
+        last_sync = None if full else self.last_sync(space_key)
+        space = cf.get('space/' + space_key)
+        cql = 'type=page AND space="{}"'.format(space_key)
+        stored = 0
+
+        if last_sync is None:
+            # Bulk load, bodies included in the search results
+            for page in cf.getall('content/search', cql=cql, expand=PAGE_EXPAND + ',body.storage', _prefetch=True):
+                self.store(page)
+                stored += 1
+        else:
+            # Only fetch pages modified since the last sync
+            since = time.strftime('%Y/%m/%d %H:%M', time.localtime(last_sync - self.SYNC_OVERLAP))
+            known = self.versions(space_key)
+            changed = [page for page in cf.getall('content/search', cql=cql + ' AND lastmodified > "{}"'.format(since),
+                                                  expand='version', _prefetch=True)
+                       if known.get(page.id, 0) < page.version.number]
+            fetch = lambda page: cf.get(page._links.self, expand=PAGE_EXPAND + ',body.storage')
+            for page, data, error in iter_concurrently(fetch, changed, workers=workers):
+                if error:
+                    raise error
+                self.store(data)
+                stored += 1
+
+        # Drop pages that are gone on the server (IDs only)
+        existing = set(page.id for page in cf.getall('content/search', cql=cql, _prefetch=True))
+        removed = set(self.versions(space_key)) - existing
+        self.remove(removed)
+
+        with self._lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO spaces VALUES (?, ?, ?, ?)',
+                            (space_key, space.name, started, _pack(space.to_dict())))
+        self.log.info('%s: stored %d, removed %d pages', space_key, stored, len(removed))
+        self.compact()
+        return stored, len(removed)
+
+    # ~~~ Offline API ~~~
+
+    def _page(self, row):
+        """Build a page API result from a database row."""
+        page = AttrDict(_unpack(row[0]))
+        page.body.storage = AttrDict(value=self.bodies.get(page.id) or '', representation='storage')
+        return page
+
+    def page(self, page_id):
+        """Return a mirrored page, like ``GET content/{id}``."""
+        rows = self._query('SELECT data FROM pages WHERE id = ?', (str(page_id),))
+        if not rows:
+            raise OfflineError('Page #{} is not mirrored'.format(page_id))
+        return self._page(rows[0])
+
+    def children(self, page_id):
+        """Return the mirrored child pages of a page."""
+        return [self._page(i) for i in self._query(
+            'SELECT data FROM pages WHERE parent_id = ? ORDER BY title', (str(page_id),))]
+
+    def _cql_sql(self, node):
+        """ Compile a CQL syntax tree into an SQL condition, and its arguments.
+
+            Raises :py:class:`OfflineError` for anything the mirror cannot answer.
+        """
+        if node[0] in ('and', 'or'):
+            parts = [self._cql_sql(i) for i in node[1]]
+            return ('(' + ' {} '.format(node[0].upper()).join(sql for sql, _ in parts) + ')',
+                    [arg for _, args in parts for arg in args])
+        if node[0] == 'not':
+            sql, args = self._cql_sql(node[1])
+            return 'NOT ({})'.format(sql), args
+
+        _, field, oper, values = node
+        negate = 'NOT ' if oper in ('!=', '!~') else ''
+        marks = ','.join('?' * len(values))
+        if field == 'type' and oper in ('=', '!='):
+            # Only pages are mirrored
+            return '1' if ('page' in values) != bool(negate) else '0', []
+        if field in self.CQL_COLUMNS and oper in ('=', '!='):
+            return '{} {}IN ({})'.format(self.CQL_COLUMNS[field], negate, marks), list(values)
+        if field == 'ancestor' and oper in ('=', '!='):
+            return 'id {}IN ({})'.format(negate, self.CQL_SUBTREE.format(marks)), list(values)
+        if field == 'title' and oper in ('~', '!~'):
+            return 'title {}LIKE ?'.format(negate), ['%{}%'.format(values[0].replace('*', ''))]
+        if field == 'label' and oper in ('=', '!='):
+            return ('{}({})'.format(negate, ' OR '.join(['labels LIKE ?'] * len(values))),
+                    ['%{}%'.format(json.dumps(i)) for i in values])
+        if field == 'lastmodified' and oper in ('>', '>='):
+            return '1', []  # the mirror is a snapshot, so everything is "recent"
+        raise OfflineError('CQL clause "{} {} ..." not supported in offline mode'.format(field, oper))
+
+    def search(self, cql):
+        """Evaluate a CQL query (see :py:mod:`confluencer.util.cql`) against the mirror."""
+        try:
+            tree = cql_parser.parse(cql)
+        except cql_parser.CqlError as cause:
+            raise OfflineError('CQL query not supported in offline mode: {}'.format(cause))
+        condition, args = self._cql_sql(tree)
+        return [self._page(i) for i in self._query(
+            'SELECT data FROM pages WHERE {} ORDER BY space, title'.format(condition), args)]
+
+    def spaces(self):
+        """Return the mirrored spaces."""
+        return [AttrDict(_unpack(i[0])) for i in self._query('SELECT data FROM spaces ORDER BY key')]
+
+    def get(self, url, **params):
+        """Serve an API ``GET`` request for ``url`` from the mirror."""
+        scheme_host_path = urlparse(url)
+        params.update({k: v[0] for k, v in parse_qs(scheme_host_path.query).items()})
+        expand = params.get('expand', '')
+        if any(i.startswith('body.') and i != 'body.storage' for i in expand.split(',')):
+            raise OfflineError('Only storage format bodies are mirrored')
+
+        path = scheme_host_path.path.split('/rest/api/', 1)[-1].strip('/').split('/')
+        if path[0] == 'content' and len(path) == 1 and params.get('status') == 'trashed':
+            results = []
+        elif path[0] == 'content' and len(path) == 2 and path[1] != 'search':
+            return self.page(path[1])
+        elif path[0] == 'content' and len(path) == 4 and path[2:] == ['child', 'page']:
+            results = self.children(path[1])
+        elif path == ['content', 'search']:
+            results = self.search(params.get('cql', ''))
+        elif path[0] == 'content' and len(path) == 1 and params.get('spaceKey'):
+            results = self.search('space="{}"'.format(params['spaceKey']))
+        elif path == ['space']:
+            results = self.spaces()
+        elif path[0] == 'space' and len(path) == 2:
+            found = [i for i in self.spaces() if i.key == path[1]]
+            if not found:
+                raise OfflineError('Space {} is not mirrored'.format(path[1]))
+            return found[0]
+        else:
+            raise OfflineError('Offline mode, cannot GET {}'.format(url))
+
+        if 'page' in expand.split(','):
+            return AttrDict(page=dict(results=results, size=len(results)))
+        return AttrDict(results=results, size=len(results), totalSize=len(results))
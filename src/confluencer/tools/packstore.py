@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Append-only packed store for page bodies, read via ``mmap``.
+
+    All bodies live in one big ``.pack`` file, and a compact ``.idx`` file
+    holds fixed-size records of ``(page ID, offset, length, version, flags)``.
+    Updating a page appends a new body and index record, the latest record
+    for a page wins. Readers map the pack file into memory, so full scans
+    neither open a file per page nor copy raw bodies around.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import zlib
+import mmap
+import struct
+import threading
+
+
+INDEX_RECORD = struct.Struct('<QQIIB')  # page ID, offset, length, version, flags
+FLAG_COMPRESSED = 0x01
+FLAG_DELETED = 0x02
+
+
+class PackedBodyStore(object):
+    """ A store of page bodies in a single append-only file.
+
+        ``path`` is the common prefix of the ``.pack`` and ``.idx`` files.
+        Bodies of at least ``compress_min`` bytes are stored zlib-compressed.
+    """
+
+    def __init__(self, path, compress_min=256):
+        self.path = path
+        self.compress_min = compress_min
+        self._lock = threading.Lock()
+        self._pack = open(path + '.pack', 'ab+')
+        self._idx = open(path + '.idx', 'ab+')
+        self._map = None
+        self._mapped_size = 0
+        self.index = {}
+
+        self._idx.seek(0)
+        data = self._idx.read()
+        data = data[:len(data) - len(data) % INDEX_RECORD.size]  # ignore a torn last record
+        for page_id, offset, length, version, flags in INDEX_RECORD.iter_unpack(data):
+            if flags & FLAG_DELETED:
+                self.index.pop(page_id, None)
+            else:
+                self.index[page_id] = (offset, length, version, flags)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, page_id):
+        return int(page_id) in self.index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Release the memory map and close all files."""
+        with self._lock:
+            if self._map is not None:
+                try:
+                    self._map.close()
+                except BufferError:
+                    pass  # views still exported, released with the last of them
+                self._map = None
+            self._pack.close()
+            self._idx.close()
+
+    def version(self, page_id):
+        """Return the stored version of a page, or 0."""
+        entry = self.index.get(int(page_id))
+        return entry[2] if entry else 0
+
+    def put(self, page_id, version, body):
+        """Append a new body for the given page."""
+        data = body.encode('utf-8') if not isinstance(body, bytes) else body
+        flags = 0
+        if len(data) >= self.compress_min:
+            data, flags = zlib.compress(data), FLAG_COMPRESSED
+        self._append(int(page_id), version, data, flags)
+
+    def _append(self, page_id, version, data, flags):
+        """Append stored bytes and their index record."""
+        with self._lock:
+            self._pack.seek(0, os.SEEK_END)
+            offset = self._pack.tell()
+            self._pack.write(data)
+            self._pack.flush()
+            self._idx.write(INDEX_RECORD.pack(page_id, offset, len(data), version, flags))
+            self._idx.flush()
+            self.index[page_id] = (offset, len(data), version, flags)
+
+    def delete(self, page_id):
+        """Mark a page as deleted."""
+        with self._lock:
+            if self.index.pop(int(page_id), None) is not None:
+                self._idx.write(INDEX_RECORD.pack(int(page_id), 0, 0, 0, FLAG_DELETED))
+                self._idx.flush()
+
+    def _view(self, offset, length):
+        """Return a zero-copy view into the pack file."""
+        end = offset + length
+        if not length:
+            return memoryview(b'')
+        if end > self._mapped_size:
+            with self._lock:
+                size = os.fstat(self._pack.fileno()).st_size
+                # An outdated map is not closed explicitly, since views into it might
+                # still be in use; it is released with the last of them
+                self._map = mmap.mmap(self._pack.fileno(), size, access=mmap.ACCESS_READ) if size else None
+                self._mapped_size = size
+        return memoryview(self._map)[offset:end]
+
+    def get_raw(self, page_id):
+        """Return the stored bytes of a body (maybe compressed) and its flags, or ``(None, 0)``."""
+        entry = self.index.get(int(page_id))
+        if not entry:
+            return None, 0
+        offset, length, _, flags = entry
+        return self._view(offset, length), flags
+
+    def get(self, page_id):
+        """Return the body of a page as text, or ``None``."""
+        data, flags = self.get_raw(page_id)
+        if data is None:
+            return None
+        if flags & FLAG_COMPRESSED:
+            return zlib.decompress(data).decode('utf-8')
+        return bytes(data).decode('utf-8')
+
+    def iter_bodies(self, page_ids=None):
+        """ Yield ``(page_id, version, body)`` for all (or the given) pages.
+
+            Bodies are read in file order, for sequential access to the pack.
+        """
+        wanted = self.index if page_ids is None else {int(i): self.index[int(i)]
+                                                      for i in page_ids if int(i) in self.index}
+        if self._map is not None and hasattr(self._map, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        for page_id, (offset, length, version, flags) in sorted(wanted.items(), key=lambda i: i[1][0]):
+            data = self._view(offset, length)
+            if flags & FLAG_COMPRESSED:
+                data = zlib.decompress(data)
+            yield page_id, version, bytes(data).decode('utf-8')
+
+    def size(self):
+        """Return the size of the pack file."""
+        return os.fstat(self._pack.fileno()).st_size
+
+    def garbage(self):
+        """Return the number of bytes taken by outdated bodies."""
+        return self.size() - sum(i[1] for i in self.index.values())
+
+    def compact(self):
+        """Rewrite the store, dropping outdated bodies and index records."""
+        tmp_path = self.path + '.compact'
+        for ext in ('.pack', '.idx'):
+            if os.path.exists(tmp_path + ext):
+                os.remove(tmp_path + ext)  # left over from an interrupted compaction
+        with PackedBodyStore(tmp_path, compress_min=self.compress_min) as target:
+            for page_id, (offset, length, version, flags) in sorted(self.index.items(), key=lambda i: i[1][0]):
+                target._append(page_id, version, bytes(self._view(offset, length)), flags)  # pylint: disable=protected-access
+        self.close()
+        for ext in ('.pack', '.idx'):
+            os.replace(tmp_path + ext, self.path + ext)
+        self.__init__(self.path, compress_min=self.compress_min)
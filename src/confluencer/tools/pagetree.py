@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Page tree loading and bulk removal.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import logging
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from munch import Munch as Bunch
+
+from .. import api
+from ..util import iter_concurrently, metrics, tracing
+
+
+def load_subtree(cf, root, workers=4, **params):
+    """ Load the complete page tree below ``root`` (a page URL or API result).
+
+        Children are fetched level by level, with all pages of a level
+        handled concurrently. Returns a list of nodes in breadth-first
+        order, the root node first. Each node is a ``Bunch`` with the
+        attributes ``id``, ``title``, ``depth``, ``parent`` (node or ``None``),
+        ``children`` (list of nodes), and ``page`` (the API result).
+    """
+    page = cf.get(root, **params) if not hasattr(root, '_links') else root
+    nodes = [Bunch(id=page.id, title=page.title, depth=0, parent=None, children=[], page=page)]
+    level = nodes[:]
+    while level:
+        next_level = []
+        fetch = lambda node: list(cf.getall(node.page._links.self + '/child/page', **params))
+        for node, children, error in iter_concurrently(fetch, level, workers=workers):
+            if error:
+                raise error
+            for child in children:
+                child_node = Bunch(id=child.id, title=child.title, depth=node.depth + 1,
+                                   parent=node, children=[], page=child)
+                node.children.append(child_node)
+                next_level.append(child_node)
+        nodes.extend(next_level)
+        level = next_level
+    return nodes
+
+
+def select_nodes(nodes, with_root=False, include=None, exclude=None):
+    """ Select the nodes of a loaded subtree that can be removed.
+
+        Title globs in ``include`` select matching pages and all their
+        descendants (everything is selected when no includes are given).
+        Pages matching an ``exclude`` glob are kept, including their subtree.
+        Since a page is only removed after all its descendants are gone,
+        kept pages also protect their ancestors.
+
+        Returns the selected nodes in post-order (leaves first).
+    """
+    def matches(title, globs):
+        "Helper"
+        return any(fnmatch.fnmatchcase(title.lower(), glob.lower()) for glob in globs)
+
+    excluded = object()
+    state = {}
+    for node in nodes:  # breadth-first, so parents are always decided before children
+        parent_state = state[node.parent.id] if node.parent else None
+        if parent_state is excluded or (exclude and matches(node.title, exclude)):
+            state[node.id] = excluded
+        elif node.parent is None:
+            state[node.id] = with_root and (not include or matches(node.title, include))
+        else:
+            state[node.id] = parent_state is True or not include or matches(node.title, include)
+
+    removable = {}
+    for node in reversed(nodes):  # children before parents
+        removable[node.id] = state[node.id] is True and all(removable[i.id] for i in node.children)
+
+    return [node for node in reversed(nodes) if removable[node.id]]
+
+
+class SubtreeDeleter(object):
+    """ Delete a set of pages leaves-first, using a bounded worker pool.
+
+        A page is only deleted after all its selected children are gone;
+        if deleting a page fails, none of its ancestors are touched.
+    """
+
+    def __init__(self, cf, workers=4, dry_run=False, log=None):
+        self.cf = cf
+        self.workers = workers
+        self.dry_run = dry_run
+        self.log = log or logging.getLogger('cfdelete')
+        self.deleted = []
+        self.failed = []
+
+    def _delete(self, node):
+        """Delete a single page."""
+        if self.dry_run:
+            self.log.info('WOULD delete page#%s "%s"', node.id, node.title)
+        else:
+            self.cf.delete_page(node.page)
+        return node
+
+    def run(self, selected, progress=None):
+        """ Delete the given nodes, as returned by :py:func:`select_nodes`.
+
+            If a ``progress`` bar is passed, it is updated for each handled page.
+        """
+        selected_ids = set(node.id for node in selected)
+        waiting_for = {node.id: sum(1 for i in node.children if i.id in selected_ids) for node in selected}
+        ready = [node for node in selected if not waiting_for[node.id]]
+
+        delete = tracing.wrap(self._delete)
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            pending = {}
+            while ready or pending:
+                while ready:
+                    node = ready.pop()
+                    pending[pool.submit(delete, node)] = node
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = pending.pop(future)
+                    error = future.exception()
+                    if error:
+                        if not isinstance(error, api.ERRORS):
+                            raise error
+                        self.failed.append((node, error))
+                        metrics.REGISTRY.inc('page_deletes_total', status='failed')
+                        self.log.error('Deleting page#%s "%s" failed: %s', node.id, node.title, error)
+                    else:
+                        self.deleted.append(node)
+                        metrics.REGISTRY.inc('page_deletes_total', status='dry_run' if self.dry_run else 'deleted')
+                        parent = node.parent
+                        if parent is not None and parent.id in waiting_for:
+                            waiting_for[parent.id] -= 1
+                            if not waiting_for[parent.id]:
+                                ready.append(parent)
+                    if progress is not None:
+                        progress.set_postfix_str(node.title[:40])
+                        progress.update(1)
+
+        return self.deleted
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Bulk regex search-and-replace, with user-provided rules.
+
+    A rules file is a JSON list of objects like this::
+
+        [
+            {"name": "Moved Jira", "pattern": "https?://jira\\\\.old\\\\.example\\\\.com/",
+             "replace": "https://jira.example.com/"},
+            {"pattern": "(?i)<b>(.*?)</b>", "replace": "<strong>\\\\1</strong>", "flags": ["DOTALL"]}
+        ]
+
+    Rules are applied in order, using the same machinery as ``tidy``.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import re
+import json
+
+from rudiments.reamed import click
+
+from ..util import iter_concurrently
+from .content import _apply_tidy_regex_rules
+
+
+RULE_FLAGS = ('IGNORECASE', 'MULTILINE', 'DOTALL', 'VERBOSE')
+
+_compiled = {}  # per-process cache of compiled rule sets
+
+
+class _Recorder(object):
+    """Collects log messages in a worker process, to be logged by the parent."""
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, msg, *args):
+        """Record a message."""
+        self.messages.append(msg % args if args else msg)
+
+
+def load_rules(filename):
+    """ Load and check replacement rules from a JSON file.
+
+        Returns a tuple of ``(name, pattern, subst, flags)`` rules,
+        which can be pickled and sent to worker processes.
+    """
+    try:
+        with io.open(filename, encoding='utf-8') as handle:
+            data = json.load(handle)
+    except (EnvironmentError, ValueError) as cause:
+        raise click.LoggedFailure('Cannot load rules from "{}": {}'.format(filename, cause))
+    if not isinstance(data, list):
+        raise click.LoggedFailure('Rules in "{}" must be a list'.format(filename))
+
+    rules = []
+    for idx, rule in enumerate(data, 1):
+        if not isinstance(rule, dict) or 'pattern' not in rule or 'replace' not in rule:
+            raise click.LoggedFailure('Rule #{} in "{}" needs a "pattern" and a "replace" value'.format(idx, filename))
+        flags = 0
+        for flag in rule.get('flags', []):
+            if flag.upper() not in RULE_FLAGS:
+                raise click.LoggedFailure('Rule #{} in "{}" has unknown flag "{}", use one of {}'.format(
+                    idx, filename, flag, ', '.join(RULE_FLAGS)))
+            flags |= getattr(re, flag.upper())
+        name = rule.get('name') or 'Rule #{}'.format(idx)
+        try:
+            re.compile(rule['pattern'], flags)
+        except re.error as cause:
+            raise click.LoggedFailure('Bad regex in "{}": {} => {}'.format(name, rule['pattern'], cause))
+        rules.append((name, rule['pattern'], rule['replace'], flags))
+    return tuple(rules)
+
+
+def compile_rules(rules):
+    """Return loaded rules as ``(name, regex, subst)`` triples, cached per process."""
+    if rules not in _compiled:
+        _compiled[rules] = tuple((name, re.compile(pattern, flags), subst) for name, pattern, subst, flags in rules)
+    return _compiled[rules]
+
+
+def apply_rules(rules, body, log=None):
+    """Return ``body`` with all ``rules`` applied."""
+    return _apply_tidy_regex_rules(body, log=log, rules=compile_rules(rules))
+
+
+def _apply_task(task):
+    """ Apply rules to a page body, in a worker process.
+
+        ``task`` is a ``(rules, page_id, body)`` tuple, and the result
+        is the new body plus a list of messages about replacements.
+    """
+    rules, _, body = task
+    recorder = _Recorder()
+    return apply_rules(rules, body, log=recorder), recorder.messages
+
+
+def iter_changes(rules, pages, workers=4, log=None):
+    """ Apply rules to many pages, in a pool of worker processes.
+
+        ``pages`` is an iterable of :py:class:`ConfluencePage` objects.
+        Yields ``(page, new_body)`` for all pages that are changed
+        by the rules, in order of completion. Repeated pages are skipped.
+    """
+    pending, seen = {}, set()
+
+    def tasks():
+        "Helper"
+        for page in pages:
+            if page.page_id in seen:
+                continue
+            seen.add(page.page_id)
+            pending[page.page_id] = page
+            yield rules, page.page_id, page.body
+
+    for task, result, error in iter_concurrently(_apply_task, tasks(), workers=workers, processes=True):
+        page = pending.pop(task[1])
+        if error:
+            raise error
+        body, messages = result
+        if log:
+            for message in messages:
+                log.info('%s: %s', page.title, message)
+        if body != page.body:
+            yield page, body
+
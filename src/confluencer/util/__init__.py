@@ -19,6 +19,8 @@ from __future__ import absolute_import, unicode_literals, print_function
 
 from tqdm import tqdm
 
+from . import tracing
+
 
 CLEARLINE = "\r\033[2K"
 
@@ -28,3 +30,95 @@ def progress(*args, **kwargs):
     kwargs.setdefault('dynamic_ncols', True)
     kwargs.setdefault('position', 1)
     return tqdm(*args, **kwargs)
+
+
+def iter_concurrently(func, items, workers=4, backlog=None, processes=False):
+    """ Call ``func`` for all ``items`` in a bounded thread pool.
+
+        Yields ``(item, result, error)`` tuples in order of completion,
+        with either ``result`` or ``error`` set. At most ``backlog``
+        items (default: twice the number of workers) are in flight,
+        so huge or endless iterables are consumed lazily.
+
+        For CPU-bound work, pass ``processes=True`` to use a process pool
+        instead (``func`` and the items must be picklable then).
+    """
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    workers = max(1, workers or 1)
+    backlog = max(workers, backlog or 2 * workers)
+    items = iter(items)
+    if not processes:
+        func = tracing.wrap(func)
+    with (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            for item in items:
+                pending[pool.submit(func, item)] = item
+                if len(pending) >= backlog:
+                    break
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                yield item, None if error else future.result(), error
+
+
+def iter_merged(func, items, workers=4, maxsize=1000):
+    """ Run the generator function ``func`` for all ``items`` in a thread pool,
+        and yield the values they produce as one merged stream.
+
+        Values arrive in no particular order. A bounded queue applies back-pressure
+        to the producers, and the first error raised by any of them is re-raised.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        import queue
+    except ImportError:  # Python 2
+        import Queue as queue  # pylint: disable=import-error
+
+    done, stopped = object(), threading.Event()
+    results = queue.Queue(maxsize=maxsize)
+
+    def put(value):
+        "Put a value, unless the consumer went away."
+        while not stopped.is_set():
+            try:
+                results.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce(item):
+        "Feed the queue with the values of one generator."
+        try:
+            for value in func(item):
+                if not put((None, value)):
+                    break
+        except Exception as cause:  # pylint: disable=broad-except
+            put((cause, None))
+        finally:
+            put((done, None))
+
+    items = list(items)
+    produce = tracing.wrap(produce)
+    with ThreadPoolExecutor(max_workers=max(1, workers or 1)) as pool:
+        for item in items:
+            pool.submit(produce, item)
+        try:
+            running = len(items)
+            while running:
+                error, value = results.get()
+                if error is done:
+                    running -= 1
+                elif error is not None:
+                    raise error
+                else:
+                    yield value
+        finally:
+            stopped.set()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" A parser for a subset of CQL (Confluence Query Language).
+
+    :py:func:`parse` turns a query into a small syntax tree, which
+    consumers like the offline mirror or the fake server then compile
+    into whatever they evaluate (SQL, Python predicates). Nodes are
+    tuples:
+
+    * ``('and', [node, …])``, ``('or', [node, …])``, ``('not', node)``
+    * ``('clause', field, operator, [value, …])``
+
+    Field names are lower-cased. ``IN`` and ``NOT IN`` become the
+    operators ``=`` and ``!=`` with several values. ``ORDER BY``,
+    functions and other constructs raise :py:class:`CqlError`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+
+
+OPERATORS = ('=', '!=', '~', '!~', '<', '<=', '>', '>=')
+KEYWORDS = ('AND', 'OR', 'NOT', 'IN')
+
+TOKEN = re.compile(r'\s*(?:(?P<str>"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')'
+                   r'|(?P<op>!=|!~|>=|<=|[=~<>(),])|(?P<word>[^\s=!~<>(),"\']+))')
+
+
+class CqlError(ValueError):
+    """A CQL query that cannot be parsed."""
+
+
+def tokenize(cql):
+    """Split a CQL query into ``(kind, value)`` tokens."""
+    pos, tokens = 0, []
+    cql = cql.rstrip()
+    while pos < len(cql):
+        matched = TOKEN.match(cql, pos)
+        if not matched:
+            raise CqlError('Cannot parse CQL at "{}"'.format(cql[pos:]))
+        pos = matched.end()
+        if matched.group('str'):
+            tokens.append(('value', re.sub(r'\\(.)', r'\1', matched.group('str')[1:-1])))
+        elif matched.group('op'):
+            tokens.append(('op', matched.group('op')))
+        else:
+            word = matched.group('word')
+            tokens.append(('keyword', word.upper()) if word.upper() in KEYWORDS else ('value', word))
+    return tokens
+
+
+def parse(cql):
+    """Parse a CQL query into a syntax tree."""
+    tokens = tokenize(cql)
+    pos = [0]
+
+    def peek():
+        "Helper"
+        return tokens[pos[0]] if pos[0] < len(tokens) else (None, None)
+
+    def take(kind=None, value=None):
+        "Helper"
+        token = peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            raise CqlError('Expected {} in CQL "{}"'.format(value or kind or 'more', cql))
+        pos[0] += 1
+        return token[1]
+
+    def expression():
+        "Helper"
+        terms = [conjunction()]
+        while peek() == ('keyword', 'OR'):
+            take()
+            terms.append(conjunction())
+        return terms[0] if len(terms) == 1 else ('or', terms)
+
+    def conjunction():
+        "Helper"
+        factors = [factor()]
+        while peek() == ('keyword', 'AND'):
+            take()
+            factors.append(factor())
+        return factors[0] if len(factors) == 1 else ('and', factors)
+
+    def factor():
+        "Helper"
+        if peek() == ('keyword', 'NOT'):
+            take()
+            return ('not', factor())
+        if peek() == ('op', '('):
+            take()
+            inner = expression()
+            take('op', ')')
+            return inner
+
+        field = take('value').lower()
+        negated = False
+        if peek() == ('keyword', 'NOT'):
+            take()
+            negated = True
+        if peek() == ('keyword', 'IN'):
+            take()
+            take('op', '(')
+            values = [take('value')]
+            while peek() == ('op', ','):
+                take()
+                values.append(take('value'))
+            take('op', ')')
+            return ('clause', field, '!=' if negated else '=', values)
+        if negated:
+            raise CqlError('Expected IN after NOT in CQL "{}"'.format(cql))
+        operator = take('op')
+        if operator not in OPERATORS:
+            raise CqlError('Unexpected "{}" in CQL "{}"'.format(operator, cql))
+        return ('clause', field, operator, [take('value')])
+
+    tree = expression()
+    if peek()[0] is not None:
+        raise CqlError('Unexpected "{}" in CQL "{}"'.format(peek()[1], cql))
+    return tree
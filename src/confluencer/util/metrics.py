@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Run-time metrics: counters, gauges and latency histograms, with labels.
+
+    All metrics of a run go into the global :py:data:`REGISTRY`.
+    The API object feeds it via a ``requests`` response hook
+    (:py:func:`response_hook`), commands add their own counters.
+
+    For monitoring scheduled runs, the registry can be written in the
+    Prometheus text exposition format, to a file for the ``node_exporter``
+    textfile collector, or pushed to a Pushgateway.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import re
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+from .._compat import urlparse
+
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+API_PREFIX = '/rest/api/'
+METRICS_PREFIX = 'confluencer_'
+HTTP_TOO_MANY_REQUESTS = 429
+ID_SEGMENT = re.compile(r'(?<![^/])\d+(?![^/])')
+
+
+class Histogram(object):
+    """A histogram with fixed buckets, plus count, sum, min and max."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is for values above all bounds
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        """Add a single value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, fraction):
+        """Estimate a quantile, as the upper bound of the bucket it falls into."""
+        if not self.count:
+            return None
+        rank, seen = fraction * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        """Return a JSON-serializable representation."""
+        return dict(count=self.count, sum=self.sum, min=self.min, max=self.max,
+                    buckets=[[bound, count] for bound, count in zip(self.buckets + ('+Inf',), self.counts)])
+
+
+class Registry(object):
+    """ Thread-safe collection of named counters, gauges, and histograms.
+
+        Each metric name can have several series, distinguished by
+        their keyword labels.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        """Return the key of a series."""
+        return name, tuple(sorted(labels.items()))
+
+    def reset(self):
+        """Forget all values, and restart the clock."""
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        """Add ``value`` to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge to ``value``."""
+        key = self._key(name, labels)
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """Add a value to a histogram."""
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Context manager adding its run time to a histogram."""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started, **labels)
+
+    def value(self, name, **labels):
+        """Return the value of a counter series."""
+        return self.counters.get(self._key(name, labels), 0)
+
+    def total(self, name):
+        """Return the sum of all series of a counter."""
+        with self._lock:
+            return sum(value for (key, _), value in self.counters.items() if key == name)
+
+    def snapshot(self):
+        """Return all metrics as a JSON-serializable dict."""
+        with self._lock:
+            return dict(
+                started=self.started,
+                elapsed=time.time() - self.started,
+                counters=[dict(name=name, labels=dict(labels), value=value)
+                          for (name, labels), value in sorted(self.counters.items())],
+                gauges=[dict(name=name, labels=dict(labels), value=value)
+                        for (name, labels), value in sorted(self.gauges.items())],
+                histograms=[dict(name=name, labels=dict(labels), **histogram.as_dict())
+                            for (name, labels), histogram in sorted(self.histograms.items())],
+            )
+
+
+REGISTRY = Registry()
+
+
+def endpoint_of(url):
+    """ Return the endpoint of an API URL, for use as a label.
+
+        The REST API prefix and query are dropped, and numeric
+        path segments (IDs) replaced by ``{id}``.
+    """
+    path = urlparse(url).path
+    pos = path.find(API_PREFIX)
+    if pos >= 0:
+        path = path[pos + len(API_PREFIX):]
+    return ID_SEGMENT.sub('{id}', path.strip('/')) or '/'
+
+
+def response_hook(response, *_, **__):
+    """ A ``requests`` response hook, recording request counts, latencies, and bytes transferred.
+
+        Responses served by a cache are not recorded.
+    """
+    if getattr(response, 'from_cache', False):
+        return
+    request = response.request
+    labels = dict(method=request.method, endpoint=endpoint_of(request.url))
+    REGISTRY.inc('http_requests_total', status=str(response.status_code), **labels)
+    if response.status_code == HTTP_TOO_MANY_REQUESTS:
+        REGISTRY.inc('http_throttled_total', **labels)
+    REGISTRY.observe('http_request_seconds', response.elapsed.total_seconds(), **labels)
+    REGISTRY.inc('http_response_bytes_total', len(response.content or b''), **labels)
+    body = request.body
+    REGISTRY.inc('http_request_bytes_total', len(body) if body else 0, **labels)
+
+
+def _size(value):
+    """Format a byte count."""
+    for unit in ('B', 'KiB', 'MiB'):
+        if value < 1024:
+            return '{:.0f} {}'.format(value, unit) if unit == 'B' else '{:.1f} {}'.format(value, unit)
+        value /= 1024.0
+    return '{:.1f} GiB'.format(value)
+
+
+def format_report(registry=None):
+    """Return a summary table of the HTTP metrics, as a list of lines."""
+    registry = registry or REGISTRY
+    with registry._lock:  # pylint: disable=protected-access
+        counters = dict(registry.counters)
+        histograms = dict(registry.histograms)
+        elapsed = time.time() - registry.started
+
+    rows = {}
+    for (name, labels), value in counters.items():
+        labels = dict(labels)
+        if name.startswith('http_'):
+            row = rows.setdefault((labels['method'], labels['endpoint']), dict(requests=0, errors=0, received=0))
+            if name == 'http_requests_total':
+                row['requests'] += value
+                if int(labels.get('status', 0)) >= 400:
+                    row['errors'] += value
+            elif name == 'http_response_bytes_total':
+                row['received'] += value
+
+    lines = ['{:<44s} {:>7s} {:>6s} {:>8s} {:>8s} {:>8s} {:>10s}'.format(
+             'Endpoint', 'Calls', 'Errors', 'Mean', 'p95', 'Max', 'Received')]
+    total_time = 0.0
+    for (method, endpoint), row in sorted(rows.items(), key=lambda i: -i[1]['requests']):
+        histogram = histograms.get(('http_request_seconds', (('endpoint', endpoint), ('method', method))))
+        mean = p95 = peak = 0.0
+        if histogram and histogram.count:
+            total_time += histogram.sum
+            mean, p95, peak = histogram.sum / histogram.count, histogram.quantile(0.95), histogram.max
+        lines.append('{:<44s} {:>7d} {:>6d} {:>7.0f}ms {:>6.0f}ms {:>6.0f}ms {:>10s}'.format(
+                     '{} {}'.format(method, endpoint)[:44], row['requests'], row['errors'],
+                     mean * 1000, p95 * 1000, peak * 1000, _size(row['received'])))
+
+    lookups = sum(v for (name, _), v in counters.items() if name == 'cache_requests_total')
+    hits = counters.get(('cache_requests_total', (('result', 'hit'),)), 0)
+    decoding = sum(h.sum for (name, _), h in histograms.items() if name == 'json_decode_seconds')
+    lines.append('')
+    lines.append('{} HTTP requests ({} received) in {:.1f}s, {:.1f}s waiting for responses,'
+                 ' {:.1f}s decoding JSON.'.format(sum(i['requests'] for i in rows.values()),
+                 _size(sum(i['received'] for i in rows.values())), elapsed, total_time, decoding))
+    if lookups:
+        lines.append('Cache: {} of {} lookups were hits ({:.0%}).'.format(hits, lookups, hits / float(lookups)))
+    mirrored = sum(v for (name, _), v in counters.items() if name == 'mirror_requests_total')
+    if mirrored:
+        lines.append('Mirror: {} requests served offline.'.format(mirrored))
+    return lines
+
+
+def _labels(labels, extra=None):
+    """Format a label set, e.g. ``{method="GET"}``."""
+    labels = sorted(dict(extra or {}, **dict(labels)).items())
+    escape = lambda value: '{}'.format(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{{{}}}'.format(','.join('{}="{}"'.format(key, escape(value)) for key, value in labels)) if labels else ''
+
+
+def format_prometheus(registry=None, prefix=METRICS_PREFIX, labels=None):
+    """ Return all metrics in the Prometheus text exposition format.
+
+        ``labels`` are added to every sample.
+    """
+    registry = registry or REGISTRY
+    with registry._lock:  # pylint: disable=protected-access
+        series = [('counter', sorted(registry.counters.items())),
+                  ('gauge', sorted(registry.gauges.items())),
+                  ('histogram', sorted(registry.histograms.items()))]
+
+    lines = []
+    for kind, items in series:
+        last_name = None
+        for (name, key_labels), value in items:
+            name = prefix + name
+            if name != last_name:
+                lines.append('# TYPE {} {}'.format(name, kind))
+                last_name = name
+            if kind != 'histogram':
+                lines.append('{}{} {}'.format(name, _labels(key_labels, labels), value))
+                continue
+            cumulative = 0
+            for bound, count in zip(value.buckets + ('+Inf',), value.counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                             name, _labels(key_labels + (('le', bound),), labels), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _labels(key_labels, labels), value.sum))
+            lines.append('{}_count{} {}'.format(name, _labels(key_labels, labels), value.count))
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path, text):
+    """ Write metrics to a file, atomically.
+
+        The text goes to a temporary file in the same directory first,
+        so a collector never reads a partial file.
+    """
+    import io
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with io.open(tmp_path, 'w', encoding='utf-8') as handle:
+        handle.write(text)
+    os.rename(tmp_path, path)
+
+
+def push(gateway_url, text, job, grouping=None, timeout=10):
+    """ Push metrics to a Pushgateway, replacing those of the same job and grouping.
+
+        ``grouping`` is a dict of additional grouping labels.
+    """
+    import requests
+    from .._compat import url_quote
+
+    quote = lambda value: url_quote('{}'.format(value).encode('utf-8'), safe='')
+    url = '{}/metrics/job/{}'.format(gateway_url.rstrip('/'), quote(job))
+    for key, value in sorted((grouping or {}).items()):
+        url += '/{}/{}'.format(key, quote(value))
+    response = requests.put(url, data=text.encode('utf-8'), timeout=timeout,
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+    response.raise_for_status()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Profiling of whole CLI runs.
+
+    Two profilers are available: a deterministic one based on ``cProfile``,
+    with one profile per thread merged into a ``pstats`` file, and a
+    sampling profiler that captures the stacks of all threads at a fixed
+    interval, written in the *speedscope* JSON format
+    (see https://www.speedscope.app/).
+
+    Either way, a summary of the hottest functions attributes their
+    time to confluencer, lxml, the HTTP stack, or other code.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import sys
+import json
+import time
+import threading
+import collections
+
+
+SAMPLE_INTERVAL = 0.005  # seconds
+JOIN_TIMEOUT = 2.0  # seconds to wait for profiled threads to end
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+# Categories of code, by path fragments of their source files (first match wins)
+CATEGORIES = (
+    ('confluencer', ('{0}confluencer{0}'.format(os.sep),)),
+    ('lxml', ('{0}lxml{0}'.format(os.sep), 'lxml.etree')),
+    ('requests', tuple('{0}{1}{0}'.format(os.sep, i) for i in ('requests', 'requests_cache', 'urllib3'))
+                 + tuple('{0}{1}'.format(os.sep, i) for i in ('http{}client.py'.format(os.sep), 'ssl.py', 'socket.py'))),
+)
+
+
+def category_of(filename):
+    """Return the category of code in ``filename``."""
+    for name, fragments in CATEGORIES:
+        if any(i in filename for i in fragments):
+            return name
+    return 'other'
+
+
+class DeterministicProfiler(object):
+    """ Profile all threads with ``cProfile``, one profile per thread.
+
+        Threads started while the profiler runs get their own profile,
+        by way of ``threading.setprofile``. A profile can only be disabled
+        by its own thread, so on :py:meth:`stop` the profiles of other
+        threads are collected once these threads have ended; those still
+        running after ``timeout`` seconds are left out, and counted in
+        :py:attr:`skipped`.
+    """
+
+    def __init__(self, timeout=JOIN_TIMEOUT):
+        self.timeout = timeout
+        self.profiles = []  # (thread, profile)
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def _new_profile(self):
+        """Create and enable a profile for the current thread."""
+        import cProfile
+
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append((threading.current_thread(), profile))
+        profile.enable()
+
+    def _thread_hook(self, *_):
+        """Profile hook of new threads, which replaces itself by a real profile."""
+        sys.setprofile(None)
+        self._new_profile()
+
+    def start(self):
+        """Start profiling."""
+        threading.setprofile(self._thread_hook)
+        self._new_profile()
+
+    def stop(self):
+        """Stop profiling, and return the merged ``pstats.Stats``."""
+        import pstats
+
+        threading.setprofile(None)
+        current = threading.current_thread()
+        with self._lock:
+            profiles = list(self.profiles)
+        for thread, profile in profiles:
+            if thread is current:
+                profile.disable()
+
+        deadline = time.time() + self.timeout
+        stats = None
+        for thread, profile in profiles:
+            if thread is not current:
+                # Wait until the thread cannot write into its profile anymore
+                thread.join(max(0.0, deadline - time.time()))
+                if thread.is_alive():
+                    self.skipped += 1
+                    continue
+            profile.create_stats()
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        return stats
+
+    @staticmethod
+    def hot_functions(stats):
+        """Yield ``(category, function, own_time, total_time)`` for all functions in ``stats``."""
+        for (filename, lineno, name), (_, _, own_time, total_time, _) in stats.stats.items():
+            label = name if filename == '~' else '{} ({}:{})'.format(name, os.path.basename(filename), lineno)
+            yield category_of(filename), label, own_time, total_time
+
+    @staticmethod
+    def save(stats, path):
+        """Write a ``pstats`` file."""
+        stats.dump_stats(path)
+
+
+class SamplingProfiler(object):
+    """Sample the stacks of all threads in a background thread."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.frames = []
+        self.frame_index = {}
+        self.samples = collections.defaultdict(list)  # thread name -> [(timestamp, stack)]
+        self.started = self.stopped = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _frame_id(self, code):
+        """Return the index of a code object in the shared frame table."""
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        if key not in self.frame_index:
+            self.frame_index[key] = len(self.frames)
+            self.frames.append(dict(name=code.co_name, file=code.co_filename, line=code.co_firstlineno))
+        return self.frame_index[key]
+
+    def _sample(self):
+        """Record the current stacks of all other threads."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        now = time.time()
+        for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if ident == self._thread.ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[names.get(ident, str(ident))].append((now, stack))
+
+    def _run(self):
+        """Sampling loop."""
+        while not self._stopping.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        """Start sampling."""
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name='profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, and return the profiler itself (as the "stats")."""
+        self._stopping.set()
+        self._thread.join()
+        self.stopped = time.time()
+        return self
+
+    def hot_functions(self, stats=None):
+        """Yield ``(category, function, own_time, total_time)`` for all sampled functions."""
+        own, total = collections.Counter(), collections.Counter()
+        for samples in (stats or self).samples.values():
+            for _, stack in samples:
+                own[stack[-1]] += self.interval
+                for frame_id in set(stack):
+                    total[frame_id] += self.interval
+        for frame_id, total_time in total.items():
+            frame = self.frames[frame_id]
+            yield (category_of(frame['file']), '{} ({}:{})'.format(
+                   frame['name'], os.path.basename(frame['file']), frame['line']),
+                   own[frame_id], total_time)
+
+    def speedscope(self):
+        """Return the samples as a speedscope document."""
+        profiles = []
+        for name, samples in sorted(self.samples.items()):
+            profiles.append(dict(
+                type='sampled', name=name, unit='seconds',
+                startValue=0, endValue=self.stopped - self.started,
+                samples=[stack for _, stack in samples],
+                weights=[self.interval] * len(samples),
+            ))
+        return {'$schema': SPEEDSCOPE_SCHEMA, 'shared': dict(frames=self.frames),
+                'profiles': profiles, 'name': 'confluencer', 'exporter': 'confluencer'}
+
+    def save(self, stats, path):
+        """Write a speedscope JSON file."""
+        with open(path, 'w') as handle:
+            json.dump((stats or self).speedscope(), handle)
+
+
+PROFILERS = dict(deterministic=DeterministicProfiler, sampling=SamplingProfiler)
+
+
+def format_hot_functions(hot, limit=20):
+    """ Return a report of the hottest functions, as a list of lines.
+
+        ``hot`` is an iterable as returned by the profilers' ``hot_functions``.
+    """
+    hot = sorted(hot, key=lambda i: -i[2])
+    by_category = collections.Counter()
+    for category, _, own_time, _ in hot:
+        by_category[category] += own_time
+    overall = sum(by_category.values()) or 1.0
+
+    lines = ['Own time by category: ' + ', '.join('{} {:.2f}s ({:.0%})'.format(name, seconds, seconds / overall)
+                                                  for name, seconds in by_category.most_common())]
+    lines.append('{:>9s} {:>9s}  {:<12s} {}'.format('Own', 'Total', 'Category', 'Function'))
+    for category, label, own_time, total_time in hot[:limit]:
+        lines.append('{:8.3f}s {:8.3f}s  {:<12s} {}'.format(own_time, total_time, category, label))
+    return lines
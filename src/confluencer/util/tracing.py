@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=bad-continuation
+""" Lightweight tracing spans, with pluggable exporters.
+
+    Spans nest per thread, and :py:func:`wrap` carries the current span
+    over into worker threads, so concurrent work shows up as children
+    of the span that started it. Finished spans are handed to all
+    exporters of the global :py:data:`TRACER`; without any exporter,
+    tracing is disabled and spans cost next to nothing.
+
+    Exporters write JSON lines (:py:class:`JsonLinesExporter`), or post
+    batches to an OpenTelemetry collector (:py:class:`OtlpExporter`,
+    using OTLP/HTTP with JSON encoding).
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import json
+import time
+import random
+import logging
+import functools
+import threading
+
+
+OTLP_DEFAULT_URL = 'http://localhost:4318/v1/traces'
+OTLP_STATUS_OK, OTLP_STATUS_ERROR = 1, 2
+OTLP_KIND_INTERNAL, OTLP_KIND_CLIENT = 1, 3
+
+
+class Span(object):
+    """ A timed operation, used as a context manager.
+
+        Exceptions leaving the span mark it as failed.
+    """
+
+    def __init__(self, tracer, name, attributes, kind='internal'):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.kind = kind
+        self.trace_id = self.span_id = self.parent_id = None
+        self.start = self.end = None
+        self.thread = None
+        self.error = None
+
+    def set(self, key, value):
+        """Set an attribute."""
+        self.attributes[key] = value
+
+    def __enter__(self):
+        parent = self.tracer.current()
+        self.trace_id = parent.trace_id if parent else '{:032x}'.format(random.getrandbits(128))
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = '{:016x}'.format(random.getrandbits(64))
+        self.thread = threading.current_thread().name
+        self.tracer._stack().append(self)  # pylint: disable=protected-access
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, _):
+        self.end = time.time()
+        stack = self.tracer._stack()  # pylint: disable=protected-access
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.error = '{}: {}'.format(exc_type.__name__, exc_value)
+        self.tracer.export(self)
+
+    def as_dict(self):
+        """Return the span as a JSON-serializable dict."""
+        return dict(name=self.name, trace_id=self.trace_id, span_id=self.span_id, parent_id=self.parent_id,
+                    start=self.start, end=self.end, duration_ms=round((self.end - self.start) * 1000.0, 3),
+                    thread=self.thread, kind=self.kind, attributes=self.attributes, error=self.error)
+
+
+class _NullSpan(object):
+    """The span used when tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+    def set(self, key, value):
+        """Ignore an attribute."""
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer(object):
+    """Keeps the span stacks of all threads, and the active exporters."""
+
+    def __init__(self):
+        self.exporters = []
+        self._local = threading.local()
+
+    def _stack(self):
+        """Return the span stack of the current thread."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @property
+    def enabled(self):
+        """Is any exporter active?"""
+        return bool(self.exporters)
+
+    def current(self):
+        """Return the innermost open span of the current thread, or ``None``."""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def span(self, name, kind='internal', **attributes):
+        """Return a new span (to be used in a ``with`` statement)."""
+        if not self.exporters:
+            return NULL_SPAN
+        return Span(self, name, attributes, kind=kind)
+
+    def export(self, span):
+        """Pass a finished span to all exporters."""
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def shutdown(self):
+        """Flush and remove all exporters."""
+        exporters, self.exporters = self.exporters, []
+        for exporter in exporters:
+            exporter.shutdown()
+
+
+TRACER = Tracer()
+
+
+def span(name, kind='internal', **attributes):
+    """Return a new span of the global tracer."""
+    return TRACER.span(name, kind=kind, **attributes)
+
+
+def traced(name):
+    """Decorator running each call of a function in a span called ``name``."""
+    def decorator(func):
+        "Decorator"
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            "Wrapper"
+            if not TRACER.exporters:
+                return func(*args, **kwargs)
+            with TRACER.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(func):
+    """ Bind ``func`` to the current span, for calling it in another thread.
+
+        Spans created by ``func`` then become children of the current span.
+    """
+    parent = TRACER.current()
+    if parent is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        "Wrapper"
+        stack = TRACER._stack()  # pylint: disable=protected-access
+        depth = len(stack)
+        stack.append(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            del stack[depth:]
+    return wrapper
+
+
+class JsonLinesExporter(object):
+    """Write each finished span as a line of JSON to a text stream."""
+
+    def __init__(self, stream, close=False):
+        self.stream = stream
+        self.close = close
+        self._lock = threading.Lock()
+
+    def export(self, finished):
+        """Write a span."""
+        line = json.dumps(finished.as_dict(), sort_keys=True, default=str)
+        with self._lock:
+            self.stream.write(line + '\n')
+
+    def shutdown(self):
+        """Flush (and maybe close) the stream."""
+        with self._lock:
+            self.stream.flush()
+            if self.close:
+                self.stream.close()
+
+
+def _otlp_value(value):
+    """Return an OTLP ``AnyValue`` for a Python value."""
+    if isinstance(value, bool):
+        return dict(boolValue=value)
+    if isinstance(value, int):
+        return dict(intValue=str(value))
+    if isinstance(value, float):
+        return dict(doubleValue=value)
+    return dict(stringValue='{}'.format(value))
+
+
+def otlp_span(finished):
+    """Return a span in OTLP/JSON form."""
+    result = dict(
+        traceId=finished.trace_id, spanId=finished.span_id, name=finished.name,
+        kind=OTLP_KIND_CLIENT if finished.kind == 'client' else OTLP_KIND_INTERNAL,
+        startTimeUnixNano=str(int(finished.start * 1e9)), endTimeUnixNano=str(int(finished.end * 1e9)),
+        attributes=[dict(key=key, value=_otlp_value(value)) for key, value in sorted(finished.attributes.items())]
+                   + [dict(key='thread.name', value=_otlp_value(finished.thread))],
+        status=dict(code=OTLP_STATUS_ERROR, message=finished.error) if finished.error
+               else dict(code=OTLP_STATUS_OK),
+    )
+    if finished.parent_id:
+        result['parentSpanId'] = finished.parent_id
+    return result
+
+
+class OtlpExporter(object):
+    """ Post spans in batches to an OTLP/HTTP collector (JSON encoding).
+
+        Failing posts are logged once, and their spans dropped.
+    """
+
+    def __init__(self, url=OTLP_DEFAULT_URL, service_name='confluencer', batch_size=512, timeout=10):
+        self.url = url
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.pending = []
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def export(self, finished):
+        """Add a span to the batch, and post the batch when full."""
+        with self._lock:
+            self.pending.append(otlp_span(finished))
+            batch = self._take() if len(self.pending) >= self.batch_size else None
+        if batch:
+            self._post(batch)
+
+    def _take(self):
+        """Return and clear the pending spans."""
+        batch, self.pending = self.pending, []
+        return batch
+
+    def payload(self, spans):
+        """Return an OTLP ``ExportTraceServiceRequest`` for some spans."""
+        return dict(resourceSpans=[dict(
+            resource=dict(attributes=[dict(key='service.name', value=_otlp_value(self.service_name))]),
+            scopeSpans=[dict(scope=dict(name='confluencer'), spans=spans)],
+        )])
+
+    def _post(self, batch):
+        """Send a batch to the collector."""
+        import requests
+
+        try:
+            response = requests.post(self.url, json=self.payload(batch), timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as cause:
+            if not self.failed:
+                logging.getLogger('cftrace').error('Cannot export spans to %s: %s', self.url, cause)
+            self.failed = True
+
+    def shutdown(self):
+        """Post any remaining spans."""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._post(batch)
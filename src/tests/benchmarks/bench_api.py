@@ -0,0 +1,60 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Benchmarks for :py:mod:`confluencer.api` and API-bound commands, against a fake server.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import pytest
+from click.testing import CliRunner
+
+from confluencer import api, fakewiki
+from confluencer import __main__ as main
+
+
+LATENCY = 0.005  # seconds per request, to make waiting on the network visible
+
+
+@pytest.fixture
+def cf(bench_server):
+    return api.ConfluenceAPI(endpoint=bench_server.url)
+
+
+def test_walk(benchmark, bench_server, cf):
+    root = 'content/{}'.format(bench_server.wiki.spaces['SYN']['homepage'])
+    pages = benchmark(lambda: list(cf.walk(root, expand='version')))
+    assert len(pages) == len(bench_server.wiki.pages)
+
+
+@pytest.mark.parametrize('prefetch', [False, True], ids=['sequential', 'prefetch'])
+def test_getall_search(benchmark, bench_server, cf, monkeypatch, prefetch):
+    monkeypatch.setattr(bench_server.wiki, 'faults', fakewiki.Faults(latency=LATENCY))
+    found = benchmark(lambda: list(cf.getall('content/search', cql='space = SYN and type = page',
+                                             expand='version', _prefetch=prefetch)))
+    assert len(found) == len(bench_server.wiki.pages)
+
+
+def test_stats_tree_export(benchmark, bench_server, tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('cache')))
+    monkeypatch.setenv('CONFLUENCER_NO_DAEMON', '1')
+    monkeypatch.setenv('CONFLUENCE_BASE_URL', bench_server.url)
+    outfile = str(tmpdir.join('tree.ndjson'))
+    root = 'content/{}'.format(bench_server.wiki.spaces['SYN']['homepage'])
+
+    result = benchmark.pedantic(CliRunner().invoke, (main.cli, ['stats', '-o', outfile, 'tree', root]),
+                                rounds=5, warmup_rounds=1)
+    assert result.exit_code == 0, result.output
+    assert sum(1 for _ in open(outfile)) == len(bench_server.wiki.pages)
@@ -0,0 +1,44 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods, protected-access
+""" Benchmarks for :py:mod:`confluencer.tools.content`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+from confluencer import api
+from confluencer.tools import content
+
+
+def test_tidy_regex_rules(benchmark, corpus):
+    benchmark.extra_info['bytes'] = sum(len(i) for i in corpus)
+    tidied = benchmark(lambda: [content._apply_tidy_regex_rules(i) for i in corpus])
+    assert len(tidied) == len(corpus)
+
+
+def test_make_etree(benchmark, corpus):
+    benchmark.extra_info['bytes'] = sum(len(i) for i in corpus)
+    trees = benchmark(lambda: [content._make_etree(i) for i in corpus])
+    assert len(trees) == len(corpus)
+
+
+def test_dump_diff_large_page(benchmark, bench_server, capsys):
+    cf = api.ConfluenceAPI(endpoint=bench_server.url)
+    page = content.ConfluencePage(cf, 'content/{}'.format(bench_server.large_page['id']))
+    changed = page.tidy()
+    benchmark.extra_info['bytes'] = len(page.body)
+
+    benchmark(page.dump_diff, changed)
+    assert '+++ v. 2 of "Large page"' in capsys.readouterr().out
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=redefined-outer-name
+""" Fixtures for the benchmarks.
+
+    Benchmarks are not part of the normal test run, use
+    ``invoke bench`` to run them (see ``tasks.py``).
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import pytest
+
+from confluencer.fakewiki import FakeWiki, FakeServer, synthetic_body
+
+
+# Fixed seeds, so results are comparable across commits
+SEED = 4711
+TREE_PAGES = 300
+LARGE_BODY_SIZE = 200000
+
+
+@pytest.fixture(scope='session')
+def bench_server():
+    """A fake server with a tree of synthetic pages below the home page, and one large page."""
+    wiki = FakeWiki().generate(spaces=1, pages=TREE_PAGES, fanout=6, depth=4, body_size=3000, seed=SEED)
+    with FakeServer(wiki) as server:
+        import random
+
+        server.large_page = wiki.add_page('SYN', 'Large page', synthetic_body(
+                                          random.Random(SEED), LARGE_BODY_SIZE, foswiki=True))
+        yield server
+
+
+@pytest.fixture(scope='session')
+def corpus():
+    """Bodies of pages migrated from FosWiki, of typical sizes."""
+    wiki = FakeWiki().generate(spaces=1, pages=200, fanout=10, depth=3, body_size=6000, foswiki=1.0, seed=SEED)
+    return [page['body'] for page in wiki.pages.values() if page['ancestors']]
@@ -32,3 +32,18 @@ def logger():
     """Test logger instance as a fixture."""
     logging.basicConfig(level=logging.DEBUG)
     return logging.getLogger('tests')
+
+
+@pytest.fixture
+def fake_server(tmpdir, monkeypatch):
+    """A running fake Confluence server with a small synthetic space, used as the API endpoint."""
+    from confluencer.fakewiki import FakeWiki, FakeServer
+    from confluencer.util import metrics
+
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('cache')))
+    monkeypatch.setenv('CONFLUENCER_NO_DAEMON', '1')
+    metrics.REGISTRY.reset()
+    wiki = FakeWiki().generate(spaces=1, pages=30, fanout=3, depth=3, body_size=1500, foswiki=1.0)
+    with FakeServer(wiki) as server:
+        monkeypatch.setenv('CONFLUENCE_BASE_URL', server.url)
+        yield server
@@ -18,6 +18,8 @@
 # limitations under the License.
 from __future__ import absolute_import, unicode_literals, print_function
 
+import time
+
 import pytest
 
 from confluencer import api
@@ -44,6 +46,33 @@ def test_tiny_id_from_page_id(page_id, tiny_id):
     assert tiny_id == api.tiny_id(page_id)
 
 
+@pytest.mark.parametrize('page_id', [1, 255, 256, 65536, 3974246, 5063416, 2**24 + 1, 2**32 - 1])
+def test_tiny_link_round_trip(page_id):
+    code = api.tiny_id(page_id)
+    assert api.page_id_from_tiny_link('/x/' + code) == page_id
+
+
+def test_tiny_links_in_batches():
+    page_ids = [3974246, 5063416, 1, 2**32 - 1]
+    codes = api.tiny_ids(page_ids)
+
+    assert codes == [api.tiny_id(i) for i in page_ids]
+    assert api.page_ids_from_tiny_links(codes) == page_ids
+    assert api.page_ids_from_tiny_links([]) == []
+    with pytest.raises(ValueError):
+        api.page_ids_from_tiny_links(['ZqQ8', 'no/code'])
+
+
+@pytest.mark.parametrize('text', [
+    'See <a href="/x/ZqQ8">this</a> and https://confluence.example.com/x/_EJN, or /x/#.',
+    b'See <a href="/x/ZqQ8">this</a> and https://confluence.example.com/x/_EJN, or /x/#.',
+])
+def test_tiny_links_are_extracted(text):
+    found = list(api.iter_tiny_links(text, chunk_size=1))
+
+    assert [(i[0], i[2]) for i in found] == [(13, 3974246), (65, 5063416)]
+
+
 def test_api_with_explicit_endpoint():
     url = 'https://confluence.example.com/'
     cf = api.ConfluenceAPI(endpoint=url)
@@ -63,3 +92,26 @@ def test_api_url_from_page_link(expected, link):
     cf = api.ConfluenceAPI(endpoint='https://confluence.example.com/')
     api_url = cf.url(cf.base_url + link)
     assert api_url == cf.base_url + expected
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_getall_follows_next_links(prefetch):
+    cf = api.ConfluenceAPI(endpoint='https://confluence.example.com/')
+    responses = {
+        'start': dict(results=[1, 2], _links=dict(next='p2')),
+        'p2': dict(results=[3, 4], _links=dict(next='p3')),
+        'p3': dict(results=[5]),
+    }
+    cf.get = lambda path, **_: responses[path]
+
+    assert list(cf.getall('start', _prefetch=prefetch)) == [1, 2, 3, 4, 5]
+    assert list(cf.getall('start', limit=3, _prefetch=prefetch)) == [1, 2, 3]
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = api.RateLimiter(rate=200)
+    started = time.time()
+    for _ in range(5):
+        limiter.wait()
+
+    assert time.time() - started >= 4 / 200.0
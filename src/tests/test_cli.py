@@ -22,6 +22,7 @@ from __future__ import absolute_import, unicode_literals, print_function
 
 import os
 import sys
+import subprocess
 
 import sh
 import pytest
@@ -35,6 +36,11 @@ from confluencer import commands
 
 UsageError = sh.ErrorReturnCode_2  # pylint: disable=no-member
 
+# Upper limit for the summed-up import time of 'cfr --version' or 'cfr --help', in µs
+STARTUP_BUDGET = 750 * 1000
+# Modules that must not be imported for '--version' or '--help'
+HEAVY_MODULES = {'lxml', 'arrow', 'requests', 'requests_cache', 'tqdm', 'addict', 'pkg_resources'}
+
 
 @pytest.fixture
 def cmd():
@@ -103,3 +109,37 @@ def test_cmd_help():
     assert 'configuration' in words
     assert any(i.endswith(os.sep + 'cli.conf') for i in words), \
            "Some '.conf' files listed in " + repr(words)
+
+
+@cli
+@pytest.mark.parametrize('option', ['--version', '--help'])
+def test_cli_startup_is_lazy(option):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-m', main.__app_name__, option],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    timings = [line.split(':', 1)[1].split('|') for line in result.stderr.decode('utf-8').splitlines()
+               if line.startswith('import time:') and 'self [us]' not in line]
+    modules = {name.strip() for _, _, name in timings}
+    total = sum(int(self_time) for self_time, _, _ in timings)
+    output = result.stdout.decode('utf-8')
+
+    assert (version if option == '--version' else 'tidy ') in output
+    assert not HEAVY_MODULES & modules, "Heavy modules are imported on startup"
+    assert not [i for i in modules if i.startswith('confluencer.commands.')], "Commands are loaded lazily"
+    assert total < STARTUP_BUDGET, "Startup imports take {:.0f} msec".format(total / 1000.0)
+
+
+@cli
+def test_lazy_short_help_matches_commands():
+    commands.load_all()
+
+    for name, (_, short_help) in commands.COMMAND_MODULES.items():
+        assert main.cli.commands[name].get_short_help_str(limit=200) == short_help
+
+
+@cli
+def test_cli_loads_command_on_demand():
+    runner = CliRunner()
+    result = runner.invoke(main.cli, args=('grep', '--help'))
+
+    assert result.exit_code == 0
+    assert 'grep' in main.cli.commands
@@ -0,0 +1,148 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.commands.stats`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import json
+import collections
+
+import pytest
+from munch import Munch as Bunch
+from click.testing import CliRunner
+
+from confluencer import api
+from confluencer import __main__ as main
+from confluencer.commands import stats
+from confluencer.util import cql
+
+
+class StubSearch(object):
+    """Answers searches from canned results, keyed by the entity's CQL filter."""
+
+    def __init__(self, results, total=None):
+        self.results = results
+        self.total = total
+        self.searches = []
+
+    def get(self, _, **params):
+        self.searches.append(('get', params['cql']))
+        return Bunch(results=[]) if self.total is None else Bunch(results=[], totalSize=self.total)
+
+    def getall(self, _, cql=None, **__):
+        self.searches.append(('getall', cql))
+        for entity, items in self.results.items():
+            if cql.startswith(stats.ENTITY_VOLUME_CQL[entity] + ' '):
+                return iter(items)
+        return iter([])
+
+
+def labeled(*names):
+    return Bunch.fromDict(dict(metadata=dict(labels=dict(results=[dict(name=i) for i in names]))))
+
+
+@pytest.mark.parametrize('entity', stats.ENTITIES)
+def test_entity_filters_are_valid_cql(entity):
+    cql_filter = stats.ENTITY_USAGE[entity][0]
+    assert cql.parse(cql_filter.format(query='foo') + ' AND space="SYN"')[0] == 'and'
+    if entity in stats.ENTITY_VOLUME_CQL:
+        assert cql.parse(stats.ENTITY_VOLUME_CQL[entity])[0] == 'clause'
+
+
+def test_entity_usage_counters():
+    macro_counter = stats.ENTITY_USAGE['macro'][2]
+    body = '<ac:structured-macro ac:name="info"/><p/><ac:macro ac:name="info"/><ac:macro ac:name="toc"/>'
+    assert macro_counter(Bunch.fromDict(dict(body=dict(storage=dict(value=body)))), 'info') == 2
+
+    attachment_counter = stats.ENTITY_USAGE['attachment'][2]
+    assert attachment_counter(Bunch.fromDict(dict(extensions=dict(fileSize=1234))), 'x') == 1234
+    assert attachment_counter(Bunch.fromDict(dict(extensions=dict(fileSize=None))), 'x') == 0
+    assert all(stats.ENTITY_USAGE[i][2] is None for i in ('label', 'page', 'title', 'blog'))
+
+
+def test_count_cql_prefers_server_total():
+    cf = StubSearch(dict(page=[Bunch()] * 3), total=42)
+    assert stats.count_cql(cf, 'type=page AND space="SYN"') == 42
+    assert [i[0] for i in cf.searches] == ['get']
+
+
+def test_count_cql_pages_without_server_total():
+    cf = StubSearch(dict(page=[Bunch()] * 3))
+    assert stats.count_cql(cf, 'type=page AND space="SYN"') == 3
+    assert [i[0] for i in cf.searches] == ['get', 'getall']
+
+
+def test_space_volume_aggregates_attachments_and_labels():
+    cf = StubSearch(dict(
+        attachment=[Bunch(extensions=Bunch(fileSize=100)), Bunch(extensions=Bunch(fileSize=None)),
+                    Bunch(extensions=Bunch(fileSize=23))],
+        label=[labeled('howto', 'draft'), labeled('howto'), labeled(), labeled('archive', 'howto', 'draft')],
+    ))
+    record = stats.space_volume(cf, 'SYN', ['attachment', 'label'])
+    assert record == dict(space='SYN', attachments=3, attachment_bytes=123, label_uses=6, labels=3,
+                          top_labels='howto:3 draft:2 archive:1')
+    assert all(i[1].endswith(' AND space="SYN"') for i in cf.searches)
+
+
+def test_space_volume_counts_pages_and_blogs(fake_server):
+    wiki = fake_server.wiki
+    cf = api.ConfluenceAPI(endpoint=fake_server.url)
+    record = stats.space_volume(cf, 'SYN', ['page', 'blog'])
+    assert record == dict(space='SYN', pages=len(wiki.pages), blogs=0)
+    assert wiki.requests['GET', 'content/search'] == 2  # one request per count, using "totalSize"
+
+
+def test_cli_stats_volume_reports_each_space(fake_server):
+    wiki = fake_server.wiki
+    wiki.add_space('DOC')
+    wiki.add_page('DOC', 'Guide', '<p>Read me.</p>', labels=['howto'])
+    pages = collections.Counter(page['space'] for page in wiki.pages.values())
+    labels = collections.Counter(label for page in wiki.pages.values() if page['space'] == 'SYN'
+                                 for label in page['labels'])
+
+    result = CliRunner(mix_stderr=False).invoke(main.cli, ['stats', '-f', 'ndjson', 'volume'])
+    assert result.exit_code == 0, result.output
+    records = {i['space']: i for i in (json.loads(line) for line in result.stdout.splitlines())}
+    assert sorted(records) == ['DOC', 'SYN']
+    assert records['DOC'] == dict(space='DOC', pages=pages['DOC'], blogs=0, attachments=0,
+                                  attachment_bytes=0, label_uses=1, labels=1, top_labels='howto:1')
+    assert records['SYN']['pages'] == pages['SYN']
+    assert records['SYN']['label_uses'] == sum(labels.values())
+    assert records['SYN']['labels'] == len(labels)
+
+
+def test_cli_stats_volume_of_selected_space_and_entity(fake_server):
+    result = CliRunner(mix_stderr=False).invoke(main.cli, ['stats', '-f', 'ndjson', '-s', 'SYN', '-e', 'page',
+                                                           'volume'])
+    assert result.exit_code == 0, result.output
+    records = [json.loads(i) for i in result.stdout.splitlines()]
+    assert records == [dict(space='SYN', pages=len(fake_server.wiki.pages))]
+
+    result = CliRunner(mix_stderr=False).invoke(main.cli, ['stats', '-e', 'title', 'volume'])
+    assert result.exit_code != 0
+    assert 'No volume report for entity "title"' in result.stderr
+
+
+def test_cli_stats_usage_counts_labels(fake_server):
+    wiki = fake_server.wiki
+    expected = sorted(str(i['id']) for i in wiki.pages.values() if 'howto' in i['labels'])
+    result = CliRunner(mix_stderr=False).invoke(main.cli, ['stats', '-f', 'ndjson', '-e', 'label',
+                                                           'usage', 'howto'])
+    assert result.exit_code == 0, result.output
+    records = [json.loads(i) for i in result.stdout.splitlines()]
+    assert sorted(i['id'] for i in records) == expected
+    assert all(i['space'] == 'SYN' and i['count'] == 1 for i in records)
@@ -0,0 +1,148 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.daemon`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import socket
+import threading
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from confluencer import daemon
+from confluencer import __main__ as main
+
+
+@click.command()
+@click.argument('word')
+def shout(word):
+    click.echo('{} {}'.format(word.upper(), os.environ.get('CONFLUENCER_SHOUT_SUFFIX', '')))
+    if word == 'fail':
+        raise click.ClickException('Failed!')
+
+
+@pytest.fixture
+def server(tmpdir):
+    result = daemon.Daemon(shout, path=str(tmpdir.join('test.sock')))
+    result.bind()
+    thread = threading.Thread(target=result.serve_forever)
+    thread.start()
+    yield result
+    daemon.stop(result.path)
+    thread.join(5)
+    assert not os.path.exists(result.path)
+
+
+def call(server, tmpdir, *argv):
+    out = tmpdir.join('out.txt')
+    with open(str(out), 'w+') as handle:
+        exit_code = daemon.forward(argv, 'shout', path=server.path, fds=(0, handle.fileno(), handle.fileno()))
+    return exit_code, out.read()
+
+
+def test_daemon_runs_commands_with_client_streams(server, tmpdir, monkeypatch):
+    monkeypatch.setenv('CONFLUENCER_SHOUT_SUFFIX', '!')
+
+    assert call(server, tmpdir, 'hello') == (0, 'HELLO !\n')
+    assert 'CONFLUENCER_SHOUT_SUFFIX' in os.environ
+    assert call(server, tmpdir, 'fail') == (1, 'FAIL !\nError: Failed!\n')
+
+
+def test_commands_are_not_forwarded_without_daemon(tmpdir):
+    assert daemon.forward(['hello'], 'shout', path=str(tmpdir.join('none.sock'))) is None
+
+
+def test_excluded_commands_are_not_forwarded(server):
+    assert daemon.forward(['rm', 'tree'], 'shout', path=server.path) is None
+    assert daemon.forward(['--trace', 'serve', 'rm', 'tree'], 'shout', path=server.path,
+                          value_opts=['--trace']) is None
+
+
+def test_only_the_subcommand_name_is_matched():
+    assert daemon.subcommand(['-q', '--trace', 'rm', 'grep', 'rm'], ['--trace']) == 'grep'
+    assert daemon.subcommand(['--trace=-', 'tidy', 'serve']) == 'tidy'
+    assert daemon.subcommand(['-v']) is None
+    assert '--trace' in daemon.value_options(main.cli) and '--quiet' not in daemon.value_options(main.cli)
+
+
+def test_only_needed_environment_is_forwarded():
+    env = daemon.forwarded_env(dict(CONFLUENCE_BASE_URL='x', LANG='C', LC_ALL='C', AWS_SECRET_ACCESS_KEY='s',
+                                    SSH_AUTH_SOCK='/tmp/agent', PATH='/bin'))
+    assert env == dict(CONFLUENCE_BASE_URL='x', LANG='C', LC_ALL='C')
+
+
+def test_sockets_in_shared_directories_are_ignored(tmpdir):
+    shared = tmpdir.mkdir('shared')
+    shared.chmod(0o777)
+    path = str(shared.join('test.sock'))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        sock.listen(1)
+        assert not daemon.is_private(path)
+        assert daemon.forward(['hello'], 'shout', path=path) is None
+        with pytest.raises(EnvironmentError):
+            daemon.Daemon(shout, path=path).bind()
+    finally:
+        sock.close()
+
+
+def test_default_socket_is_in_a_private_directory(tmpdir, monkeypatch):
+    monkeypatch.delenv('CONFLUENCER_SOCKET', raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmpdir))
+    path = daemon.socket_path()
+    daemon.make_private_dir(path)
+
+    assert os.path.dirname(path) != str(tmpdir)
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+
+
+def test_peer_uid_is_checked():
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        assert daemon.peer_uid(left) in (None, os.getuid())
+        assert daemon.is_trusted_peer(left)
+    finally:
+        left.close()
+        right.close()
+
+
+def test_each_call_gets_a_fresh_context_object():
+    seen = []
+
+    @main.cli.command(name='probe-obj')
+    @click.pass_obj
+    def probe(obj):  # pylint: disable=unused-variable
+        seen.append(dict(obj))
+        obj.leftover = True
+
+    try:
+        runner = CliRunner()
+        assert runner.invoke(main.cli, ['-q', 'probe-obj']).exit_code == 0
+        assert runner.invoke(main.cli, ['probe-obj']).exit_code == 0
+    finally:
+        del main.cli.commands['probe-obj']
+    assert seen[0]['quiet'] and not seen[1]['quiet']
+    assert 'leftover' not in seen[1]
+
+
+def test_second_daemon_is_refused(server):
+    with pytest.raises(EnvironmentError):
+        daemon.Daemon(shout, path=server.path).bind()
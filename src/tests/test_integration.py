@@ -0,0 +1,211 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Integration tests against :py:mod:`confluencer.fakewiki`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from confluencer import api, fakewiki
+from confluencer import __main__ as main
+from confluencer.commands import replace
+from confluencer.tools import bulk, content
+from confluencer.util import metrics
+
+
+def current(wiki):
+    return [i for i in wiki.pages.values() if i['status'] == 'current']
+
+
+def test_cql_subset_evaluates_like_confluence():
+    wiki = fakewiki.FakeWiki()
+    wiki.add_space('DOC')
+    page = wiki.add_page('DOC', 'Deployment Guide', '<p>deploy<ac:structured-macro ac:name="toc"/></p>',
+                         labels=['howto'], when=fakewiki.EPOCH)
+    wiki.add_page('DOC', 'Release notes', '<p>nothing</p>', parent_id=page['id'], when=fakewiki.EPOCH + 86400 * 30)
+
+    def titles(cql):
+        predicate = fakewiki.parse_cql(cql)
+        return sorted(i['title'] for i in wiki.pages.values() if predicate(i, wiki))
+
+    assert titles('space = DOC and label = howto') == ['Deployment Guide']
+    assert titles('space="DOC" AND NOT (title ~ "guide" OR title ~ home)') == ['Release notes']
+    assert titles('ancestor = {} and type in (page, blogpost)'.format(page['id'])) == ['Release notes']
+    assert titles('macro = toc') == ['Deployment Guide']
+    assert titles('label not in (howto) and lastmodified > "2017/08/01"') == ['Release notes']
+    with pytest.raises(fakewiki.CqlError):
+        fakewiki.parse_cql('space = DOC and')
+
+
+def test_synthetic_bodies_are_parsable_and_tidyable():
+    wiki = fakewiki.FakeWiki().generate(pages=10, body_size=2000, foswiki=1.0, seed=42)
+    for page in current(wiki):
+        assert content._make_etree(page['body']) is not None  # pylint: disable=protected-access
+        if page['ancestors']:  # not a home page
+            assert content._apply_tidy_regex_rules(page['body']) != page['body']  # pylint: disable=protected-access
+
+
+def test_walk_and_getall_page_through_results(fake_server):
+    wiki = fake_server.wiki
+    cf = api.ConfluenceAPI(endpoint=fake_server.url)
+    home = wiki.spaces['SYN']['homepage']
+
+    walked = list(cf.walk('content/{}'.format(home), expand='version'))
+    assert len(walked) == len(wiki.pages)
+    assert max(depth for depth, _ in walked) == 3
+
+    found = list(cf.getall('content/search', cql='space = SYN and type = page', limit=1000))
+    assert len(found) == len(wiki.pages)
+    assert wiki.requests['GET', 'content/search'] > 1  # paginated, default limit is 25
+
+
+def test_update_conflict_is_retried(fake_server):
+    wiki = fake_server.wiki
+    cf = api.ConfluenceAPI(endpoint=fake_server.url)
+    page_id = sorted(wiki.pages)[1]
+    page = content.ConfluencePage(cf, 'content/{}'.format(page_id))
+    wiki.pages[page_id]['version'] += 1  # concurrent edit
+
+    results = bulk.BulkUpdater(cf)([(page, lambda body: body + '<p>Appended.</p>')])
+    assert [(i.status, i.version, i.attempts) for i in results] == [('updated', 3, 2)]
+    assert wiki.pages[page_id]['body'].endswith('<p>Appended.</p>')
+
+
+def test_throttled_requests_are_counted(fake_server):
+    cf = api.ConfluenceAPI(endpoint=fake_server.url)
+    fake_server.wiki.faults = fakewiki.Faults(throttle_rate=1.0, retry_after=7)
+    with pytest.raises(api.ERRORS) as excinfo:
+        cf.get('space/SYN')
+    assert excinfo.value.response.status_code == 429
+    assert excinfo.value.response.headers['Retry-After'] == '7'
+    assert metrics.REGISTRY.value('http_throttled_total', method='GET', endpoint='space/SYN') == 1
+
+
+def test_cli_tidy_and_rm_tree(fake_server):
+    wiki = fake_server.wiki
+    children = [str(i) for i in wiki.children[wiki.spaces['SYN']['homepage']]]
+    runner = CliRunner()
+
+    result = runner.invoke(main.cli, ['tidy'] + children)
+    assert result.exit_code == 0, result.output
+    assert all(wiki.pages[int(i)]['version'] == 2 for i in children)
+
+    result = runner.invoke(main.cli, ['tidy'] + children)
+    assert result.exit_code == 0, result.output
+    assert all(wiki.pages[int(i)]['version'] == 2 for i in children)
+
+    remaining = len(current(wiki))
+    result = runner.invoke(main.cli, ['rm', 'tree', '-y', children[0]])
+    assert result.exit_code == 0, result.output
+    assert len(current(wiki)) == remaining - len([i for i in wiki.pages.values()
+                                                  if int(children[0]) in i['ancestors']])
+    assert wiki.requests['DELETE', 'content/{id}'] == remaining - len(current(wiki))
+
+
+def test_cli_stats_tree_exports_all_pages(fake_server):
+    wiki = fake_server.wiki
+    home = wiki.spaces['SYN']['homepage']
+    result = CliRunner().invoke(main.cli, ['stats', '-f', 'json', 'tree', 'content/{}'.format(home)])
+    assert result.exit_code == 0, result.output
+    assert '"depth": 3' in result.output
+    assert result.output.count('"title"') == len(wiki.pages)
+    assert metrics.REGISTRY.value('records_exported_total') == len(wiki.pages)
+
+
+def test_replace_handles_overlapping_roots(fake_server, tmpdir):
+    wiki = fake_server.wiki
+    home = wiki.spaces['SYN']['homepage']
+    child = wiki.children[home][0]
+    cf = api.ConfluenceAPI(endpoint=fake_server.url)
+
+    page_ids = [i.page_id for i in replace.iter_pages(cf, cql='space = SYN', roots=['content/{}'.format(home),
+                                                                                   'content/{}'.format(child)])]
+    assert sorted(page_ids) == sorted(set(page_ids)) == sorted(str(i) for i in wiki.pages)
+
+    rules = tmpdir.join('rules.json')
+    rules.write(json.dumps([dict(pattern='</h2>', replace='</h2><!-- replaced -->')]))
+    result = CliRunner().invoke(main.cli, ['replace', '-j', '2', '-r', str(rules),
+                                           'content/{}'.format(home), 'content/{}'.format(child)])
+    assert result.exit_code == 0, result.output
+    assert 'failed (0 version conflicts)' in result.output
+    assert all(i['version'] == 2 for i in wiki.pages.values() if i['ancestors'])
+
+
+class FailAfter(fakewiki.Faults):
+
+    def __init__(self, requests):
+        super(FailAfter, self).__init__()
+        self.requests = requests
+
+    def failure(self):
+        self.requests -= 1
+        return 500 if self.requests < 0 else None
+
+
+def test_cli_stats_tree_resumes_interrupted_export(fake_server, tmpdir):
+    wiki = fake_server.wiki
+    root = 'content/{}'.format(wiki.spaces['SYN']['homepage'])
+    first, rest = tmpdir.join('first.ndjson'), tmpdir.join('rest.ndjson')
+    runner = CliRunner(mix_stderr=False)
+
+    wiki.faults = FailAfter(requests=6)
+    result = runner.invoke(main.cli, ['stats', '-o', str(first), 'tree', root])
+    assert result.exit_code == 0, result.output
+    exported = [json.loads(i)['id'] for i in first.readlines()]
+    assert 0 < len(exported) < len(wiki.pages)
+    job = result.stderr.split('--resume ')[1].split('"')[0]
+
+    wiki.faults = fakewiki.Faults()
+    result = runner.invoke(main.cli, ['stats', '-o', str(rest), 'tree', '--resume', job, root])
+    assert result.exit_code == 0, result.output
+    assert '--resume' not in result.stderr
+    resumed = [json.loads(i)['id'] for i in rest.readlines()]
+    assert sorted(exported + resumed) == sorted(str(i) for i in wiki.pages)
+
+    result = runner.invoke(main.cli, ['stats', '-f', 'json', 'tree', '--resume', job, root])
+    assert result.exit_code != 0
+    assert 'Cannot resume a "json" export' in result.stderr
+
+
+def test_relink_counts_links_once_after_conflicts(fake_server, monkeypatch):
+    wiki = fake_server.wiki
+    wiki.add_space('LNK')
+    target = wiki.add_page('LNK', 'Target')
+    link = '<a href="{}/pages/viewpage.action?pageId={}">x</a>'.format(fake_server.url, target['id'])
+    for i in range(3):
+        wiki.add_page('LNK', 'Linking {}'.format(i), '<p>{0} and {0}</p>'.format(link))
+
+    edited = set()
+    update = wiki._update  # pylint: disable=protected-access
+
+    def racing_update(page, data):
+        if page['id'] not in edited:  # a concurrent edit makes the first save fail
+            edited.add(page['id'])
+            page['version'] += 1
+            page['body'] += '<p>Edited.</p>'
+        return update(page, data)
+
+    monkeypatch.setattr(wiki, '_update', racing_update)
+    result = CliRunner().invoke(main.cli, ['relink', '-s', 'LNK'])
+    assert result.exit_code == 0, result.output
+    assert '6 links rewritten, 0 unresolved.' in result.output
+    assert len(edited) == 3 and wiki.requests['PUT', 'content/{id}'] == 6
+    assert all('<ri:page ri:content-title="Target"/>' in i['body'] and '<p>Edited.</p>' in i['body']
+               for i in wiki.pages.values() if i['title'].startswith('Linking'))
@@ -0,0 +1,98 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.batch`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import re
+
+import pytest
+import requests
+from addict import Dict as AttrDict
+
+from confluencer.api import tiny_id
+from confluencer.tools import batch
+
+
+class FakeAPI(object):
+
+    def __init__(self, page_ids, unindexed=()):
+        self.pages = {i: AttrDict(id=str(i), title='Page {}'.format(i)) for i in page_ids}
+        self.unindexed = set(unindexed)
+        self.searches = []
+        self.gets = []
+
+    def getall(self, path, cql, **_):
+        assert path == 'content/search'
+        self.searches.append(cql)
+        ids = [int(i) for i in re.findall(r'\d+', cql)]
+        return [self.pages[i] for i in ids if i in self.pages and i not in self.unindexed]
+
+    def get(self, ref, **_):
+        self.gets.append(ref)
+        if ref.endswith('/Page+7'):
+            return self.pages[7]
+        if ref.startswith('content/'):
+            page_id = int(ref.split('/')[1])
+            if page_id in self.pages:
+                return self.pages[page_id]
+            response = requests.Response()
+            response.status_code = 404
+            raise requests.HTTPError('404 Not Found', response=response)
+        raise ValueError('Bad URL ' + ref)
+
+
+@pytest.mark.parametrize('ref, page_id', [
+    ('12345', 12345),
+    ('https://confluence.example.com/pages/viewpage.action?pageId=12345', 12345),
+    ('https://confluence.example.com/rest/api/content/12345?expand=space', 12345),
+    ('https://confluence.example.com/x/' + tiny_id(12345), 12345),
+    ('https://confluence.example.com/display/TEST/Page', None),
+])
+def test_page_id_of_reference(ref, page_id):
+    assert batch.page_id_of(ref) == page_id
+
+
+def test_refs_come_from_args_and_stream():
+    stream = io.StringIO('\n# comment\n 3 \n4\n')
+
+    assert list(batch.iter_refs(('1', '2'), stream)) == ['1', '2', '3', '4']
+
+
+def test_pages_are_loaded_in_batches():
+    cf = FakeAPI(range(1, 10))
+    refs = [str(i) for i in range(1, 12)] + ['/display/TEST/Page+7', '/display/TEST/Nope']
+    results = list(batch.iter_pages(cf, refs, batch_size=5, workers=2))
+
+    assert len(cf.searches) == 3
+    assert sorted(ref for ref, data, _ in results if data) == sorted(refs[:9] + ['/display/TEST/Page+7'])
+    errors = {ref: error for ref, _, error in results if error}
+    assert sorted(errors) == ['/display/TEST/Nope', '10', '11']
+    assert isinstance(errors['10'], LookupError)
+
+
+def test_pages_missing_in_search_are_requested():
+    cf = FakeAPI(range(1, 6), unindexed=[4, 5])
+    refs = ['1', '4', '/pages/viewpage.action?pageId=4', '5', '6', '6']
+    results = batch.load_batch(cf, refs, expand='version')
+
+    assert [(ref, data and data.id) for ref, data, _ in results] == [
+        ('1', '1'), ('4', '4'), ('/pages/viewpage.action?pageId=4', '4'), ('5', '5'), ('6', None), ('6', None)]
+    assert isinstance(results[-1][2], LookupError)
+    assert cf.searches == ['id in (1, 4, 5, 6)']
+    assert cf.gets == ['content/4', 'content/5', 'content/6']
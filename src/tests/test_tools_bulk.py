@@ -0,0 +1,117 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.bulk`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import requests
+from munch import Munch as Bunch
+from addict import Dict as AttrDict
+
+from confluencer.tools import bulk
+
+
+class Response(object):
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('HTTP {}'.format(self.status_code), response=self)
+
+    def json(self):
+        return self.data
+
+
+class APIMock(object):
+    """Stores pages in memory, and simulates concurrent edits."""
+
+    def __init__(self, pages, concurrent_edits=0):
+        self.pages = pages
+        self.concurrent_edits = concurrent_edits
+        self.session = self
+
+    def get(self, url, **_dummy):
+        page = self.pages[url]
+        return AttrDict(id=url, title='Page ' + url, space=dict(key='TEST'), _links=dict(self=url),
+                        version=dict(number=page.version), body=dict(storage=dict(value=page.body)))
+
+    def put(self, url, json=None):
+        page = self.pages[url]
+        if self.concurrent_edits:
+            self.concurrent_edits -= 1
+            page.version += 1
+            page.body += '!'
+        if json['version']['number'] != page.version + 1:
+            return Response(bulk.HTTP_CONFLICT)
+        page.version += 1
+        page.body = json['body']['storage']['value']
+        return Response(200, dict(id=url, version=dict(number=page.version)))
+
+
+def test_bulk_update_applies_transform():
+    cf = APIMock({str(i): Bunch(version=1, body='foo') for i in range(10)})
+    updater = bulk.BulkUpdater(cf, workers=3)
+    results = updater((str(i), lambda body: body.upper()) for i in range(10))
+
+    assert len(results) == 10
+    assert all(i.status == 'updated' and i.version == 2 for i in results)
+    assert all(i.body == 'FOO' for i in cf.pages.values())
+    assert updater.stats.updated == 10
+
+
+def test_bulk_update_skips_unchanged_pages():
+    cf = APIMock({'1': Bunch(version=1, body='foo')})
+    results = bulk.BulkUpdater(cf)([('1', 'foo')])
+
+    assert results[0].status == 'unchanged'
+
+
+def test_bulk_update_retries_on_conflict():
+    cf = APIMock({'1': Bunch(version=1, body='foo')}, concurrent_edits=2)
+    updater = bulk.BulkUpdater(cf, retries=3)
+    results = updater([('1', lambda body: body.upper())])
+
+    assert results[0].status == 'updated'
+    assert results[0].attempts == 3
+    assert cf.pages['1'].body == 'FOO!!'
+    assert updater.stats.conflicts == 2
+
+
+def test_bulk_update_gives_up_after_retries():
+    cf = APIMock({'1': Bunch(version=1, body='foo')}, concurrent_edits=5)
+    updater = bulk.BulkUpdater(cf, retries=1)
+    results = updater([('1', lambda body: body.upper())])
+
+    assert results[0].status == 'failed'
+    assert updater.stats.failed == 1
+
+
+def test_purge_trash_reports_sizes():
+    class PurgeMock(object):
+        purged = []
+
+        def purge_page(self, page):
+            self.purged.append(page.id)
+
+    cf = PurgeMock()
+    pages = [AttrDict(id=str(i), body=dict(storage=dict(value='ä' * i))) for i in range(5)]
+    results = list(bulk.purge_trash(cf, pages, workers=2))
+
+    assert sorted(cf.purged) == [str(i) for i in range(5)]
+    assert sum(size for _, size, _ in results) == 2 * sum(range(5))
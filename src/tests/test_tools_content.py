@@ -24,6 +24,8 @@ from confluencer.tools import content
 
 
 class APIMock(object):
+    base_url = 'https://confluence.example.com'
+
     def get(self, _, **_dummy):
         return Bunch(body={'storage': Bunch(value='foo')})
 
@@ -31,3 +33,11 @@ class APIMock(object):
 def test_page_object_creation():
     page = content.ConfluencePage(APIMock(), '/SOME/URL')
     assert page.body == 'foo'
+
+
+def test_page_from_search_result_gets_base_url():
+    data = Bunch(id='42', status='current', title='Found', body={'storage': Bunch(value='<p>foo</p>')},
+                 _links=Bunch(tinyui='/x/KgAAAA'))
+    page = content.ConfluencePage(APIMock(), 'https://confluence.example.com/rest/api/content/42', data=data)
+
+    assert page.etree().get('href') == 'https://confluence.example.com/x/KgAAAA'
@@ -0,0 +1,115 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.export`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import json
+import zipfile
+import tempfile
+
+import pytest
+
+from confluencer.tools import export
+
+
+RECORDS = [
+    dict(depth=0, id='1', title='Rööt', version=dict(number=3, by=dict(username='jhe')),
+         metadata=dict(labels=dict(results=[dict(name='foo'), dict(name='bar')]))),
+    dict(depth=1, id='2', title='Child, "quoted"', version=dict(number=1)),
+]
+
+
+def export_records(serializer, records=RECORDS, **kwargs):
+    stream = io.BytesIO()
+    with export.writer(serializer, stream, **kwargs) as out:
+        for record in records:
+            out.write(record)
+    assert not stream.closed
+    return stream.getvalue().decode('utf-8')
+
+
+def test_flattened_lookup():
+    assert export.flatten(RECORDS[0], ('title', 'version.by.username', 'metadata.labels', 'nope.x')) \
+        == ['Rööt', 'jhe', 'foo,bar', None]
+
+
+@pytest.mark.parametrize('records', [RECORDS, []])
+def test_json_export_is_a_valid_list(records):
+    assert json.loads(export_records('json', records)) == records
+
+
+def test_ndjson_export_has_one_record_per_line():
+    lines = export_records('ndjson').splitlines()
+
+    assert [json.loads(i) for i in lines] == RECORDS
+
+
+def test_csv_export_is_flattened():
+    lines = export_records('csv', fields=('id', 'title', 'metadata.labels')).splitlines()
+
+    assert lines == ['id,title,metadata.labels', '1,Rööt,"foo,bar"', '2,"Child, ""quoted""",']
+
+
+def test_tsv_export_uses_tabs():
+    lines = export_records('tsv', fields=('id', 'version.number')).splitlines()
+
+    assert lines == ['id\tversion.number', '1\t3', '2\t1']
+
+
+@pytest.mark.parametrize('filename, serializer', [
+    ('export.csv', 'csv'),
+    ('export.JSONL', 'ndjson'),
+    ('export.unknown', 'json'),
+    (None, 'json'),
+])
+def test_serializer_from_file_extension(filename, serializer):
+    assert export.serializer_for(filename) == serializer
+
+
+def export_binary(serializer):
+    stream = io.BytesIO()
+    with export.writer(serializer, stream, fields=('id', 'title', 'version.number')) as out:
+        for record in RECORDS + [dict(id='3', title='Bad \x07 char')]:
+            out.write(record)
+    stream.seek(0)
+    return stream
+
+
+def test_ods_export_is_streamed_into_zip(tmpdir, monkeypatch):
+    from lxml import etree
+
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmpdir))
+    with zipfile.ZipFile(export_binary('ods')) as ods:
+        assert ods.namelist()[0] == 'mimetype'
+        assert ods.read('mimetype') == export.OdsWriter.MIMETYPE.encode('ascii')
+        content = etree.fromstring(ods.read('content.xml'))
+
+    rows = content.xpath('//table:table-row', namespaces=content.nsmap)
+    assert len(rows) == 4
+    assert [i.xpath('string()') for i in rows[1]] == ['1', 'Rööt', '3']
+    assert not tmpdir.listdir()  # spooled content is removed
+
+
+def test_xlsx_export():
+    openpyxl = pytest.importorskip('openpyxl')
+    rows = list(openpyxl.load_workbook(export_binary('xlsx')).active.values)
+
+    assert rows[0] == ('id', 'title', 'version.number')
+    assert rows[1] == ('1', 'Rööt', 3)
+    assert rows[3][1] == 'Bad � char'
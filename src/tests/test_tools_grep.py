@@ -0,0 +1,64 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.grep`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import re
+
+import pytest
+
+from confluencer.tools import grep
+
+
+PAGES = [
+    ('TEST', 'One', '<p>foo bar</p>\n<p>nothing</p>\n<p>bar foo foo</p>'),
+    ('TEST', 'Two', '<p>no match here</p>'),
+    ('DOCS', 'Three', '<ac:structured-macro ac:name="foo"/>'),
+]
+
+
+@pytest.mark.parametrize('pattern, flags, literal', [
+    (r'<ac:structured-macro ac:name="\w+"', 0, '<ac:structured-macro ac:name="'),
+    (r'abc?def', 0, 'def'),
+    (r'foo|barbaz', 0, None),
+    (r'(?i)foobar', 0, None),
+    (r'foobar', re.IGNORECASE, None),
+    (r'a.b', 0, None),
+])
+def test_required_literal(pattern, flags, literal):
+    assert grep.required_literal(pattern, flags) == literal
+
+
+def test_grep_reports_lines_once():
+    hits = list(grep.grep('foo', PAGES, workers=1))
+
+    assert hits == [('TEST', 'One', 1, '<p>foo bar</p>'), ('TEST', 'One', 3, '<p>bar foo foo</p>'),
+                    ('DOCS', 'Three', 1, '<ac:structured-macro ac:name="foo"/>')]
+
+
+def test_grep_only_matching():
+    hits = list(grep.grep('f(o)+', PAGES, only_matching=True, workers=1))
+
+    assert [i[2:] for i in hits] == [(1, 'foo'), (3, 'foo'), (3, 'foo'), (1, 'foo')]
+
+
+def test_grep_in_worker_processes():
+    hits = list(grep.grep(r'ac:name="(\w+)"', PAGES * 20, workers=2, batch_size=7))
+
+    assert len(hits) == 20
+    assert set(i[:2] for i in hits) == {('DOCS', 'Three')}
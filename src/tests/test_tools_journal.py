@@ -0,0 +1,93 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.journal`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import os
+
+import pytest
+from rudiments.reamed import click
+
+from confluencer.tools import journal
+
+
+def test_journal_resume_skips_recorded_pages(tmpdir):
+    directory = str(tmpdir)
+    with journal.Journal.start('tidy', ['12345'], directory=directory) as first:
+        first.record(1)
+        first.record('2')
+        first.record(2)
+    job = first.job
+
+    with journal.Journal.start('tidy', resume=job, directory=directory) as second:
+        assert second.resumed == 2
+        assert 1 in second and '2' in second and 3 not in second and None not in second
+        second.record(3)
+        second.finish()
+
+    infos = journal.list_journals(directory)
+    assert [(i.job, i.operation, i.args, i.pages, i.finished) for i in infos] == [(job, 'tidy', ['12345'], 3, True)]
+
+
+def test_journal_ignores_torn_writes(tmpdir):
+    with journal.Journal.start('rm tree', directory=str(tmpdir)) as jrnl:
+        jrnl.record(42)
+    with io.open(jrnl.path, 'a', encoding='utf-8') as handle:
+        handle.write('4711')  # crashed before the newline, but digits only
+        handle.write('\n12x')
+
+    header, done, finished = journal._read(jrnl.path)  # pylint: disable=protected-access
+    assert header['operation'] == 'rm tree'
+    assert done == {42, 4711}
+    assert not finished
+
+
+def test_journal_disabled_keeps_no_file(tmpdir):
+    with journal.Journal.start('tidy', directory=str(tmpdir), enabled=False) as jrnl:
+        jrnl.record(1)
+        assert 1 in jrnl
+        jrnl.finish()
+    assert jrnl.path is None
+    assert os.listdir(str(tmpdir)) == []
+
+
+@pytest.mark.parametrize('job', ['no-such-job', '../escape'])
+def test_journal_resume_unknown_job(tmpdir, job):
+    with pytest.raises(click.LoggedFailure):
+        journal.Journal.start('tidy', resume=job, directory=str(tmpdir))
+
+
+def test_journal_resume_other_operation(tmpdir):
+    with journal.Journal.start('tidy', directory=str(tmpdir)) as jrnl:
+        pass
+    with pytest.raises(click.LoggedFailure, match='is for "tidy"'):
+        journal.Journal.start('rm tree', resume=jrnl.job, directory=str(tmpdir))
+
+
+def test_journal_clean(tmpdir):
+    directory = str(tmpdir)
+    with journal.Journal.start('tidy', directory=directory) as done:
+        done.finish()
+    with journal.Journal.start('stats tree', directory=directory) as pending:
+        pending.record(1)
+
+    assert journal.clean(directory, older_than=3600) == []
+    assert [i.job for i in journal.clean(directory)] == [done.job]
+    assert [i.job for i in journal.clean(directory, unfinished=True)] == [pending.job]
+    assert journal.list_journals(directory) == []
@@ -0,0 +1,142 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.links`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import pytest
+
+from confluencer import api
+from confluencer.api import tiny_id
+from confluencer.tools import links
+
+
+BASE_URL = 'https://confluence.example.com/wiki'
+
+
+@pytest.fixture
+def rewriter():
+    index = links.PageIndex()
+    index.add('2393332', 'TEST', 'Sandbox')
+    index.add('123456789', 'DOCS', 'Fish & Chips')
+    return links.LinkRewriter(index, [BASE_URL, 'http://old.example.com'])
+
+
+@pytest.mark.parametrize('href, expected', [
+    ('/wiki/x/' + tiny_id(2393332), '<ri:page ri:content-title="Sandbox"/>'),
+    (BASE_URL + '/pages/viewpage.action?pageId=2393332', '<ri:page ri:content-title="Sandbox"/>'),
+    ('http://old.example.com/pages/viewpage.action?spaceKey=X&amp;pageId=123456789',
+     '<ri:page ri:space-key="DOCS" ri:content-title="Fish &amp; Chips"/>'),
+    ('/wiki/display/DOCS/Fish+%26+Chips', '<ri:page ri:space-key="DOCS" ri:content-title="Fish &amp; Chips"/>'),
+])
+def test_page_links_are_rewritten(rewriter, href, expected):
+    body = rewriter.rewrite('<p>See <a href="{}">this <b>page</b></a>.</p>'.format(href), own_space='TEST')
+
+    assert body == '<p>See <ac:link>{}<ac:link-body>this <b>page</b></ac:link-body></ac:link>.</p>'.format(expected)
+    assert rewriter.stats['rewritten'] == 1
+
+
+def test_anchor_is_kept(rewriter):
+    body = rewriter.rewrite('<a href="/wiki/x/{}#Sandbox-Intro">x</a>'.format(tiny_id(2393332)))
+
+    assert body.startswith('<ac:link ac:anchor="Sandbox-Intro"><ri:page ri:space-key="TEST"')
+
+
+@pytest.mark.parametrize('href', [
+    '/wiki/pages/viewpage.action?pageId=42',
+    '/wiki/display/TEST/Unknown',
+    'https://elsewhere.example.com/pages/viewpage.action?pageId=2393332',
+])
+def test_unknown_links_are_kept(rewriter, href):
+    body = '<a href="{}">x</a>'.format(href)
+
+    assert rewriter.rewrite(body) == body
+    assert rewriter.stats['rewritten'] == 0
+
+
+BODY = ('<p><ac:link><ri:page ri:content-title="Sandbox"/></ac:link>'
+        '<ac:link><ri:page ri:space-key="DOCS" ri:content-title="Gone"/>'
+        '<ac:plain-text-link-body><![CDATA[old]]></ac:plain-text-link-body></ac:link>'
+        '<ac:link><ri:page ri:space-key="OTHER" ri:content-title="Elsewhere"/></ac:link>'
+        '<a href="/wiki/x/{}">tiny</a><a href="/wiki/pages/viewpage.action?spaceKey=X&amp;pageId=42">id</a>'
+        '<a href="https://elsewhere.example.com/x/ZqQ8">external</a></p>').format(tiny_id(2393332))
+
+
+def test_links_are_extracted():
+    found = links.extract_links(BODY, [BASE_URL])
+
+    assert found == [
+        ('ri:page', (None, 'Sandbox'), 'Sandbox'),
+        ('ri:page', ('DOCS', 'Gone'), 'old'),
+        ('ri:page', ('OTHER', 'Elsewhere'), 'Elsewhere'),
+        ('tiny', tiny_id(2393332), 'tiny'),
+        ('id', 42, 'id'),
+    ]
+
+
+def test_broken_links_are_reported(rewriter):
+    pages = [('1', 'TEST', 'Links', BODY), ('2', 'TEST', 'Broken', '<p>&bogus;</p>'), ('3', 'TEST', 'Empty', '')]
+    result = dict(links.check_pages(rewriter.index, pages, [BASE_URL], workers=2))
+
+    assert result[('3', 'TEST', 'Empty')] == []
+    assert [i[3] for i in result[('1', 'TEST', 'Links')]] == ['no page "Gone" in space DOCS']
+    assert result[('2', 'TEST', 'Broken')][0][3].startswith('Cannot parse body')
+
+
+def test_links_missing_in_index_are_looked_up(rewriter):
+    looked_up = []
+
+    def lookup(page_id):
+        looked_up.append(page_id)
+        return ('OTHER', 'Elsewhere') if page_id == 7 else None
+
+    assert links.check_link(rewriter.index, 'id', 2393332, 'TEST', lookup=lookup) is None
+    assert links.check_link(rewriter.index, 'id', 7, 'TEST', lookup=lookup) is None
+    assert links.check_link(rewriter.index, 'tiny', tiny_id(7), 'TEST', lookup=lookup) is None
+    assert links.check_link(rewriter.index, 'id', 42, 'TEST', lookup=lookup) == 'page #42 not found'
+    assert links.check_link(rewriter.index, 'id', 42, 'TEST') is None  # unverified, not broken
+    assert looked_up == [7, 7, 42]
+
+
+def test_unknown_page_ids_are_resolved_in_batches(rewriter):
+    batches = []
+
+    def resolve(page_ids):
+        batches.append(sorted(page_ids))
+        return {i: ('OTHER', 'Elsewhere') if i == 7 else None for i in page_ids}
+
+    pages = [(str(i), 'TEST', 'Page {}'.format(i),
+              '<a href="/wiki/pages/viewpage.action?pageId={}">x</a>'
+              '<a href="/wiki/pages/viewpage.action?pageId=2393332">y</a>'.format(target))
+             for i, target in enumerate([7, 42, 7, 43, 44, 7], 1)]
+    result = dict(links.check_pages(rewriter.index, pages, [BASE_URL], workers=1, resolve=resolve, batch_size=2))
+
+    assert batches == [[7, 42], [43, 44]]
+    assert {page[0]: [i[3] for i in problems] for page, problems in result.items()} == {
+        '1': [], '2': ['page #42 not found'], '3': [], '4': ['page #43 not found'],
+        '5': ['page #44 not found'], '6': []}
+
+
+def test_page_resolver_searches_the_api(fake_server):
+    wiki = fake_server.wiki
+    resolve = links.page_resolver(api.ConfluenceAPI(endpoint=fake_server.url), batch_size=10)
+    page_ids = sorted(wiki.pages)[:15]
+
+    result = resolve(page_ids + [999])
+    assert result == dict([(i, ('SYN', wiki.pages[i]['title'])) for i in page_ids] + [(999, None)])
+    assert wiki.requests['GET', 'content/search'] == 2
+    assert wiki.requests['GET', 'content/{id}'] == 1  # only the ID the search did not find
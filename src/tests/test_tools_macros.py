@@ -0,0 +1,83 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.macros`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import pytest
+
+from confluencer.tools import macros
+
+
+BODY = '''
+<p>Intro&nbsp;text</p>
+<ac:structured-macro ac:name="panel" ac:schema-version="1">
+  <ac:parameter ac:name="title">Contents</ac:parameter>
+  <ac:rich-text-body>
+    <p><ac:structured-macro ac:name="toc" ac:schema-version="1"/></p>
+  </ac:rich-text-body>
+</ac:structured-macro>
+<ac:structured-macro ac:name="toc">
+  <ac:parameter ac:name="maxLevel">2</ac:parameter>
+</ac:structured-macro>
+'''
+
+
+@pytest.fixture
+def index(tmpdir):
+    idx = macros.MacroIndex(str(tmpdir.join('macros.db')))
+    yield idx
+    idx.close()
+
+
+def test_scan_macros():
+    counts, params = macros.scan_macros(BODY)
+
+    assert counts == dict(panel=1, toc=2)
+    assert params == {('panel', 'title'): 1, ('toc', 'maxLevel'): 1}
+
+
+def test_scan_malformed_body_falls_back_to_regex():
+    counts, params = macros.scan_macros('<p><ac:structured-macro ac:name="toc"></p>')
+
+    assert counts == dict(toc=1)
+    assert not params
+
+
+def test_index_usage_queries(index):
+    assert index.update(1, 'TEST', 'One', 1, BODY)
+    assert index.update(2, 'TEST', 'Two', 1, '<ac:structured-macro ac:name="toc"/>')
+    assert index.update(3, 'OTHER', 'Three', 1, '<p>no macros</p>')
+
+    assert [(i.id, i.count) for i in index.usage('toc')] == [('1', 2), ('2', 1)]
+    assert [i.id for i in index.usage('toc', top=1)] == ['1']
+    assert not list(index.usage('toc', spaces=['OTHER']))
+    assert [(i.parameter, i.count) for i in index.parameters('toc')] == [('maxLevel', 1)]
+    assert [(i.macro, i.pages, i.count) for i in index.totals()] == [('toc', 2, 3), ('panel', 1, 1)]
+
+
+def test_index_is_updated_by_version(index):
+    assert index.update(1, 'TEST', 'One', 2, BODY)
+    assert not index.update(1, 'TEST', 'One', 2, '')
+    assert not index.update(1, 'TEST', 'One', 1, '')
+    assert index.update(1, 'TEST', 'One', 3, '')
+
+    assert not list(index.usage('toc'))
+    assert index.versions('TEST') == {'1': 3}
+
+    index.remove(['1'])
+    assert not index.versions()
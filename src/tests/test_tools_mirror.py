@@ -0,0 +1,135 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.mirror`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import time
+
+import pytest
+import requests
+
+from confluencer import api
+from confluencer.tools import mirror
+
+
+BASE_URL = 'https://confluence.example.com'
+
+
+def make_page(page_id, title, parent=None, labels=()):
+    return dict(
+        id=str(page_id), type='page', title=title, space=dict(key='TEST'), version=dict(number=1),
+        ancestors=[dict(id=str(parent))] if parent else [],
+        metadata=dict(labels=dict(results=[dict(name=i) for i in labels])),
+        body=dict(storage=dict(value='<p>{} body</p>'.format(title))),
+    )
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.setenv('CONFLUENCE_MIRROR', str(tmpdir.join('mirror.db')))
+    result = mirror.SpaceMirror(base_url=BASE_URL)
+    for page in [make_page(1, 'Root'), make_page(2, 'Child B', 1, ['foo']), make_page(3, 'Child A', 1),
+                 make_page(4, 'Grandchild', 3, ['foo', 'bar'])]:
+        result.store(page)
+    yield result
+    result.close()
+
+
+def test_mirror_serves_pages(store):
+    page = store.get(BASE_URL + '/rest/api/content/4')
+
+    assert page.title == 'Grandchild'
+    assert page.body.storage.value == '<p>Grandchild body</p>'
+    assert page._links.self == BASE_URL + '/rest/api/content/4'
+
+
+def test_mirror_serves_children(store):
+    children = store.get(BASE_URL + '/rest/api/content/1/child/page')
+
+    assert [i.title for i in children.results] == ['Child A', 'Child B']
+
+
+@pytest.mark.parametrize('cql, expected', [
+    ('type=page AND space="TEST" AND title="Root"', ['1']),
+    ('title ~ "child"', ['3', '2', '4']),
+    ('label = "foo"', ['2', '4']),
+    ('id in (1, 4)', ['4', '1']),
+    ('type=blogpost', []),
+    ('(title = "Root" OR title = "Grandchild") AND type = page', ['4', '1']),
+    ('NOT title ~ "child"', ['1']),
+    ('label not in (foo) AND NOT (id = 1 OR parent = 1)', []),
+    ('type=page AND (id = 3 OR ancestor = 3)', ['3', '4']),
+    ('ancestor = 1 AND label = bar', ['4']),
+    ('parent != 1', ['4', '1']),
+])
+def test_mirror_search(store, cql, expected):
+    assert [i.id for i in store.get(BASE_URL + '/rest/api/content/search', cql=cql).results] == expected
+
+
+def test_mirror_rejects_unknown_requests(store):
+    with pytest.raises(mirror.OfflineError):
+        store.get(BASE_URL + '/rest/api/content/search', cql='creator = "jhe"')
+    with pytest.raises(mirror.OfflineError):
+        store.get(BASE_URL + '/rest/api/content/search', cql='space = TEST OR text ~ "body"')
+    with pytest.raises(mirror.OfflineError):
+        store.get(BASE_URL + '/rest/api/content/search', cql='space = TEST ORDER BY title')
+    with pytest.raises(mirror.OfflineError):
+        store.get(BASE_URL + '/rest/api/content/99')
+
+
+def test_offline_api_walks_mirror(store):  # pylint: disable=unused-argument
+    cf = api.ConfluenceAPI(endpoint=BASE_URL, offline=True)
+    titles = [page.title for _, page in cf.walk(BASE_URL + '/pages/viewpage.action?pageId=1')]
+
+    assert sorted(titles) == ['Child A', 'Child B', 'Grandchild', 'Root']
+    with pytest.raises(requests.RequestException):
+        cf.session.get(BASE_URL + '/rest/api/space')
+
+
+def test_mirror_scans_packed_bodies(store):
+    store.remove(['2'])
+    bodies = sorted(store.iter_bodies('TEST'))
+
+    assert [i[0] for i in bodies] == ['1', '3', '4']
+    assert bodies[0][1:] == ('TEST', 'Root', 1, '<p>Root body</p>')
+
+
+def test_mirror_sync_compacts_outdated_bodies(fake_server, tmpdir, monkeypatch):
+    monkeypatch.setattr(mirror.SpaceMirror, 'COMPACT_MIN_BYTES', 0)
+    wiki = fake_server.wiki
+    cf = api.ConfluenceAPI(endpoint=fake_server.url)
+    store = mirror.SpaceMirror(path=str(tmpdir.join('synced.db')), base_url=fake_server.url)
+    try:
+        assert store.sync(cf, 'SYN') == (len(wiki.pages), 0)
+        assert store.bodies.garbage() == 0
+
+        for _ in range(2):
+            for page in wiki.pages.values():
+                page['version'] += 1
+                page['body'] += '<p>Edited.</p>'
+                page['when'] = time.time()
+            assert store.sync(cf, 'SYN') == (len(wiki.pages), 0)
+        assert store.bodies.garbage() == 0  # more than half of the pack was outdated
+        assert all(i[4].endswith('<p>Edited.</p>') for i in store.iter_bodies('SYN'))
+
+        page = next(iter(wiki.pages.values()))
+        page['version'], page['when'] = page['version'] + 1, time.time()
+        store.sync(cf, 'SYN')
+        assert 0 < store.bodies.garbage() < store.COMPACT_RATIO * store.bodies.size()
+    finally:
+        store.close()
@@ -0,0 +1,70 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.packstore`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import pytest
+
+from confluencer.tools.packstore import PackedBodyStore
+
+
+BIG_BODY = '<p>Ünïcödé</p>' * 100
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('bodies'))
+
+
+def test_bodies_roundtrip(path):
+    with PackedBodyStore(path) as store:
+        store.put(1, 1, '<p>small</p>')
+        store.put(2, 7, BIG_BODY)
+
+        assert store.get(1) == '<p>small</p>'
+        assert store.get('2') == BIG_BODY
+        assert store.get(3) is None
+        assert store.version(2) == 7
+        assert len(store) == 2
+
+
+def test_latest_version_wins_after_reopen(path):
+    with PackedBodyStore(path) as store:
+        store.put(1, 1, 'old')
+        store.put(2, 1, 'gone')
+        store.put(1, 2, 'new')
+        store.delete(2)
+        assert store.garbage() > 0
+
+    with PackedBodyStore(path) as store:
+        assert store.get(1) == 'new'
+        assert store.version(1) == 2
+        assert 2 not in store
+        assert list(store.iter_bodies()) == [(1, 2, 'new')]
+
+
+def test_compaction_drops_garbage(path):
+    with PackedBodyStore(path) as store:
+        for version in range(1, 6):
+            store.put(1, version, BIG_BODY + str(version))
+        store.put(2, 1, 'other')
+        store.compact()
+
+        assert store.garbage() == 0
+        assert store.get(1) == BIG_BODY + '5'
+        assert sorted(i[0] for i in store.iter_bodies()) == [1, 2]
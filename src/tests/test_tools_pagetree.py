@@ -0,0 +1,104 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.pagetree`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import threading
+
+import pytest
+from addict import Dict as AttrDict
+
+from confluencer.tools import pagetree
+
+
+TREE = {
+    'Root': ['A', 'B'],
+    'A': ['A1', 'A2'],
+    'A2': ['A2x'],
+    'B': ['B1 Keep', 'B2'],
+}
+
+
+class APIMock(object):
+    def __init__(self):
+        self.deleted = []
+        self.lock = threading.Lock()
+
+    def page(self, title):
+        return AttrDict(id=title, title=title, _links={'self': title})
+
+    def get(self, url, **_dummy):
+        return self.page(url)
+
+    def getall(self, url, **_dummy):
+        return [self.page(i) for i in TREE.get(url.split('/')[0], [])]
+
+    def delete_page(self, page):
+        with self.lock:
+            assert not any(i in self.deleted for i in [page.id]), "deleted twice"
+            assert all(i in self.deleted for i in TREE.get(page.id, [])), "children deleted first"
+            self.deleted.append(page.id)
+
+
+@pytest.fixture
+def nodes():
+    return pagetree.load_subtree(APIMock(), 'Root')
+
+
+def titles(nodes):
+    return sorted(i.title for i in nodes)
+
+
+def test_subtree_is_loaded_completely(nodes):
+    assert len(nodes) == 8
+    assert nodes[0].title == 'Root'
+    assert [i.depth for i in nodes if i.title == 'A2x'] == [3]
+
+
+def test_select_without_root(nodes):
+    assert titles(pagetree.select_nodes(nodes)) == titles(nodes[1:])
+
+
+def test_select_with_root_is_post_order(nodes):
+    selected = pagetree.select_nodes(nodes, with_root=True)
+    order = [i.title for i in selected]
+
+    assert order[-1] == 'Root'
+    assert order.index('A2x') < order.index('A2') < order.index('A')
+
+
+def test_select_with_filters(nodes):
+    assert titles(pagetree.select_nodes(nodes, include=['a*'])) == ['A', 'A1', 'A2', 'A2x']
+    assert titles(pagetree.select_nodes(nodes, exclude=['* keep'])) == ['A', 'A1', 'A2', 'A2x', 'B2']
+
+
+def test_deleter_removes_leaves_first(nodes):
+    cf = APIMock()
+    selected = pagetree.select_nodes(nodes, with_root=True)
+    deleted = pagetree.SubtreeDeleter(cf, workers=3).run(selected)
+
+    assert len(deleted) == len(cf.deleted) == 8
+    assert cf.deleted[-1] == 'Root'
+
+
+def test_deleter_dry_run(nodes):
+    cf = APIMock()
+    deleted = pagetree.SubtreeDeleter(cf, dry_run=True).run(pagetree.select_nodes(nodes))
+
+    assert len(deleted) == 7
+    assert not cf.deleted
@@ -0,0 +1,76 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.tools.replace`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import json
+
+import pytest
+from munch import Munch as Bunch
+from rudiments.reamed import click
+
+from confluencer.tools import bulk, replace
+
+
+RULES = [
+    dict(name='Jira host', pattern=r'https?://jira\.old\.example\.com/', replace='https://jira.example.com/'),
+    dict(pattern=r'<b>(.*?)</b>', replace=r'<strong>\1</strong>', flags=['dotall']),
+]
+
+
+@pytest.fixture
+def rules(tmpdir):
+    path = tmpdir.join('rules.json')
+    path.write(json.dumps(RULES))
+    return replace.load_rules(str(path))
+
+
+def test_rules_are_applied_in_order(rules):
+    body = '<p><b>See\nhttp://jira.old.example.com/browse/X-1</b></p>'
+
+    assert replace.apply_rules(rules, body) == '<p><strong>See\nhttps://jira.example.com/browse/X-1</strong></p>'
+    assert rules[1][0] == 'Rule #2'
+
+
+@pytest.mark.parametrize('data', [
+    dict(pattern='x'),
+    [dict(pattern='x', replace='y', flags=['UNKNOWN'])],
+    [dict(pattern='(', replace='y')],
+])
+def test_bad_rules_are_rejected(tmpdir, data):
+    path = tmpdir.join('rules.json')
+    path.write(json.dumps(data))
+
+    with pytest.raises(click.LoggedFailure):
+        replace.load_rules(str(path))
+
+
+def test_only_changed_pages_are_reported(rules):
+    pages = [Bunch(page_id=str(i), title='Page {}'.format(i), body='<b>{}</b>'.format(i) if i % 2 else '<p/>')
+             for i in range(10)]
+    changed = sorted(replace.iter_changes(rules, pages, workers=2), key=lambda i: i[0].page_id)
+
+    assert [(page.page_id, body) for page, body in changed] == [
+        (str(i), '<strong>{}</strong>'.format(i)) for i in range(1, 10, 2)]
+
+
+def test_transform_reapplies_rules_to_newer_body(rules):
+    transform = bulk.precomputed(lambda body: replace.apply_rules(rules, body), '<b>old</b>', '<strong>old</strong>')
+
+    assert transform('<b>old</b>') == '<strong>old</strong>'
+    assert transform('<b>new</b>') == '<strong>new</strong>'
@@ -0,0 +1,153 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.util.metrics`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import json
+import datetime
+
+import pytest
+import requests
+
+from confluencer.util import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, 'REGISTRY', registry)
+    return registry
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://wiki.example.com/rest/api/content/search?cql=x', 'content/search'),
+    ('https://wiki.example.com/wiki/rest/api/content/12345/child/page', 'content/{id}/child/page'),
+    ('https://wiki.example.com/x/AbC', 'x/AbC'),
+    ('https://wiki.example.com/', '/'),
+])
+def test_endpoint_of(url, expected):
+    assert metrics.endpoint_of(url) == expected
+
+
+def test_histogram_quantiles():
+    histogram = metrics.Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) == 2.0
+    assert metrics.Histogram().quantile(0.5) is None
+
+
+def test_registry_counters_and_snapshot(registry):
+    registry.inc('pages_total', status='updated')
+    registry.inc('pages_total', 2, status='updated')
+    registry.inc('pages_total', status='failed')
+    with registry.timer('work_seconds'):
+        pass
+
+    assert registry.value('pages_total', status='updated') == 3
+    assert registry.total('pages_total') == 4
+    snapshot = json.loads(json.dumps(registry.snapshot()))
+    assert [i['name'] for i in snapshot['counters']] == ['pages_total', 'pages_total']
+    assert snapshot['histograms'][0]['count'] == 1
+
+    registry.reset()
+    assert registry.total('pages_total') == 0
+
+
+def test_response_hook_and_report(registry):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'{"results": []}'  # pylint: disable=protected-access
+    response.elapsed = datetime.timedelta(milliseconds=40)
+    response.request = requests.Request('GET', 'https://wiki.example.com/rest/api/content/42').prepare()
+    metrics.response_hook(response)
+    response.from_cache = True
+    metrics.response_hook(response)  # ignored
+    registry.inc('cache_requests_total', result='hit')
+    registry.inc('cache_requests_total', result='miss')
+
+    labels = dict(method='GET', endpoint='content/{id}')
+    assert registry.value('http_requests_total', status='200', **labels) == 1
+    assert registry.value('http_response_bytes_total', **labels) == 15
+
+    report = metrics.format_report()
+    assert report[1].startswith('GET content/{id}')
+    assert '1 HTTP requests (15 B received)' in report[-2]
+    assert report[-1] == 'Cache: 1 of 2 lookups were hits (50%).'
+
+
+def test_format_prometheus(registry):
+    registry.inc('page_updates_total', 3, status='updated')
+    registry.set('run_success', 1)
+    registry.observe('http_request_seconds', 0.2, method='GET')
+    registry.observe('http_request_seconds', 50.0, method='GET')
+
+    text = metrics.format_prometheus(labels=dict(command='ti"dy'))
+    lines = text.splitlines()
+    assert '# TYPE confluencer_page_updates_total counter' in lines
+    assert 'confluencer_page_updates_total{command="ti\\"dy",status="updated"} 3' in lines
+    assert 'confluencer_run_success{command="ti\\"dy"} 1' in lines
+    assert 'confluencer_http_request_seconds_bucket{command="ti\\"dy",le="0.1",method="GET"} 0' in lines
+    assert 'confluencer_http_request_seconds_bucket{command="ti\\"dy",le="0.25",method="GET"} 1' in lines
+    assert 'confluencer_http_request_seconds_bucket{command="ti\\"dy",le="+Inf",method="GET"} 2' in lines
+    assert 'confluencer_http_request_seconds_count{command="ti\\"dy",method="GET"} 2' in lines
+    assert text.endswith('\n')
+
+
+def test_write_textfile(tmpdir):
+    path = str(tmpdir.join('confluencer.prom'))
+    metrics.write_textfile(path, 'foo 1\n')
+    assert tmpdir.join('confluencer.prom').read() == 'foo 1\n'
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_push_to_gateway():
+    import threading
+    try:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+    except ImportError:  # Python 2
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler  # pylint: disable=import-error
+
+    pushed = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_PUT(self):  # pylint: disable=invalid-name
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            pushed.append((self.path, self.headers['Content-Type'], body))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *_):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.handle_request)
+    thread.start()
+    try:
+        metrics.push('http://127.0.0.1:{}/'.format(server.server_port), 'foo 1\n',
+                     job='confluencer', grouping=dict(command='rm tree'))
+    finally:
+        thread.join(5)
+        server.server_close()
+
+    assert pushed == [('/metrics/job/confluencer/command/rm%20tree', 'text/plain; version=0.0.4; charset=utf-8',
+                       b'foo 1\n')]
@@ -0,0 +1,116 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.util.profiling`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import os
+import json
+import time
+import pstats
+import threading
+
+import pytest
+
+from confluencer.util import profiling
+
+
+def busy_work(seconds=0.1):
+    until = time.time() + seconds
+    while time.time() < until:
+        sum(range(100))
+
+
+def idle(event):
+    event.wait()
+
+
+def run_threaded():
+    worker = threading.Thread(target=busy_work, name='worker')
+    worker.start()
+    busy_work()
+    worker.join()
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ('/usr/lib/python3/site-packages/confluencer/tools/content.py', 'confluencer'),
+    ('/usr/lib/python3/site-packages/lxml/html/__init__.py', 'lxml'),
+    ('/usr/lib/python3/site-packages/urllib3/response.py', 'requests'),
+    ('/usr/lib/python3.11/http/client.py', 'requests'),
+    ('/usr/lib/python3.11/json/decoder.py', 'other'),
+])
+def test_category_of(filename, expected):
+    assert profiling.category_of(filename.replace('/', os.sep)) == expected
+
+
+def test_deterministic_profiler_covers_threads(tmpdir):
+    profiler = profiling.DeterministicProfiler()
+    profiler.start()
+    run_threaded()
+    stats = profiler.stop()
+
+    assert len(profiler.profiles) == 2 and profiler.skipped == 0
+    calls = [key for key in stats.stats if key[2] == 'busy_work']
+    assert calls and stats.stats[calls[0]][1] == 2  # called once per thread
+
+    path = str(tmpdir.join('run.pstats'))
+    profiler.save(stats, path)
+    assert pstats.Stats(path).total_calls == stats.total_calls
+
+    report = profiling.format_hot_functions(profiler.hot_functions(stats))
+    assert report[0].startswith('Own time by category: ')
+    assert any('busy_work (test_util_profiling.py:' in i for i in report)
+
+
+def test_deterministic_profiler_leaves_out_running_threads():
+    release = threading.Event()
+    profiler = profiling.DeterministicProfiler(timeout=0.1)
+    profiler.start()
+    worker = threading.Thread(target=idle, args=(release,), name='idle')
+    worker.start()
+    busy_work(0.01)
+    try:
+        stats = profiler.stop()
+    finally:
+        release.set()
+        worker.join()
+
+    assert len(profiler.profiles) == 2 and profiler.skipped == 1
+    assert [key for key in stats.stats if key[2] == 'busy_work']
+    assert not [key for key in stats.stats if key[2] == 'idle']
+
+
+def test_sampling_profiler_writes_speedscope(tmpdir):
+    profiler = profiling.SamplingProfiler(interval=0.001)
+    profiler.start()
+    run_threaded()
+    stats = profiler.stop()
+
+    path = str(tmpdir.join('run.speedscope.json'))
+    profiler.save(stats, path)
+    with open(path) as handle:
+        data = json.load(handle)
+
+    assert data['$schema'] == profiling.SPEEDSCOPE_SCHEMA
+    assert 'worker' in [i['name'] for i in data['profiles']]
+    frames = data['shared']['frames']
+    for profile in data['profiles']:
+        assert profile['type'] == 'sampled'
+        assert len(profile['samples']) == len(profile['weights'])
+        assert all(0 <= i < len(frames) for stack in profile['samples'] for i in stack)
+    assert 'busy_work' in [i['name'] for i in frames]
+    assert any(label.startswith('busy_work') for _, label, _, _ in profiler.hot_functions(stats))
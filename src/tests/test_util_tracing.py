@@ -0,0 +1,180 @@
+# *- coding: utf-8 -*-
+# pylint: disable=wildcard-import, missing-docstring, no-self-use, bad-continuation
+# pylint: disable=invalid-name, redefined-outer-name, too-few-public-methods
+""" Test :py:mod:`confluencer.util.tracing`.
+"""
+# Copyright ©  2015 1&1 Group <git@1and1.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, unicode_literals, print_function
+
+import io
+import json
+import threading
+
+import pytest
+
+from confluencer import api
+from confluencer.util import tracing, iter_concurrently
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:  # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler  # pylint: disable=import-error
+
+
+class Collector(object):
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def shutdown(self):
+        pass
+
+    def by_name(self, name):
+        return [i for i in self.spans if i.name == name]
+
+
+@pytest.fixture
+def collector():
+    collector = Collector()
+    tracing.TRACER.exporters.append(collector)
+    yield collector
+    tracing.TRACER.shutdown()
+
+
+@pytest.fixture
+def http_server():
+    """A local HTTP server answering with ``server.reply``, and recording ``server.requests``."""
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            server.requests.append((self.command, self.path, self.rfile.read(length)))
+            status, body = server.reply
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = _handle
+
+        def log_message(self, *_):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    server.requests, server.reply = [], (200, b'{}')
+    server.url = 'http://127.0.0.1:{}'.format(server.server_port)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_spans_are_disabled_without_exporters():
+    assert not tracing.TRACER.enabled
+    with tracing.span('nothing') as span:
+        span.set('key', 'value')
+    assert span is tracing.NULL_SPAN
+    assert tracing.TRACER.current() is None
+
+
+def test_spans_nest_and_record_errors(collector):
+    with tracing.span('outer', answer=42) as outer:
+        with tracing.span('inner'):
+            assert tracing.TRACER.current().name == 'inner'
+        with pytest.raises(ValueError):
+            with tracing.span('failing'):
+                raise ValueError('boom')
+    inner, failing, _ = collector.spans
+
+    assert [i.name for i in collector.spans] == ['inner', 'failing', 'outer']
+    assert inner.parent_id == outer.span_id and outer.parent_id is None
+    assert inner.trace_id == outer.trace_id == failing.trace_id
+    assert failing.error == 'ValueError: boom'
+    assert outer.as_dict()['attributes'] == dict(answer=42)
+    assert tracing.TRACER.current() is None
+
+
+def test_spans_in_worker_threads_have_parent(collector):
+    @tracing.traced('work')
+    def work(item):
+        return item * 2
+
+    with tracing.span('batch') as batch:
+        results = sorted(result for _, result, _ in iter_concurrently(work, range(5), workers=3))
+
+    assert results == [0, 2, 4, 6, 8]
+    work_spans = collector.by_name('work')
+    assert len(work_spans) == 5
+    assert all(i.parent_id == batch.span_id for i in work_spans)
+    assert any(i.thread != batch.thread for i in work_spans)
+
+
+def test_json_lines_exporter():
+    stream = io.StringIO()
+    tracing.TRACER.exporters.append(tracing.JsonLinesExporter(stream))
+    try:
+        with tracing.span('step', page_id=1):
+            pass
+    finally:
+        tracing.TRACER.shutdown()
+
+    record = json.loads(stream.getvalue())
+    assert record['name'] == 'step'
+    assert record['attributes'] == dict(page_id=1)
+    assert record['duration_ms'] >= 0
+
+
+def test_otlp_exporter_posts_batches(http_server):
+    exporter = tracing.OtlpExporter(http_server.url + '/v1/traces', batch_size=2)
+    tracing.TRACER.exporters.append(exporter)
+    try:
+        with tracing.span('parent', count=3, ratio=0.5, flag=True):
+            with tracing.span('child', kind='client'):
+                pass
+        assert len(http_server.requests) == 1  # one full batch
+        with tracing.span('last'):
+            pass
+    finally:
+        tracing.TRACER.shutdown()
+
+    assert [i[:2] for i in http_server.requests] == [('POST', '/v1/traces')] * 2
+    payload = json.loads(http_server.requests[0][2].decode('utf-8'))
+    resource_spans = payload['resourceSpans'][0]
+    assert resource_spans['resource']['attributes'][0]['value'] == dict(stringValue='confluencer')
+    child, parent = resource_spans['scopeSpans'][0]['spans']
+    assert child['parentSpanId'] == parent['spanId'] and 'parentSpanId' not in parent
+    assert child['kind'] == tracing.OTLP_KIND_CLIENT
+    assert parent['status'] == dict(code=tracing.OTLP_STATUS_OK)
+    assert dict(key='count', value=dict(intValue='3')) in parent['attributes']
+    assert int(parent['endTimeUnixNano']) >= int(parent['startTimeUnixNano'])
+
+
+def test_api_calls_are_traced(collector, http_server):
+    http_server.reply = (200, b'{"id": "1", "title": "Home"}')
+    cf = api.ConfluenceAPI(endpoint=http_server.url)
+    with tracing.span('test'):
+        assert cf.get('content/1').title == 'Home'
+
+    get, = collector.by_name('api.get')
+    request, = collector.by_name('http.request')
+    decode, = collector.by_name('api.json_decode')
+    assert request.parent_id == decode.parent_id == get.span_id
+    assert request.attributes == dict(method='GET', endpoint='content/{id}', status=200)
+    assert collector.by_name('api.url')[0].parent_id == get.span_id
@@ -75,3 +75,27 @@ def ci(ctx):
     ctx.run("invoke --echo --pty clean --all build --docs check --reports{}".format(' '.join(opts)))
 
 namespace.add_task(ci)
+
+
+@task(help={
+    'compare': "Compare against the last saved run (e.g. of the previous commit)",
+    'fail': "Fail on regressions beyond a threshold, e.g. 'mean:10%' (implies --compare)",
+    'keyword': "Only run benchmarks matching the given expression",
+    'save': "Save the results below '.benchmarks', tagged with the current commit",
+})
+def bench(ctx, compare=False, fail='', keyword='', save=True):
+    """Run the benchmarks in 'src/tests/benchmarks'."""
+    opts = ['-o', 'python_files=bench_*.py', '--benchmark-sort=name',
+            '--benchmark-columns=min,median,mean,stddev,rounds']
+    if save:
+        opts.append('--benchmark-autosave')
+    if compare or fail:
+        opts.append('--benchmark-compare')
+    if fail:
+        opts.append('--benchmark-compare-fail={}'.format(fail))
+    if keyword:
+        opts.extend(['-k', '"{}"'.format(keyword)])
+
+    ctx.run("python -m pytest {} src/tests/benchmarks".format(' '.join(opts)), pty=True)
+
+namespace.add_task(bench)